@@ -8,6 +8,10 @@ from __future__ import unicode_literals
 import logging
 import os
 import sys
+import time
+
+# Measures time to first frame from here
+STARTED = time.time()
 
 try:
     from gi.repository import Gtk
@@ -35,6 +39,23 @@ KALITE_HOME = os.environ['KALITE_HOME']
 if not os.path.isdir(KALITE_HOME):
     os.mkdir(KALITE_HOME)
 
+# --trace FILE writes timings as Chrome trace events to FILE on exit,
+# --debug writes them to KALITE_HOME
+TRACE_FILE = None
+for i, arg in enumerate(sys.argv):
+    if arg.startswith('--trace='):
+        TRACE_FILE = arg.split('=', 1)[1]
+    elif arg == '--trace' and i + 1 < len(sys.argv):
+        TRACE_FILE = sys.argv[i + 1]
+if TRACE_FILE is None and '--debug' in sys.argv:
+    TRACE_FILE = os.path.join(KALITE_HOME, 'kalite_gtk_trace.json')
+
+if TRACE_FILE:
+    import atexit
+    from kalite_gtk import trace
+    trace.enable()
+    atexit.register(trace.write_chrome_trace, TRACE_FILE)
+
 # create file handler which logs even debug messages
 fh = logging.FileHandler(
     os.path.expanduser(
@@ -66,7 +87,7 @@ from kalite_gtk.mainwindow import MainWindow
 def main(args=None):
     import signal
     signal.signal(signal.SIGINT, signal.SIG_DFL)
-    __ = MainWindow()
+    __ = MainWindow(started=STARTED)
     Gtk.main()
 
 if __name__ == "__main__":
@@ -0,0 +1,327 @@
+"""
+Privileged helper for the operations that need root
+
+The helper is started once per session through cli.sudo, so one privilege
+prompt covers every privileged operation after it, and it lives for as
+long as the pipe to the GUI is open. Each request is a batch of
+operations, which are vetted before any of them runs:
+
+    {"operations": [
+        {"op": "write_server_options", "content": "--port=8008"},
+        {"op": "write_home", "home": "/var/lib/ka-lite/.kalite"},
+        {"op": "install_service"},
+        {"op": "remove_service"},
+        {"op": "kalite", "command": "restart", "args": ["--port=8008"],
+         "user": "kalite", "home": "/var/lib/ka-lite/.kalite",
+         "kalite": "/usr/bin/kalite"}
+    ]}
+
+Messages are JSON objects, one per line, on the helper's stdin and stdout.
+The answer to a batch is
+
+    {"results": [{"op": ..., "stdout": ..., "stderr": ..., "returncode": n}]}
+
+The batch stops at the first operation that fails, so there are fewer
+results than operations, unless the request has "keep_going": true. A
+batch that doesn't pass vetting is answered with {"error": message} and
+nothing is run.
+
+Run the helper with:
+
+    python -m kalite_gtk.broker
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import pwd
+import re
+import subprocess
+import sys
+import threading
+
+from . import cli
+
+logger = logging.getLogger(__name__)
+
+# Commands of kalite that may be run as another user
+KALITE_COMMANDS = ('start', 'stop', 'restart')
+
+SERVICE_COMMANDS = {
+    'install_service': ['update-rc.d', 'ka-lite', 'defaults'],
+    'remove_service': ['update-rc.d', '-f', 'ka-lite', 'remove'],
+}
+
+OPERATIONS = ('write_server_options', 'write_home', 'kalite') + tuple(SERVICE_COMMANDS)
+
+# Options of kalite, as written to server_options and passed to commands.
+# Anything the init script's shell would interpret is refused.
+OPTION = re.compile(r'^--[a-z][a-z0-9_-]*(=[\w./:@,+-]*)?$')
+
+# Longest request line read, a batch is a few hundred bytes
+MAX_REQUEST = 64 * 1024
+
+# Variables kept from the helper's environment for kalite
+KEPT_ENVIRONMENT = ('PATH', 'LANG', 'LC_ALL')
+
+
+class VettingError(ValueError):
+    pass
+
+
+def vet_path(path):
+    if not isinstance(path, type('')) or not os.path.isabs(path) or '\n' in path or '\0' in path:
+        raise VettingError("Not an absolute path: {!r}".format(path))
+    return os.path.normpath(path)
+
+
+def vet_options(options):
+    if not isinstance(options, list):
+        raise VettingError("Options must be a list")
+    for option in options:
+        if not isinstance(option, type('')) or not OPTION.match(option):
+            raise VettingError("Invalid option: {!r}".format(option))
+    return options
+
+
+def vet(operation):
+    """
+    Returns the operation with only the fields it needs, raises
+    VettingError if it's not allowed
+    """
+    op = operation.get('op')
+    if op not in OPERATIONS:
+        raise VettingError("Unknown operation: {!r}".format(op))
+    if op == 'write_server_options':
+        content = operation.get('content')
+        if not isinstance(content, type('')):
+            raise VettingError("No server options")
+        vet_options(content.split())
+        return {'op': op, 'content': ' '.join(content.split())}
+    if op == 'write_home':
+        return {'op': op, 'home': vet_path(operation.get('home'))}
+    if op in SERVICE_COMMANDS:
+        return {'op': op}
+
+    command = operation.get('command')
+    if command not in KALITE_COMMANDS:
+        raise VettingError("Unknown kalite command: {!r}".format(command))
+    try:
+        user = pwd.getpwnam(operation.get('user'))
+    except (KeyError, TypeError):
+        raise VettingError("Unknown user: {!r}".format(operation.get('user')))
+    if user.pw_uid == 0:
+        raise VettingError("Refusing to run kalite as root")
+    kalite = vet_path(operation.get('kalite'))
+    if not os.path.isfile(kalite) or not os.access(kalite, os.X_OK):
+        raise VettingError("Not an executable: {}".format(kalite))
+    return {
+        'op': op,
+        'command': command,
+        'args': vet_options(operation.get('args', [])),
+        'user': user.pw_name,
+        'home': vet_path(operation.get('home')),
+        'kalite': kalite,
+    }
+
+
+def run(cmd, **kwargs):
+    try:
+        p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, close_fds=True, **kwargs)
+    except OSError as e:
+        return '', "Could not run {}: {}\n".format(cmd[0], e), 127
+    stdout, stderr = p.communicate()
+    return stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace'), p.returncode
+
+
+def run_as(user, cmd, home):
+    """Runs cmd as user with KALITE_HOME=home"""
+    user = pwd.getpwnam(user)
+    env = dict((name, os.environ[name]) for name in KEPT_ENVIRONMENT if name in os.environ)
+    env.update({
+        'HOME': user.pw_dir,
+        'USER': user.pw_name,
+        'LOGNAME': user.pw_name,
+        'KALITE_HOME': home,
+    })
+    if user.pw_uid == os.getuid():
+        return run(cmd, env=env, cwd=user.pw_dir)
+    if os.getuid() != 0:
+        return '', "Can't run as {} without privileges\n".format(user.pw_name), 1
+
+    def demote():
+        os.initgroups(user.pw_name, user.pw_gid)
+        os.setgid(user.pw_gid)
+        os.setuid(user.pw_uid)
+
+    return run(cmd, env=env, cwd=user.pw_dir, preexec_fn=demote)
+
+
+class Broker(object):
+    """Performs vetted operations, the files written can be set for tests"""
+
+    def __init__(self, options_file=cli.DEBIAN_OPTIONS_FILE, home_file=cli.DEBIAN_HOME_FILE):
+        self.files = {
+            'write_server_options': options_file,
+            'write_home': home_file,
+        }
+
+    def perform(self, operation):
+        op = operation['op']
+        if op in self.files:
+            content = operation['content'] if op == 'write_server_options' else operation['home']
+            try:
+                cli.write_atomic(self.files[op], content + '\n')
+            except (IOError, OSError) as e:
+                return '', "Can't write {}: {}\n".format(self.files[op], e), 1
+            return '', '', 0
+        if op in SERVICE_COMMANDS:
+            return run(SERVICE_COMMANDS[op])
+        cmd = [operation['kalite'], operation['command']] + operation['args']
+        return run_as(operation['user'], cmd, operation['home'])
+
+    def respond(self, request):
+        operations = request.get('operations') if isinstance(request, dict) else None
+        if not isinstance(operations, list) or not all(isinstance(o, dict) for o in operations):
+            return {'error': "Invalid request"}
+        try:
+            operations = [vet(operation) for operation in operations]
+        except VettingError as e:
+            logger.error("Refused batch: {}".format(e))
+            return {'error': str(e)}
+        results = []
+        for operation in operations:
+            logger.info("Performing {}".format(operation))
+            stdout, stderr, returncode = self.perform(operation)
+            results.append({
+                'op': operation['op'],
+                'stdout': stdout,
+                'stderr': stderr,
+                'returncode': returncode,
+            })
+            if returncode != 0 and not request.get('keep_going'):
+                break
+        return {'results': results}
+
+    def serve(self, stdin, stdout):
+        """Answers batches until stdin is closed"""
+        while True:
+            line = stdin.readline(MAX_REQUEST)
+            if not line:
+                break
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'error': "Invalid request"}
+            else:
+                response = self.respond(request)
+            stdout.write((json.dumps(response) + '\n').encode('utf-8'))
+            stdout.flush()
+
+
+def failed(message, returncode):
+    """Results of a batch that wasn't performed"""
+    return [{'op': None, 'stdout': '', 'stderr': message, 'returncode': returncode}]
+
+
+class BrokerClient(object):
+    """
+    Talks to the privileged helper of this session, starting it on first
+    use. Methods block, call them from a worker thread.
+    """
+
+    def __init__(self, cmd=None):
+        self.cmd = cmd
+        self.process = None
+        # One batch at a time over the pipe
+        self.lock = threading.Lock()
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        cmd = self.cmd or cli.sudo([sys.executable, '-m', 'kalite_gtk.broker'])
+        logger.info("Starting privileged helper: {}".format(cmd))
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, close_fds=True)
+
+    def run(self, operations, keep_going=False):
+        """
+        Blocking:
+        Sends a batch of operations, returns a result dict per operation
+        that was performed. A batch that wasn't performed at all, e.g.
+        because the privilege prompt was dismissed, gives a single result
+        with the reason in 'stderr'. With keep_going, operations after a
+        failed one are still performed.
+        """
+        request = json.dumps({'operations': operations, 'keep_going': keep_going}) + '\n'
+        with self.lock:
+            if not self.is_running():
+                try:
+                    self.start()
+                except OSError as e:
+                    logger.error("Can't start the privileged helper: {}".format(e))
+                    return failed("Can't start the privileged helper: {}\n".format(e), 127)
+            try:
+                self.process.stdin.write(request.encode('utf-8'))
+                self.process.stdin.flush()
+                line = self.process.stdout.readline()
+            except (IOError, OSError) as e:
+                logger.debug("Privileged helper went away: {}".format(e))
+                line = b''
+            if not line:
+                self.close()
+                return failed("Not authorized\n", 126)
+            try:
+                response = json.loads(line.decode('utf-8'))
+            except ValueError:
+                # Out of step with the helper, start over next time
+                logger.error("Garbled answer from the privileged helper: {!r}".format(line))
+                self.close()
+                return failed("Garbled answer from the privileged helper\n", 1)
+        if 'error' in response:
+            return failed(response['error'] + '\n', 1)
+        return response['results']
+
+    def close(self):
+        """Closing the pipe makes the helper exit"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        for pipe in (process.stdin, process.stdout):
+            try:
+                pipe.close()
+            except (IOError, OSError):
+                pass
+        process.wait()
+
+
+def kalite_operation(kalite_command, options=None):
+    """Operation running a kalite command as the user in options"""
+    options = options or cli.settings
+    kalite = options['command']
+    if not os.path.isabs(kalite):
+        # The helper's PATH is root's, resolve it as the user would
+        kalite = cli.find_executable(kalite) or kalite
+    return {
+        'op': 'kalite',
+        'command': kalite_command,
+        'args': cli.get_kalite_args(kalite_command, options),
+        'user': options['user'],
+        'home': options['home'],
+        'kalite': kalite,
+    }
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    # Nothing else may write to the pipe
+    sys.stdout = sys.stderr
+    Broker().serve(stdin, stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Quick diagnostics gathered in-process, without running 'kalite diagnose'
+
+Every check runs in its own thread of a pool shared by all runs, results
+are yielded as they come in and checks that take longer than their
+timeout are reported as such. A check still running from an earlier run
+isn't started again.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import logging
+import os
+import platform
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from . import cli
+from .probe import HTTPProbe
+from .procmon import format_bytes
+
+logger = logging.getLogger(__name__)
+
+# Severity of a result, None when the check didn't finish
+OK = 'ok'
+WARNING = 'warning'
+ERROR = 'error'
+
+# Seconds a check may take unless it sets its own timeout
+DEFAULT_TIMEOUT = 2
+
+# Threads of the pool running checks
+POOL_SIZE = 8
+
+# Below these, free disk space and available memory are a warning
+MIN_FREE_DISK = 1024 ** 3
+MIN_AVAILABLE_MEMORY = 100 * 1024 ** 2
+
+# Name of KA Lite's database in KALITE_HOME
+DATABASE_DIR = 'database'
+
+Result = collections.namedtuple('Result', ['name', 'value', 'severity', 'elapsed'])
+
+
+def check_python(options):
+    return "{} {}".format(platform.python_implementation(), platform.python_version()), OK
+
+
+def check_command(options):
+    command = options['command']
+    path = command if os.path.isabs(command) else cli.find_executable(command)
+    if path and os.access(path, os.X_OK):
+        return path, OK
+    return "{} not found".format(command), ERROR
+
+
+def check_port(options):
+    probe = HTTPProbe(timeout=1.0)
+    try:
+        verdict = probe.check(options['port'])
+    finally:
+        probe.close()
+    if verdict:
+        return "Port {} is answering".format(options['port']), OK
+    if verdict is False:
+        return "Nothing listens on port {}".format(options['port']), WARNING
+    return "Port {} doesn't answer".format(options['port']), WARNING
+
+
+def check_disk(options):
+    path = options['content_root']
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    st = os.statvfs(path)
+    free = st.f_bavail * st.f_frsize
+    severity = OK if free >= MIN_FREE_DISK else WARNING
+    return "{} free of {} ({})".format(
+        format_bytes(free), format_bytes(st.f_blocks * st.f_frsize), path), severity
+
+
+def check_memory(options):
+    meminfo = {}
+    with open('/proc/meminfo') as f:
+        for line in f:
+            key, __, value = line.partition(':')
+            meminfo[key] = int(value.split()[0]) * 1024
+    available = meminfo.get('MemAvailable', meminfo.get('MemFree', 0))
+    severity = OK if available >= MIN_AVAILABLE_MEMORY else WARNING
+    return "{} available of {}".format(format_bytes(available), format_bytes(meminfo['MemTotal'])), severity
+
+
+def check_home(options):
+    home = options['home']
+    if not os.path.isdir(home):
+        return "{} does not exist".format(home), ERROR
+    if not os.access(home, os.W_OK):
+        return "{} is not writable".format(home), ERROR
+    st = os.statvfs(home)
+    free = st.f_bavail * st.f_frsize
+    severity = OK if free >= MIN_FREE_DISK else WARNING
+    return "{} free in {}".format(format_bytes(free), home), severity
+
+
+def check_database(options):
+    database = os.path.join(options['home'], DATABASE_DIR)
+    if not os.path.isdir(database):
+        return "No database in {}".format(database), WARNING
+    sizes = [
+        "{} {}".format(name, format_bytes(os.path.getsize(os.path.join(database, name))))
+        for name in sorted(os.listdir(database)) if name.endswith('.sqlite')
+    ]
+    return ", ".join(sizes) or "Empty", OK
+
+
+# (name, check, timeout)
+CHECKS = (
+    ("Python", check_python, DEFAULT_TIMEOUT),
+    ("KA Lite command", check_command, DEFAULT_TIMEOUT),
+    ("Server port", check_port, DEFAULT_TIMEOUT),
+    ("Free disk space", check_disk, DEFAULT_TIMEOUT),
+    ("Free memory", check_memory, DEFAULT_TIMEOUT),
+    ("KA Lite home", check_home, DEFAULT_TIMEOUT),
+    ("Database", check_database, DEFAULT_TIMEOUT),
+)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Names of the checks running in the pool
+_running = set()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPool(POOL_SIZE)
+        return _pool
+
+
+def run_check(name, check, options):
+    try:
+        return check(options)
+    except Exception as e:
+        logger.debug("Check {} failed".format(check.__name__), exc_info=True)
+        return str(e), ERROR
+    finally:
+        with _pool_lock:
+            _running.discard(name)
+
+
+def run_checks(options=None, checks=CHECKS):
+    """
+    Blocking:
+    Generator of a Result per check, in the order they finish. A check
+    that takes longer than its timeout gives a Result with severity None,
+    its thread is left to finish on its own. So does a check still running
+    from an earlier call, which isn't started again.
+    """
+    options = options or cli.settings
+    options = {key: options[key] for key in ('command', 'port', 'home', 'content_root')}
+    done = Queue()
+    pool = get_pool()
+    started = time.time()
+    deadlines = {}
+    for name, check, timeout in checks:
+        with _pool_lock:
+            running = name in _running
+            _running.add(name)
+        if running:
+            yield Result(name, "Still running", None, 0)
+            continue
+        deadlines[name] = started + timeout
+        # Checks that time out are left running
+        pool.apply_async(
+            run_check, (name, check, options),
+            callback=lambda result, name=name: done.put((name, result, time.time() - started)),
+        )
+
+    pending = set(deadlines)
+    while pending:
+        wait = min(deadlines[name] for name in pending) - time.time()
+        try:
+            name, (value, severity), elapsed = done.get(timeout=max(0, wait))
+        except Empty:
+            now = time.time()
+            for name in sorted(pending):
+                if deadlines[name] <= now:
+                    pending.discard(name)
+                    yield Result(name, "Timed out", None, now - started)
+            continue
+        if name in pending:
+            pending.discard(name)
+            yield Result(name, value, severity, elapsed)
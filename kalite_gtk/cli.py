@@ -5,33 +5,63 @@ CLI for kalite
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import codecs
 import getpass
+import hashlib
 import logging
 import os
 import re
 import json
 import pwd
+import select
 import shlex
+import stat
 import subprocess
+import tempfile
+import time
 
-from distutils.spawn import find_executable
+from functools import wraps
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 
 from .exceptions import ValidationError
+from . import trace
 from . import validators
+from .probe import HTTPProbe
 
 logger = logging.getLogger(__name__)
 
 KALITE_GTK_SETTINGS_FILE = os.path.expanduser(os.path.join('~', '.kalite', 'ka-lite-gtk.json'))
 
-DEFAULT_USER = getpass.getuser()
-DEFAULT_PORT = 8008
-
 # Constants from the ka-lite .deb package conventions
 DEBIAN_INIT_SCRIPT = '/etc/init.d/ka-lite'
 DEBIAN_USERNAME_FILE = '/etc/ka-lite/username'
 DEBIAN_HOME_FILE = '/etc/ka-lite/home'
 DEBIAN_OPTIONS_FILE = '/etc/ka-lite/server_options'
 
+# Written by 'kalite start' in KALITE_HOME while the server is running
+PID_FILE_NAME = 'kalite.pid'
+
+# The server's log in KALITE_HOME
+SERVER_LOG_NAME = 'server.log'
+
+# Return codes of 'kalite status'
+STATUS_RUNNING = 0
+STATUS_STOPPED = 1
+
+# Tags of the events yielded by iter_kalite_command
+STDOUT = 'stdout'
+STDERR = 'stderr'
+EXIT = 'exit'
+
+READ_SIZE = 4096
+
+# Mode of files created by write_atomic
+NEW_FILE_MODE = 0o644
+
 # A validator callback will raise an exception ValidationError
 validate = {
     'user': validators.username,
@@ -39,137 +69,402 @@ validate = {
     'command': validators.command
 }
 
-if find_executable('pkexec'):
-    SU_COMMAND = 'pkexec --user {username}'
-    SUDO_COMMAND = 'pkexec'
-else:
-    SU_COMMAND = 'gksudo -u {username}'
-    SUDO_COMMAND = 'gksudo'
-
-# KA Lite Debian convention
-# Set new default values from debian system files
-debian_username = None
-if os.path.isfile(DEBIAN_USERNAME_FILE):
-    debian_username = open(DEBIAN_USERNAME_FILE, 'r').read()
-    debian_username = debian_username.split('\n')[0]
-    if debian_username:
-        try:
-            debian_username = validate['user'](debian_username)
-            DEFAULT_USER = debian_username
-            # Okay there's a default debian user. If that user is the same as
-            # the one selected in the user settings, we should use the --port
-            # option set for the debian service.
-            if os.path.isfile(DEBIAN_OPTIONS_FILE):
-                current_server_options = open(DEBIAN_OPTIONS_FILE, 'r').read()
-                match_port = re.compile(
-                    r'--port=(?P<port>\d+)'
-                ).search(current_server_options)
-                if match_port:
-                    DEFAULT_PORT = int(match_port.group('port'))
-        except ValidationError:
-            logger.error('Non-existing username in {}'.format(DEBIAN_USERNAME_FILE))
+
+def find_executable(name):
+    # distutils is slow to import, so only pay for it when probing
+    from distutils.spawn import find_executable as _find_executable
+    return _find_executable(name)
+
+
+def read_text(path):
+    """Contents of a file, None if it can't be read"""
+    try:
+        with codecs.open(path, 'r', 'utf-8') as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+def write_atomic(path, content):
+    """
+    Replaces a file with content, so that it's never seen half-written and
+    survives a power cut once this returns. The file keeps its mode, a new
+    file is readable by everyone.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(path)))
+    try:
+        # mkstemp creates the file 0600
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content.encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    # Make the rename itself durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
 
 
 def get_kalite_home(user):
     return os.path.join(pwd.getpwnam(user).pw_dir, '.kalite')
 
 
-DEFAULT_HOME = get_kalite_home(DEFAULT_USER)
+def get_gtk_path(name, home=None):
+    """
+    Path of a file of our own, e.g. a cache, in the KALITE_HOME of the GUI.
+    Unlike the server's home, it's always ours to write. Files about a
+    server are told apart by a hash of its home.
+    """
+    directory = os.environ.get('KALITE_HOME', os.path.expanduser(os.path.join('~', '.kalite')))
+    if home is not None:
+        root, ext = os.path.splitext(name)
+        name = '{}_{}{}'.format(root, hashlib.sha1(home.encode('utf-8')).hexdigest()[:12], ext)
+    return os.path.join(directory, name)
 
 
-# These are the settings. They are subject to change at load time by
-# reading in settings files
-settings = {
-    'user': DEFAULT_USER,
-    'command': find_executable('kalite'),
-    'content_root': os.path.join(DEFAULT_HOME, 'content'),
-    'port': DEFAULT_PORT,
-    'home': DEFAULT_HOME,
-}
+def cached(func):
+    """
+    Turns a method into a property computed on first access and kept in the
+    instance's _cache until it's cleared
+    """
+    @wraps(func)
+    def getter(self):
+        if func.__name__ not in self._cache:
+            self._cache[func.__name__] = func(self)
+        return self._cache[func.__name__]
+    return property(getter)
 
 
-# Read settings from settings file
-if os.path.isfile(KALITE_GTK_SETTINGS_FILE):
-    try:
-        loaded_settings = json.load(open(KALITE_GTK_SETTINGS_FILE, 'r'))
-        if debian_username:
+class Environment(object):
+    """
+    Facts about the host system: available executables and the defaults of
+    the KA Lite Debian convention in /etc/ka-lite. Nothing is probed until
+    first needed, and results are kept until reload().
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def reload(self, *names):
+        """Forgets the given facts, or all of them"""
+        if not names:
+            self._cache.clear()
+        for name in names:
+            self._cache.pop(name, None)
+
+    @cached
+    def has_pkexec(self):
+        return bool(find_executable('pkexec'))
+
+    @cached
+    def su_command(self):
+        if self.has_pkexec:
+            return 'pkexec --user {username}'
+        return 'gksudo -u {username}'
+
+    @cached
+    def sudo_command(self):
+        if self.has_pkexec:
+            return 'pkexec'
+        return 'gksudo'
+
+    @cached
+    def kalite_executable(self):
+        return find_executable('kalite')
+
+    @cached
+    def debian_username(self):
+        """
+        The valid username in DEBIAN_USERNAME_FILE, otherwise None
+        """
+        text = read_text(DEBIAN_USERNAME_FILE)
+        if text is None:
+            return None
+        username = text.split('\n')[0]
+        if not username:
+            return None
+        try:
+            return validate['user'](username)
+        except ValidationError:
+            logger.error('Non-existing username in {}'.format(DEBIAN_USERNAME_FILE))
+            return None
+
+    @cached
+    def debian_port(self):
+        """
+        The --port option in DEBIAN_OPTIONS_FILE, otherwise None
+        """
+        current_server_options = read_text(DEBIAN_OPTIONS_FILE)
+        if current_server_options is None:
+            return None
+        match_port = re.compile(
+            r'--port=(?P<port>\d+)'
+        ).search(current_server_options)
+        if match_port:
+            return int(match_port.group('port'))
+        return None
+
+    @cached
+    def default_user(self):
+        return self.debian_username or getpass.getuser()
+
+    @cached
+    def default_port(self):
+        # If there's a default debian user, we should use the --port option
+        # set for the debian service.
+        if self.debian_username and self.debian_port:
+            return self.debian_port
+        return 8008
+
+    @cached
+    def default_home(self):
+        return get_kalite_home(self.default_user)
+
+
+class Settings(MutableMapping):
+    """
+    The settings, read from the defaults of the environment and the
+    settings file on first access and kept until reload().
+    """
+
+    def __init__(self, environment, path=KALITE_GTK_SETTINGS_FILE):
+        self.environment = environment
+        self.path = path
+        self._data = None
+        # Contents of the settings file
+        self._loaded = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self.load()
+        return self._data
+
+    def defaults(self):
+        env = self.environment
+        return {
+            'user': env.default_user,
+            'command': env.kalite_executable,
+            'content_root': os.path.join(env.default_home, 'content'),
+            'port': env.default_port,
+            'home': env.default_home,
+            # Scrollback of the Log and Diagnose views, None for no limit
+            'scrollback_lines': 5000,
+            'scrollback_chars': None,
+            # Write text trimmed from the scrollback to rotating files in KALITE_HOME
+            'scrollback_spill': False,
+            # Send commands through a long-lived helper, see daemon.py
+            'use_daemon': False,
+        }
+
+    @trace.span('settings.load')
+    def load(self):
+        self._loaded = self.read_file()
+        return self.compose()
+
+    def read_file(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            logger.error("Parsing error in {}".format(self.path))
+            return {}
+
+    def compose(self):
+        """The settings from the defaults and the settings file"""
+        settings = self.defaults()
+        loaded_settings = dict(self._loaded)
+        if self.environment.debian_username:
             # Do NOT load the username from the settings file if we are
             # using /etc/ka-lite/username -- they can get out of sync
-            del loaded_settings['user']
+            loaded_settings.pop('user', None)
         for (k, v) in loaded_settings.items():
             try:
                 settings[k] = validate[k](v) if k in validate else v
             except ValidationError:
-                logger.error("Illegal value in {} for {}".format(KALITE_GTK_SETTINGS_FILE, k))
+                logger.error("Illegal value in {} for {}".format(self.path, k))
         # Update the home folder if it wasn't specified
         if 'home' not in loaded_settings:
             settings['home'] = get_kalite_home(settings['user'])
         if 'content_root' not in loaded_settings:
-            print("SETTING CONTENT_ROOT")
             settings['content_root'] = os.path.join(settings['home'], 'content')
-    except ValueError:
-        logger.error("Parsing error in {}".format(KALITE_GTK_SETTINGS_FILE))
+        return settings
+
+    def save(self):
+        """
+        Writes the settings to the settings file, unless it already holds
+        them. Returns whether it was written.
+        """
+        content = json.dumps(self.data, sort_keys=True, indent=2)
+        if read_text(self.path) == content:
+            return False
+        write_atomic(self.path, content)
+        return True
+
+    def reload(self):
+        """Probes the environment and reads the settings file again"""
+        self.environment.reload()
+        self._data = None
+
+    def reload_file(self):
+        """
+        Reads the settings file again, returns the settings that changed
+        with their new values
+        """
+        if self._data is None:
+            return {}
+        self._loaded = self.read_file()
+        return self._replace(self.compose())
+
+    def reload_environment(self, *names):
+        """
+        Forgets the given facts of the environment, e.g. after a file in
+        /etc/ka-lite changed, returns the settings that changed with their
+        new values
+        """
+        self.environment.reload(*names)
+        if self._data is None:
+            return {}
+        return self._replace(self.compose())
+
+    def _replace(self, data):
+        changed = dict((k, v) for k, v in data.items() if self._data.get(k) != v)
+        self._data = data
+        return changed
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return repr(self.data)
+
+
+environment = Environment()
+
+# These are the settings. They are loaded on first access by reading in
+# settings files
+settings = Settings(environment)
 
 
-def get_command(kalite_command):
-    return [settings['command']] + kalite_command.split(" ")
+def get_command(kalite_command, options=None):
+    options = options or settings
+    return [options['command']] + kalite_command.split(" ")
 
 
-def conditional_sudo(cmd, no_su=False):
+def get_server_log(options=None):
+    options = options or settings
+    return os.path.join(options['home'], SERVER_LOG_NAME)
+
+
+def get_kalite_args(kalite_command, options=None):
+    """Options the GUI passes to a kalite subcommand"""
+    options = options or settings
+    if kalite_command in ('start', 'restart'):
+        return ['--port={}'.format(options['port'])]
+    return []
+
+
+def get_env(options=None):
+    """Environment for running kalite commands"""
+    options = options or settings
+    env = os.environ.copy()
+    env['KALITE_HOME'] = options['home']
+    return env
+
+
+def needs_su(options=None):
+    """Whether kalite has to run as another user than ours"""
+    options = options or settings
+    return options['user'] != getpass.getuser()
+
+
+def conditional_sudo(cmd, no_su=False, options=None):
     """Decorator indicating that sudo access is needed before running
     run_kalite_command or stream_kalite_command"""
-    if settings['user'] != getpass.getuser():
-        return shlex.split(SU_COMMAND.format(username=settings['user'])) + cmd
+    options = options or settings
+    if needs_su(options):
+        return shlex.split(environment.su_command.format(username=options['user'])) + cmd
     return cmd
 
 
 def sudo(cmd, no_su=False):
     """Decorator indicating that sudo access is needed before running
     run_kalite_command or stream_kalite_command"""
-    return shlex.split(SUDO_COMMAND) + cmd
+    return shlex.split(environment.sudo_command) + cmd
 
 
-def run_kalite_command(cmd, shell=False):
+def run_kalite_command(cmd, shell=False, env=None):
     """
     Blocking:
-    Uses the current UI settings to run a command and returns
-    stdin, stdout
+    Uses the current UI settings, or the environment env, to run a command
+    and returns stdin, stdout
 
     Example:
 
     run_kalite_command("start --port=7007")
     """
-    env = os.environ.copy()
-    env['KALITE_HOME'] = settings['home']
-    logger.debug("Running command: {}, KALITE_HOME={}".format(cmd, str(settings['home'])))
-    p = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        env=env,
-        shell=shell
-    )
-    # decode() necessary to convert streams from byte to str
-    stdout, stderr = p.communicate()
+    env = env or get_env()
+    logger.debug("Running command: {}, KALITE_HOME={}".format(cmd, env['KALITE_HOME']))
+    with trace.span('run_kalite_command', cmd=cmd) as timing:
+        p = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env,
+            shell=shell
+        )
+        # decode() necessary to convert streams from byte to str
+        stdout, stderr = p.communicate()
+        timing.args['returncode'] = p.returncode
     return [stdout.decode(), stderr.decode(), p.returncode]
 
 
-def stream_kalite_command(cmd, shell=False):
+def iter_kalite_command(cmd, shell=False, env=None):
     """
-    Generator that yields for every line of stdout
+    Generator that yields (stream, chunk) events as output arrives on
+    either pipe, so a child writing a lot to stderr never blocks on a full
+    pipe while we wait for stdout.
 
-    Finally, returns stderr
+    stream is STDOUT or STDERR and chunk is decoded text. Once both pipes
+    are closed, the child is reaped and a last (EXIT, (returncode,
+    wall_time)) event is yielded.
 
     Example:
 
-    for stdout, stderr in stream_kalite_command("start --port=7007"):
-        print(stdout)
-    print(stderr)
-
+    for stream, chunk in iter_kalite_command(["kalite", "start"]):
+        if stream == EXIT:
+            returncode, wall_time = chunk
     """
-    env = os.environ.copy()
-    env['KALITE_HOME'] = settings['home']
-    logger.debug("Streaming command: {}, KALITE_HOME={}".format(cmd, str(settings['home'])))
+    env = env or get_env()
+    logger.debug("Streaming command: {}, KALITE_HOME={}".format(cmd, env['KALITE_HOME']))
+    started = time.time()
     p = subprocess.Popen(
         cmd,
         stdout=subprocess.PIPE,
@@ -177,13 +472,69 @@ def stream_kalite_command(cmd, shell=False):
         env=env,
         shell=shell
     )
-    for line in iter(lambda: p.stdout.readline().decode(), ''):
-        yield line, None, None
-    yield (
-        None,
-        p.stderr.read().decode() if p.stderr is not None else None,
-        p.returncode
+    streams = {
+        p.stdout.fileno(): STDOUT,
+        p.stderr.fileno(): STDERR,
+    }
+    decoders = dict(
+        (fd, codecs.getincrementaldecoder('utf-8')(errors='replace'))
+        for fd in streams
     )
+    poller = select.poll()
+    for fd in streams:
+        poller.register(fd, select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR)
+    try:
+        while streams:
+            for fd, __ in poller.poll():
+                data = os.read(fd, READ_SIZE)
+                chunk = decoders[fd].decode(data, final=not data)
+                if chunk:
+                    yield streams[fd], chunk
+                if not data:
+                    poller.unregister(fd)
+                    del streams[fd]
+        returncode = p.wait()
+    finally:
+        # Also when the consumer stops early, closing the generator
+        if p.poll() is None:
+            p.kill()
+            p.wait()
+        p.stdout.close()
+        p.stderr.close()
+    finished = time.time()
+    trace.record('iter_kalite_command', started, finished, cmd=cmd, returncode=returncode)
+    yield EXIT, (returncode, finished - started)
+
+
+def stream_kalite_command(cmd, shell=False, env=None):
+    """
+    Generator that yields for every line of stdout
+
+    Finally, returns stderr and the exit code
+
+    Example:
+
+    for stdout, stderr, returncode in stream_kalite_command("start --port=7007"):
+        print(stdout)
+    print(stderr)
+
+    """
+    partial = ''
+    stderr = []
+    for stream, chunk in iter_kalite_command(cmd, shell=shell, env=env):
+        if stream == STDOUT:
+            lines = (partial + chunk).split('\n')
+            partial = lines.pop()
+            for line in lines:
+                yield line + '\n', None, None
+        elif stream == STDERR:
+            stderr.append(chunk)
+        else:
+            returncode, wall_time = chunk
+            logger.debug("Command {} exited with {} after {:.2f}s".format(cmd, returncode, wall_time))
+    if partial:
+        yield partial, None, None
+    yield None, ''.join(stderr), returncode
 
 
 def has_init_d():
@@ -194,11 +545,18 @@ def is_installed():
     return any('ka-lite' in x for x in os.listdir('/etc/rc3.d'))
 
 
+def install_command():
+    return sudo([
+        "bash".encode('ascii'),
+        "-c".encode('ascii'),
+        "update-rc.d ka-lite defaults".encode('ascii')
+    ])
+
+
 def install():
     """
     Installs system startup script
     """
-    global DEFAULT_USER
     # retval = run_kalite_command(
     #     sudo([
     #         "bash".encode('ascii'),
@@ -206,20 +564,19 @@ def install():
     #         "echo {username} > /etc/ka-lite/username && update-rc.d ka-lite defaults".format(username=settings['user']).encode('ascii')
     #     ])
     # )
-    retval = run_kalite_command(
-        sudo([
-            "bash".encode('ascii'),
-            "-c".encode('ascii'),
-            "update-rc.d ka-lite defaults".encode('ascii')
-        ])
-    )
-    return retval
+    return run_kalite_command(install_command())
+
+
+def remove_command():
+    return sudo(shlex.split("update-rc.d -f ka-lite remove"))
 
 
 def remove():
-    return run_kalite_command(
-        sudo(shlex.split("update-rc.d -f ka-lite remove"))
-    )
+    return run_kalite_command(remove_command())
+
+
+def start_command():
+    return conditional_sudo(get_command('start') + get_kalite_args('start'))
 
 
 def start():
@@ -227,114 +584,196 @@ def start():
     Streaming:
     Starts the server
     """
-    for val in stream_kalite_command(
-        conditional_sudo(get_command('start') + ['--port={}'.format(settings['port'])])
-    ):
+    for val in stream_kalite_command(start_command()):
         yield val
 
 
+def stop_command():
+    return conditional_sudo(get_command('stop'))
+
+
 def stop():
     """
     Streaming:
     Stops the server
     """
-    for val in stream_kalite_command(conditional_sudo(get_command('stop'))):
+    for val in stream_kalite_command(stop_command()):
         yield val
 
 
+def restart_command():
+    return conditional_sudo(get_command('restart') + get_kalite_args('restart'))
+
+
 def restart():
     """
     Streaming:
     Stops the server
     """
-    for val in stream_kalite_command(
-        conditional_sudo(get_command('restart') + ['--port={}'.format(settings['port'])])
-    ):
+    for val in stream_kalite_command(restart_command()):
         yield val
 
 
+def diagnose_command():
+    return get_command('diagnose')
+
+
 def diagnose():
     """
     Blocking:
     Runs the diagnose command
     """
-    return run_kalite_command(get_command('diagnose'))
+    return run_kalite_command(diagnose_command())
+
+
+def status_subprocess(options=None):
+    """
+    Blocking:
+    Fetches server's current status as a string by running 'kalite status'
+    """
+    __, err, returncode = run_kalite_command(get_command('status', options), env=get_env(options))
+    return err, returncode
+
+
+_probe = HTTPProbe()
 
+# Last output of 'kalite status' while running, by port and home. It lists
+# the URLs of all network interfaces, so we reuse it for as long as the
+# probe says the server is still up.
+_running_status_cache = {}
 
-def status():
+
+def probe_status(options=None):
+    """
+    Decides whether the server is up by connecting to its port directly.
+    Returns True, False or None if undecided.
+    """
+    options = options or settings
+    verdict = _probe.check(options['port'])
+    if verdict is False and os.path.isfile(os.path.join(options['home'], PID_FILE_NAME)):
+        # Nothing listens, but a pid file says otherwise: the server may be
+        # starting up or have died uncleanly, 'kalite status' knows which.
+        return None
+    return verdict
+
+
+@trace.span('status')
+def status(options=None):
     """
     Blocking:
-    Fetches server's current status as a string
+    Fetches server's current status as a string. Only runs 'kalite status'
+    when the HTTP probe can't decide or the server has just come up.
+
+    options holds the 'port', 'home' and 'command' to check, by default
+    the settings.
     """
-    __, err, returncode = run_kalite_command(get_command('status'))
+    options = options or settings
+    key = (int(options['port']), options['home'])
+    verdict = probe_status(options)
+    if verdict is False:
+        _running_status_cache.pop(key, None)
+        return "Stopped", STATUS_STOPPED
+    if verdict and key in _running_status_cache:
+        return _running_status_cache[key], STATUS_RUNNING
+    err, returncode = status_subprocess(options)
+    if returncode == STATUS_RUNNING:
+        _running_status_cache[key] = err
+    else:
+        _running_status_cache.pop(key, None)
     return err, returncode
 
 
+URL_PATTERN = re.compile(r'(http://[^\s]+)')
+
+
 def get_urls_from_status(msg, return_code):
+    """The URLs listed in the output of 'kalite status'"""
     if return_code != 0:
-        return
-    url_match = re.compile(r'(http://[^\s]+)')
-    for line in msg.split():
-        match = url_match.search(line)
-        if match:
-            yield match.group(0)
+        return []
+    return URL_PATTERN.findall(msg)
 
 
-def save_settings():
-    global DEFAULT_PORT
+@trace.span('save_settings')
+def save_settings(broker=None):
     # Write settings to ka-lite-gtk settings file
-    json.dump(settings, open(KALITE_GTK_SETTINGS_FILE, 'w'))
-    save_debian_settings()
+    settings.save()
+    save_debian_settings(broker)
 
-def save_debian_settings():
+
+def debian_settings_operations():
     """
-    Conditionally saves the settings on a debian system, if the current setting
-    for DEFAULT_USER matches the one in settings['user']
+    Operations of the privileged helper, see broker.py, that bring the
+    debian settings in line with settings, an empty list if they are
     """
-    global DEFAULT_USER, DEFAULT_PORT
-    print(DEFAULT_USER, settings['user'])
-    if DEFAULT_USER != settings['user']:
+    if not os.path.isdir(os.path.dirname(DEBIAN_OPTIONS_FILE)):
+        return []
+
+    if environment.default_user != settings['user']:
         logger.info(
             "Not saving debian settings for non-default user {}, install "
             "system startup scripts first to make it the default".format(
                 settings['user']
             )
         )
-        return
+        return []
 
-    bash_commands = []
+    operations = []
 
-    # Write to debian settings if applicable
-    if settings['port'] != DEFAULT_PORT:
-        current_server_options = open(DEBIAN_OPTIONS_FILE, 'r').read()
+    # Write to debian settings if applicable, and only if it changes them
+    if int(settings['port']) != environment.default_port:
+        old_server_options = (read_text(DEBIAN_OPTIONS_FILE) or '').strip()
         current_server_options = re.sub(
             r'--port=\d+',
             '--port={}'.format(settings['port']),
-            current_server_options
+            old_server_options
         )
-        current_server_options = current_server_options.strip()
         # ...If not found, append a new option
         if '--port' not in current_server_options:
             current_server_options += ' --port={}'.format(settings['port'])
-        # Create a temporary file and copy it to the settings file
-        bash_commands.append('echo "{server_options}" > {options_file}'.format(
-            server_options=current_server_options,
-            options_file=DEBIAN_OPTIONS_FILE,
-        ))
-
-    if settings['home'] != DEFAULT_HOME:
-        bash_commands.append('echo "{home}" > {home_file}'.format(
-            home=settings['home'], home_file=DEBIAN_HOME_FILE
-        ))
-
-    __, stderr, returncode = run_kalite_command(
-        sudo([
-            "bash".encode('ascii'),
-            "-c".encode('ascii'),
-            " && ".join(bash_commands).encode('ascii')
-        ])
-    )
+        current_server_options = current_server_options.strip()
+        if current_server_options != old_server_options:
+            operations.append({'op': 'write_server_options', 'content': current_server_options})
+
+    if settings['home'] != environment.default_home:
+        if (read_text(DEBIAN_HOME_FILE) or '').strip() != settings['home']:
+            operations.append({'op': 'write_home', 'home': settings['home']})
+
+    return operations
+
+
+def save_debian_settings(broker=None):
+    """
+    Conditionally saves the settings on a debian system, if the current setting
+    for the default user matches the one in settings['user']
+
+    With broker, a broker.BrokerClient, the files are written by the
+    privileged helper of the session instead of a command of their own.
+    """
+    operations = debian_settings_operations()
+    if not operations:
+        logger.debug("Debian settings are up to date")
+        return
+
+    if broker is not None:
+        results = broker.run(operations)
+        stderr = ''.join(result['stderr'] for result in results)
+        failed = len(results) < len(operations) or any(result['returncode'] for result in results)
+        returncode = 1 if failed else 0
+    else:
+        files = {'write_server_options': DEBIAN_OPTIONS_FILE, 'write_home': DEBIAN_HOME_FILE}
+        bash_commands = [
+            'echo "{}" > {}'.format(operation.get('content', operation.get('home')), files[operation['op']])
+            for operation in operations
+        ]
+        __, stderr, returncode = run_kalite_command(
+            sudo([
+                "bash".encode('ascii'),
+                "-c".encode('ascii'),
+                " && ".join(bash_commands).encode('ascii')
+            ])
+        )
     if returncode == 0:
         logger.info("Successfully wrote new debian config")
+        environment.reload()
     else:
         logger.error("Error writing debian config: {}".format(stderr))
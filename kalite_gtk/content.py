@@ -0,0 +1,190 @@
+"""
+Inventory of the content in content_root: number of files and bytes by
+type, kept in an index that's updated incrementally.
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import os
+import stat
+import time
+from multiprocessing.pool import ThreadPool
+
+from . import cli
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE_NAME = 'kalite_gtk_content_index.json'
+
+# Bump when the index format changes
+INDEX_VERSION = 1
+
+# Threads listing directories
+SCAN_THREADS = 4
+
+# Kinds of content by file extension, anything else is 'other'
+TYPES = {
+    'video': ('.mp4', '.webm', '.m4v', '.ogv', '.avi', '.mkv'),
+    'audio': ('.mp3', '.ogg', '.oga', '.wav'),
+    'image': ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp'),
+    'subtitles': ('.srt', '.vtt'),
+    'document': ('.pdf', '.epub', '.html', '.htm', '.txt'),
+    'archive': ('.zip', '.tar', '.gz', '.bz2', '.xz'),
+    'data': ('.json', '.sqlite', '.xml', '.csv'),
+}
+EXTENSION_TYPES = dict((ext, kind) for kind, exts in TYPES.items() for ext in exts)
+
+
+def get_index_path(home):
+    """
+    The index of the server in home is ours, the server's home may belong
+    to another user
+    """
+    return cli.get_gtk_path(INDEX_FILE_NAME, home)
+
+
+def get_type(filename):
+    return EXTENSION_TYPES.get(os.path.splitext(filename)[1].lower(), 'other')
+
+
+def list_directory(path):
+    """
+    Returns (subdirectory names, {type: [files, bytes]}) of the entries
+    directly in path. Symbolic links are not followed.
+    """
+    dirs = []
+    types = {}
+
+    def add_file(name, size):
+        counts = types.setdefault(get_type(name), [0, 0])
+        counts[0] += 1
+        counts[1] += size
+
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    add_file(entry.name, entry.stat(follow_symlinks=False).st_size)
+            except OSError:
+                continue
+        return dirs, types
+
+    for name in os.listdir(path):
+        try:
+            st = os.lstat(os.path.join(path, name))
+        except OSError:
+            continue
+        if stat.S_ISDIR(st.st_mode):
+            dirs.append(name)
+        elif stat.S_ISREG(st.st_mode):
+            add_file(name, st.st_size)
+    return dirs, types
+
+
+class ContentIndex(object):
+    """
+    Per directory counts of content_root, by relative path. A directory is
+    only listed again when its mtime changed, i.e. entries were added,
+    removed or renamed in it; its subdirectories are still checked. Files
+    rewritten in place keep their old size until their directory changes.
+    """
+
+    def __init__(self, root, path):
+        self.root = root
+        self.path = path
+        self.dirs = {}
+        self.scanned = None
+
+    def load(self):
+        try:
+            with io.open(self.path, encoding='utf-8') as f:
+                data = json.loads(f.read())
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('root') != self.root:
+            return False
+        self.dirs = data['dirs']
+        self.scanned = data.get('scanned')
+        return True
+
+    def save(self):
+        data = {
+            'version': INDEX_VERSION,
+            'root': self.root,
+            'scanned': self.scanned,
+            'dirs': self.dirs,
+        }
+        try:
+            with io.open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(data))
+        except (IOError, OSError) as e:
+            logger.error("Can't save the content index {}: {}".format(self.path, e))
+
+    def scan_directory(self, relative):
+        """Returns (relative, record, listed) with record None if it's gone"""
+        path = os.path.join(self.root, relative) if relative else self.root
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return relative, None, False
+        cached = self.dirs.get(relative)
+        if cached is not None and cached['mtime'] == mtime:
+            return relative, cached, False
+        try:
+            dirs, types = list_directory(path)
+        except OSError as e:
+            logger.debug("Can't list {}: {}".format(path, e))
+            return relative, None, False
+        return relative, {'mtime': mtime, 'dirs': dirs, 'types': types}, True
+
+    def scan(self, threads=SCAN_THREADS):
+        """
+        Blocking:
+        Updates the index level by level, listing the directories of a
+        level in parallel. Returns the number of directories listed.
+        """
+        seen = {}
+        listed = 0
+        pool = ThreadPool(threads)
+        try:
+            level = ['']
+            while level:
+                next_level = []
+                for relative, record, was_listed in pool.imap_unordered(self.scan_directory, level):
+                    if record is None:
+                        continue
+                    seen[relative] = record
+                    listed += was_listed
+                    next_level.extend(os.path.join(relative, name) for name in record['dirs'])
+                level = next_level
+        finally:
+            pool.close()
+        # Directories that are gone are dropped
+        self.dirs = seen
+        self.scanned = time.time()
+        return listed
+
+    def summary(self):
+        """{type: (files, bytes)} over the whole tree"""
+        totals = {}
+        for record in self.dirs.values():
+            for kind, (files, size) in record['types'].items():
+                total = totals.setdefault(kind, [0, 0])
+                total[0] += files
+                total[1] += size
+        return dict((kind, tuple(total)) for kind, total in totals.items())
@@ -0,0 +1,114 @@
+"""
+Content tab: what's installed in content_root, by type
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import threading
+import time
+
+from gi.repository import GLib, GObject, Gtk
+
+from .content import ContentIndex
+from .procmon import format_bytes
+
+
+class ContentPage(object):
+    """
+    Shows the saved index right away and rescans in a worker thread, which
+    only lists directories that changed since the last scan
+    """
+
+    def __init__(self, get_root, get_index_path):
+        """
+        :param: get_root: returns the content_root to inventory
+        :param: get_index_path: returns where to keep the index
+        """
+        self.get_root = get_root
+        self.get_index_path = get_index_path
+        self.index = None
+        self.scanning = False
+
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.widget.set_border_width(10)
+        header = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(header, False, True, 0)
+        self.root_label = Gtk.Label()
+        self.root_label.set_alignment(0.0, 0.5)
+        header.pack_start(self.root_label, True, True, 0)
+        self.rescan_button = Gtk.Button(label="Rescan")
+        self.rescan_button.connect('clicked', lambda button: self.rescan())
+        header.pack_end(self.rescan_button, False, False, 0)
+
+        # Type, files, size as text and bytes to sort by
+        self.types = Gtk.ListStore(GObject.TYPE_STRING, GObject.TYPE_INT64, GObject.TYPE_STRING,
+                                   GObject.TYPE_INT64)
+        self.types.set_sort_column_id(3, Gtk.SortType.DESCENDING)
+        treeview = Gtk.TreeView(model=self.types)
+        for title, column, sort_column in (("Type", 0, 0), ("Files", 1, 1), ("Size", 2, 3)):
+            tree_column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=column)
+            tree_column.set_sort_column_id(sort_column)
+            treeview.append_column(tree_column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(treeview)
+        self.widget.pack_start(scrolled, True, True, 0)
+
+        self.status_label = Gtk.Label()
+        self.status_label.set_alignment(0.0, 0.5)
+        self.widget.pack_start(self.status_label, False, True, 0)
+
+    def is_started(self):
+        return self.index is not None
+
+    def start(self):
+        """Shows the saved index, if any, and rescans"""
+        root = self.get_root()
+        self.index = ContentIndex(root, self.get_index_path())
+        self.root_label.set_label(root)
+        if self.index.load():
+            self.show_summary(self.index, None, None)
+        self.rescan()
+
+    def rescan(self):
+        if self.scanning:
+            return
+        if self.index is None or self.index.root != self.get_root():
+            self.start()
+            return
+        self.scanning = True
+        self.rescan_button.set_sensitive(False)
+        self.status_label.set_label("Scanning...")
+        thread = threading.Thread(target=self.scan, args=(self.index,))
+        thread.daemon = True
+        thread.start()
+
+    def scan(self, index):
+        """Runs in a worker thread"""
+        started = time.time()
+        listed = index.scan()
+        index.save()
+        GLib.idle_add(self.on_scanned, index, listed, time.time() - started)
+
+    def on_scanned(self, index, listed, elapsed):
+        self.scanning = False
+        self.rescan_button.set_sensitive(True)
+        if index is self.index:
+            self.show_summary(index, listed, elapsed)
+        return False
+
+    def show_summary(self, index, listed, elapsed):
+        self.types.clear()
+        summary = index.summary()
+        for kind, (files, size) in summary.items():
+            self.types.append([kind, files, format_bytes(size), size])
+        files = sum(files for files, __ in summary.values())
+        size = sum(size for __, size in summary.values())
+        label = "{} files, {} in {} directories".format(files, format_bytes(size), len(index.dirs))
+        if elapsed is not None:
+            label += ", scanned in {:.1f}s ({} directories changed)".format(elapsed, listed)
+        elif index.scanned:
+            label += ", as of {:%Y-%m-%d %H:%M}".format(datetime.datetime.fromtimestamp(index.scanned))
+        self.status_label.set_label(label)
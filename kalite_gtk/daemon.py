@@ -0,0 +1,314 @@
+"""
+Long-lived control helper for the KA Lite server
+
+The helper is started once per session under the user owning the server
+(through cli.conditional_sudo, so at most one privilege prompt) and the GUI
+sends it requests over a Unix domain socket. Status requests are answered
+by the warm helper itself, with the HTTP probe, and control commands run
+kalite without another privilege prompt.
+
+The kalite executable and KALITE_HOME are fixed on the helper's command
+line, when the prompt is answered, so a request can't make it run
+anything else. Messages are JSON objects, one per line. A request is
+
+    {"command": "start", "args": ["--port=8008"], "port": 8008}
+
+and is answered with any number of {"stdout": line} messages followed by
+one {"stderr": text, "returncode": n} message, i.e. the same values
+cli.stream_kalite_command yields.
+
+Run the helper with:
+
+    python -m kalite_gtk.daemon --socket NAME --allow-uid UID --kalite PATH --home PATH
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import getpass
+import hashlib
+import json
+import logging
+import os
+import pwd
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from . import cli
+from .broker import OPTION
+
+logger = logging.getLogger(__name__)
+
+# Commands the helper accepts, anything else is refused
+KALITE_COMMANDS = ('start', 'stop', 'restart', 'diagnose')
+COMMANDS = KALITE_COMMANDS + ('status', 'ping', 'shutdown')
+
+# Seconds the helper stays alive without any request
+IDLE_TIMEOUT = 30 * 60
+
+# Seconds to wait for a freshly started helper to listen, this includes
+# the time it takes to answer the privilege prompt
+START_TIMEOUT = 60
+
+
+def get_socket_name(username, kalite, home):
+    """
+    Name in the abstract socket namespace, there's no file whose
+    permissions the users would have to share. Access is instead checked
+    with SO_PEERCRED, on both ends. Every kalite and home has its own
+    helper.
+    """
+    server = hashlib.sha1('{}\0{}'.format(kalite, home).encode('utf-8')).hexdigest()[:12]
+    return '\0kalite-gtk-{}-{}-{}'.format(username, os.getuid(), server)
+
+
+def send_message(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def peer_uid(sock):
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize(str('3i')))
+    __, uid, __ = struct.unpack(str('3i'), creds)
+    return uid
+
+
+class Daemon(object):
+
+    def __init__(self, socket_name, allowed_uids, kalite, home):
+        self.socket_name = socket_name
+        self.kalite = kalite
+        self.home = home
+        self.allowed_uids = set(allowed_uids) | set([os.getuid()])
+        self.last_request = time.time()
+        self.running = True
+
+    def serve_forever(self):
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_name)
+        server.listen(5)
+        server.settimeout(60)
+        logger.info("Control helper listening as {}".format(getpass.getuser()))
+        while self.running:
+            try:
+                conn, __ = server.accept()
+            except socket.timeout:
+                if time.time() - self.last_request > IDLE_TIMEOUT:
+                    logger.info("Control helper idle, exiting")
+                    break
+                continue
+            if not self.running:
+                conn.close()
+                break
+            if peer_uid(conn) not in self.allowed_uids:
+                logger.error("Refused connection from uid {}".format(peer_uid(conn)))
+                conn.close()
+                continue
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+        server.close()
+
+    def handle(self, conn):
+        try:
+            for line in conn.makefile('rb'):
+                self.last_request = time.time()
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    send_message(conn, {'stderr': "Invalid request\n", 'returncode': 1})
+                    continue
+                for message in self.respond(request):
+                    send_message(conn, message)
+        except socket.error as e:
+            logger.debug("Client went away: {}".format(e))
+        finally:
+            conn.close()
+
+    def respond(self, request):
+        if not isinstance(request, dict):
+            yield {'stderr': "Invalid request\n", 'returncode': 1}
+            return
+        command = request.get('command')
+        if command not in COMMANDS:
+            yield {'stderr': "Unknown command: {}\n".format(command), 'returncode': 1}
+            return
+        if command == 'ping':
+            yield {'stderr': '', 'returncode': 0}
+            return
+        if command == 'shutdown':
+            self.running = False
+            # Wake up the accept() of serve_forever so it sees we're done
+            wakeup = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            wakeup.connect(self.socket_name)
+            wakeup.close()
+            yield {'stderr': '', 'returncode': 0}
+            return
+        try:
+            port = int(request['port'])
+        except (KeyError, TypeError, ValueError):
+            yield {'stderr': "Invalid port\n", 'returncode': 1}
+            return
+        args = request.get('args', [])
+        if not isinstance(args, list) or not all(isinstance(arg, type('')) and OPTION.match(arg)
+                                                 for arg in args):
+            yield {'stderr': "Invalid arguments\n", 'returncode': 1}
+            return
+        options = {
+            'port': port,
+            'home': self.home,
+            'command': self.kalite,
+        }
+        if command == 'status':
+            err, returncode = cli.status(options)
+            yield {'stderr': err, 'returncode': returncode}
+            return
+        cmd = cli.get_command(command, options) + args
+        for stdout, stderr, returncode in cli.stream_kalite_command(cmd, env=cli.get_env(options)):
+            if stdout is not None:
+                yield {'stdout': stdout}
+            else:
+                yield {'stderr': stderr, 'returncode': returncode}
+
+
+class DaemonClient(object):
+    """
+    Talks to the control helper of one user, kalite and home, starting it
+    on first use
+    """
+
+    def __init__(self, username, kalite, home):
+        self.username = username
+        self.kalite = kalite
+        self.home = home
+        self.socket_name = get_socket_name(username, kalite, home)
+        # Anyone may bind the socket name first, so the helper answering
+        # must run as the user, or as root
+        self.allowed_uids = set([0])
+        try:
+            self.allowed_uids.add(pwd.getpwnam(username).pw_uid)
+        except KeyError:
+            logger.error("Unknown user: {}".format(username))
+        # The helper, or the sudo frontend running it
+        self.process = None
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_name)
+        except socket.error:
+            sock.close()
+            return None
+        uid = peer_uid(sock)
+        if uid not in self.allowed_uids:
+            logger.error("Refused control helper of uid {}, it's not run by {}".format(uid, self.username))
+            sock.close()
+            return None
+        return sock
+
+    def is_running(self):
+        sock = self.connect()
+        if sock is None:
+            return False
+        sock.close()
+        return True
+
+    def ensure_started(self):
+        """
+        Blocking:
+        Starts the helper unless it's running, returns whether it's up
+        """
+        if self.is_running():
+            return True
+        cmd = cli.conditional_sudo([
+            sys.executable, '-m', 'kalite_gtk.daemon',
+            '--socket', self.socket_name[1:],
+            '--allow-uid', str(os.getuid()),
+            '--kalite', self.kalite,
+            '--home', self.home,
+        ])
+        logger.info("Starting control helper: {}".format(cmd))
+        self.process = subprocess.Popen(cmd, close_fds=True)
+        # Reap it whenever it exits
+        reaper = threading.Thread(target=self.process.wait)
+        reaper.daemon = True
+        reaper.start()
+        deadline = time.time() + START_TIMEOUT
+        while time.time() < deadline:
+            if self.is_running():
+                return True
+            time.sleep(0.2)
+        logger.error("Control helper did not start")
+        return False
+
+    def request(self, command, args=None, options=None):
+        """
+        Sends a request and returns the connected socket to read the answer
+        from, or None if the helper isn't running
+        """
+        options = options or cli.settings
+        sock = self.connect()
+        if sock is None:
+            return None
+        try:
+            send_message(sock, {
+                'command': command,
+                'args': args or [],
+                'port': int(options['port']),
+            })
+        except socket.error as e:
+            logger.error("Can't send to the control helper: {}".format(e))
+            sock.close()
+            return None
+        return sock
+
+    def stream(self, command, args=None, options=None):
+        """
+        Generator with the same values as cli.stream_kalite_command
+        """
+        sock = self.request(command, args=args, options=options)
+        if sock is None:
+            yield None, "Control helper is not running\n", 1
+            return
+        try:
+            for line in sock.makefile('rb'):
+                message = json.loads(line.decode('utf-8'))
+                if 'returncode' in message:
+                    yield None, message.get('stderr'), message['returncode']
+                    return
+                yield message.get('stdout'), None, None
+        finally:
+            sock.close()
+
+    def status(self, options=None):
+        """
+        Blocking:
+        Same as cli.status, answered by the helper
+        """
+        for __, stderr, returncode in self.stream('status', options=options):
+            if returncode is not None:
+                return stderr, returncode
+        return None, None
+
+    def shutdown(self):
+        for __ in self.stream('shutdown'):
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KA Lite control helper")
+    parser.add_argument('--socket', required=True, help="Name in the abstract socket namespace")
+    parser.add_argument('--allow-uid', type=int, action='append', default=[],
+                        help="Also accept connections from this uid")
+    parser.add_argument('--kalite', required=True, help="The kalite executable to run")
+    parser.add_argument('--home', required=True, help="KALITE_HOME of the server")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    Daemon('\0' + args.socket, args.allow_uid, args.kalite, args.home).serve_forever()
+
+if __name__ == "__main__":
+    main()
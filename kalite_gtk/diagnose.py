@@ -0,0 +1,125 @@
+"""
+Parsing and caching the report of 'kalite diagnose'
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import logging
+import os
+import re
+import time
+
+from . import cli
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached report is shown without running diagnose again
+MAX_AGE = 24 * 60 * 60
+
+CACHE_FILE_NAME = 'kalite_gtk_diagnose.json'
+
+SECTION = 'section'
+ITEM = 'item'
+DETAIL = 'detail'
+
+SEPARATOR = re.compile(r'^\s*[-=*_]{3,}\s*$')
+KEY_VALUE = re.compile(r'^(\S[^:]{0,60}):\s+(\S.*)$')
+HEADER = re.compile(r'^(\S.{0,60}):\s*$')
+
+
+class DiagnoseParser(object):
+    """
+    Turns the lines of a diagnose report into a tree as they arrive:
+    sections with a title line ending in a colon, holding "key: value"
+    items. Lines indented further than the items of their section are
+    details of the item before them.
+    """
+
+    def __init__(self):
+        self.sections = []
+        # Indentation of the items of the current section, None until its
+        # first item
+        self.item_indent = None
+
+    def feed(self, line):
+        """
+        Returns (kind, key, value) for a line, kind being SECTION, ITEM or
+        DETAIL, or None for lines without content
+        """
+        line = line.rstrip()
+        if not line.strip() or SEPARATOR.match(line):
+            return None
+        indent = len(line) - len(line.lstrip())
+        if indent == 0:
+            match = HEADER.match(line)
+            if match:
+                self.item_indent = None
+                return self.add(SECTION, match.group(1), '')
+        if self.item_indent is None:
+            self.item_indent = indent
+        if indent > self.item_indent:
+            return self.add(DETAIL, line.strip(), '')
+        match = KEY_VALUE.match(line.strip())
+        if match:
+            return self.add(ITEM, match.group(1).strip(), match.group(2).strip())
+        return self.add(ITEM, line.strip(), '')
+
+    def add(self, kind, key, value):
+        if kind == SECTION:
+            self.sections.append({'title': key, 'items': []})
+            return kind, key, value
+        if not self.sections:
+            self.sections.append({'title': "General", 'items': []})
+        items = self.sections[-1]['items']
+        if kind == DETAIL and not items:
+            # Nothing to attach it to
+            kind = ITEM
+        if kind == ITEM:
+            items.append({'key': key, 'value': value, 'details': []})
+        else:
+            items[-1]['details'].append(key)
+        return kind, key, value
+
+
+def get_cache_path(home):
+    """
+    The cache of the server in home is ours, the server's home may belong
+    to another user
+    """
+    return cli.get_gtk_path(CACHE_FILE_NAME, home)
+
+
+def save_report(path, output, returncode, options=None):
+    """Stores the output of a diagnose run with the time it finished"""
+    report = {
+        'time': time.time(),
+        'output': output,
+        'returncode': returncode,
+        'options': options or {},
+    }
+    try:
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(report))
+    except (IOError, OSError) as e:
+        logger.error("Can't cache diagnostics in {}: {}".format(path, e))
+
+
+def load_report(path):
+    """The stored report, None if there's none"""
+    try:
+        with io.open(path, encoding='utf-8') as f:
+            return json.loads(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def is_stale(report, options=None, max_age=MAX_AGE):
+    """Whether a report is too old, or is about another server"""
+    if report is None:
+        return True
+    if options is not None and report.get('options') != options:
+        return True
+    return time.time() - report.get('time', 0) > max_age
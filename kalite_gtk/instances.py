@@ -0,0 +1,161 @@
+"""
+Several KA Lite servers controlled from one window
+
+An instance is a dict with the same 'user', 'home', 'port' and 'command'
+keys as the settings, and a unique 'name', so the functions of cli take it
+as their options.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+from . import cli
+from .exceptions import ValidationError
+
+logger = logging.getLogger(__name__)
+
+INSTANCES_FILE = os.path.join(os.path.dirname(cli.KALITE_GTK_SETTINGS_FILE), 'ka-lite-gtk-instances.json')
+
+FIELDS = ('name', 'user', 'home', 'port', 'command')
+
+# Threads checking the status of instances, shared by all of them. Most
+# checks are answered by the HTTP probe within its timeout.
+STATUS_WORKERS = 8
+
+
+def clean(instance):
+    """
+    Returns the instance with validated values, raises ValidationError
+    """
+    cleaned = {}
+    for field in FIELDS:
+        value = instance.get(field)
+        if value is None or not str(value).strip():
+            raise ValidationError("{} is missing".format(field.capitalize()))
+        if field in cli.validate:
+            value = cli.validate[field](value)
+        cleaned[field] = value.strip() if field in ('name', 'home') else value
+    if not os.path.isabs(cleaned['home']):
+        raise ValidationError("Home must be an absolute path")
+    return cleaned
+
+
+class InstanceRegistry(object):
+    """The instances, in the order they were added, kept in a file"""
+
+    def __init__(self, path=INSTANCES_FILE):
+        self.path = path
+        self.instances = []
+
+    def load(self):
+        text = cli.read_text(self.path)
+        if text is None:
+            return
+        try:
+            self.instances = json.loads(text)['instances']
+        except (ValueError, KeyError, TypeError):
+            logger.error("Can't read instances from {}".format(self.path))
+
+    def save(self):
+        cli.write_atomic(self.path, json.dumps({'instances': self.instances}, sort_keys=True, indent=2))
+
+    def get(self, name):
+        for instance in self.instances:
+            if instance['name'] == name:
+                return instance
+        return None
+
+    def add(self, instance):
+        """
+        Validates and adds an instance, raises ValidationError if it's
+        invalid or clashes with another one
+        """
+        instance = clean(instance)
+        for other in self.instances:
+            if other['name'] == instance['name']:
+                raise ValidationError("There already is an instance named {}".format(instance['name']))
+            if int(other['port']) == int(instance['port']):
+                raise ValidationError("Port {} is used by {}".format(instance['port'], other['name']))
+            if other['home'] == instance['home']:
+                raise ValidationError("{} is the home of {}".format(instance['home'], other['name']))
+        self.instances.append(instance)
+        return instance
+
+    def remove(self, name):
+        self.instances = [instance for instance in self.instances if instance['name'] != name]
+
+    def __iter__(self):
+        return iter(self.instances)
+
+    def __len__(self):
+        return len(self.instances)
+
+
+class StatusPool(object):
+    """
+    Checks the status of many instances at once on a fixed number of
+    threads. An instance still being checked isn't queued again, so slow
+    servers don't pile up work.
+    """
+
+    def __init__(self, workers=STATUS_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.checking = set()
+        self.lock = threading.Lock()
+
+    def get_pool(self):
+        if self.pool is None:
+            self.pool = ThreadPool(self.workers)
+        return self.pool
+
+    def check(self, instances, callback):
+        """
+        Non-blocking:
+        Queues a status check of every instance, callback(instance,
+        (message, returncode)) is called from a pool thread as each one
+        finishes. Returns the number of checks queued.
+        """
+        queued = 0
+        for instance in instances:
+            with self.lock:
+                if instance['name'] in self.checking:
+                    continue
+                self.checking.add(instance['name'])
+            self.get_pool().apply_async(self.run_check, (instance, callback))
+            queued += 1
+        return queued
+
+    def run_check(self, instance, callback):
+        try:
+            result = cli.status(instance)
+        except Exception as e:
+            logger.debug("Status of {} failed".format(instance['name']), exc_info=True)
+            result = str(e), None
+        finally:
+            with self.lock:
+                self.checking.discard(instance['name'])
+        callback(instance, result)
+
+    def run(self, func, args, callback):
+        """Runs func(*args) on the pool and passes its result to callback"""
+        self.get_pool().apply_async(func, args, callback=callback)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+
+def control_command(kalite_command, instance):
+    """The command running a kalite subcommand for instance"""
+    return cli.conditional_sudo(
+        cli.get_command(kalite_command, instance) + cli.get_kalite_args(kalite_command, instance),
+        options=instance,
+    )
@@ -0,0 +1,292 @@
+"""
+Instances tab: the status of several KA Lite servers, and starting,
+stopping and restarting them one by one or together
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import getpass
+import logging
+
+from gi.repository import GLib, Gtk
+
+from . import cli
+from .broker import failed, kalite_operation
+from .exceptions import ValidationError
+from .instances import StatusPool, control_command
+from .spawn import spawn_kalite_command
+
+logger = logging.getLogger(__name__)
+
+# Seconds between status checks while the tab is shown
+REFRESH_INTERVAL = 5
+
+# Columns of the list
+NAME, PORT, USER, HOME, STATUS, ICON = range(6)
+
+STATUS_ICONS = {
+    cli.STATUS_RUNNING: 'media-playback-start',
+    cli.STATUS_STOPPED: 'media-playback-stop',
+}
+
+BUSY_LABELS = {
+    'start': "Starting...",
+    'stop': "Stopping...",
+    'restart': "Restarting...",
+}
+
+
+class InstancesPage(object):
+    """
+    Lists the instances of an InstanceRegistry. Their status is checked
+    on a shared StatusPool, commands run as a child process each, or in a
+    single batch of the privileged helper for those of other users.
+    """
+
+    def __init__(self, registry, broker, log_message):
+        """
+        :param: registry: an instances.InstanceRegistry
+        :param: broker: the broker.BrokerClient of the session
+        :param: log_message: writes to the log tab
+        """
+        self.registry = registry
+        self.broker = broker
+        self.log_message = log_message
+        self.status_pool = StatusPool()
+        self.refresh_source = None
+        # Names of instances a command is running for
+        self.busy = set()
+
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.widget.set_border_width(10)
+
+        self.store = Gtk.ListStore(str, str, str, str, str, str)
+        self.treeview = Gtk.TreeView(model=self.store)
+        self.treeview.get_selection().set_mode(Gtk.SelectionMode.MULTIPLE)
+        icon_column = Gtk.TreeViewColumn("", Gtk.CellRendererPixbuf(), icon_name=ICON)
+        self.treeview.append_column(icon_column)
+        for title, column in (("Name", NAME), ("Port", PORT), ("User", USER), ("Home", HOME),
+                              ("Status", STATUS)):
+            tree_column = Gtk.TreeViewColumn(title, Gtk.CellRendererText(), text=column)
+            tree_column.set_sort_column_id(column)
+            tree_column.set_resizable(True)
+            self.treeview.append_column(tree_column)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(self.treeview)
+        self.widget.pack_start(scrolled, True, True, 0)
+
+        buttons = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(buttons, False, True, 0)
+        for label, callback in (("Add...", self.on_add_clicked), ("Remove", self.on_remove_clicked)):
+            button = Gtk.Button(label=label)
+            button.connect('clicked', callback)
+            buttons.pack_start(button, False, False, 0)
+        for label, command in (("Restart", 'restart'), ("Stop", 'stop'), ("Start", 'start')):
+            button = Gtk.Button(label=label)
+            button.connect('clicked', lambda button, command=command: self.control(command))
+            buttons.pack_end(button, False, False, 0)
+
+        hint = Gtk.Label(label="Start, Stop and Restart act on the selected instances, or all of them")
+        hint.set_alignment(0.0, 0.5)
+        self.widget.pack_start(hint, False, True, 0)
+
+    def populate(self):
+        self.store.clear()
+        for instance in self.registry:
+            self.store.append([
+                instance['name'], str(instance['port']), instance['user'], instance['home'], '', '',
+            ])
+
+    def find_row(self, name):
+        for row in self.store:
+            if row[NAME] == name:
+                return row
+        return None
+
+    def set_row_status(self, name, status, icon=''):
+        row = self.find_row(name)
+        if row is not None:
+            row[STATUS] = status
+            row[ICON] = icon
+
+    def is_started(self):
+        return self.refresh_source is not None
+
+    def start(self):
+        """Reads the registry and starts checking the instances"""
+        self.registry.load()
+        self.populate()
+        self.refresh()
+        self.refresh_source = GLib.timeout_add_seconds(REFRESH_INTERVAL, self.refresh)
+
+    def stop(self):
+        if self.refresh_source is not None:
+            GLib.source_remove(self.refresh_source)
+            self.refresh_source = None
+        self.status_pool.close()
+
+    def refresh(self):
+        if not self.widget.get_mapped():
+            # Nothing to show while another tab is shown
+            return True
+        self.check([instance for instance in self.registry if instance['name'] not in self.busy])
+        return True
+
+    def check(self, instances):
+        self.status_pool.check(
+            instances,
+            lambda instance, result: GLib.idle_add(self.on_status, instance['name'], result),
+        )
+
+    def on_status(self, name, result):
+        message, returncode = result
+        if name in self.busy:
+            # The command's outcome is shown until it's done
+            return False
+        if returncode == cli.STATUS_RUNNING:
+            status = "Running"
+        elif returncode == cli.STATUS_STOPPED:
+            status = "Stopped"
+        else:
+            status = (message or "Unknown").strip().split('\n')[0]
+        self.set_row_status(name, status, STATUS_ICONS.get(returncode, 'dialog-question'))
+        return False
+
+    def get_selected(self):
+        """The selected instances, all of them if none is selected"""
+        model, paths = self.treeview.get_selection().get_selected_rows()
+        names = set(model[path][NAME] for path in paths)
+        return [instance for instance in self.registry if not names or instance['name'] in names]
+
+    def control(self, command):
+        instances = [instance for instance in self.get_selected() if instance['name'] not in self.busy]
+        if not instances:
+            return
+        other_users = []
+        for instance in instances:
+            self.busy.add(instance['name'])
+            self.set_row_status(instance['name'], BUSY_LABELS[command])
+            self.log_message("{}: {}\n".format(instance['name'], BUSY_LABELS[command]))
+            if cli.needs_su(instance):
+                other_users.append(instance)
+            else:
+                spawn_kalite_command(
+                    control_command(command, instance),
+                    lambda stdout, stderr, returncode, instance=instance:
+                        self.on_output(command, instance, stdout, stderr, returncode),
+                    env=cli.get_env(instance),
+                )
+        if other_users:
+            # One batch, so one privilege prompt at most, for all of them
+            self.status_pool.run(
+                self.run_batch,
+                ([kalite_operation(command, instance) for instance in other_users],),
+                lambda results: GLib.idle_add(self.on_batch_done, command, other_users, results),
+            )
+
+    def run_batch(self, operations):
+        """Runs in the pool, any failure is a result so the rows are freed"""
+        try:
+            return self.broker.run(operations, keep_going=True)
+        except Exception as e:
+            logger.exception("Running {} failed".format(operations))
+            return failed("{}\n".format(e), 1)
+
+    def on_batch_done(self, command, instances, results):
+        if len(results) < len(instances):
+            # Nothing was run, e.g. the prompt was dismissed
+            results = results * len(instances) if len(results) == 1 else [
+                {'stdout': '', 'stderr': "Not run\n", 'returncode': 1} for __ in instances
+            ]
+        for instance, result in zip(instances, results):
+            for line in result['stdout'].splitlines(True):
+                self.on_output(command, instance, line, None, None)
+            self.on_output(command, instance, None, result['stderr'], result['returncode'])
+        return False
+
+    def on_output(self, command, instance, stdout, stderr, returncode):
+        name = instance['name']
+        if stdout:
+            self.log_message("{}: {}".format(name, stdout))
+            return
+        if stderr:
+            self.log_message("{}: {}".format(name, stderr))
+        if returncode:
+            self.log_message("{}: {} failed\n".format(name, command))
+        self.busy.discard(name)
+        self.set_row_status(name, "{} failed".format(command.capitalize()) if returncode else "", '')
+        self.check([instance])
+
+    def on_add_clicked(self, button):
+        dialog = InstanceDialog(self.widget.get_toplevel())
+        try:
+            while dialog.run() == Gtk.ResponseType.OK:
+                try:
+                    instance = self.registry.add(dialog.get_instance())
+                except ValidationError as e:
+                    dialog.set_error(str(e))
+                    continue
+                self.save()
+                self.populate()
+                self.check([instance])
+                break
+        finally:
+            dialog.destroy()
+
+    def on_remove_clicked(self, button):
+        model, paths = self.treeview.get_selection().get_selected_rows()
+        names = [model[path][NAME] for path in paths]
+        if not names:
+            return
+        for name in names:
+            self.registry.remove(name)
+        self.save()
+        self.populate()
+
+    def save(self):
+        try:
+            self.registry.save()
+        except (IOError, OSError) as e:
+            logger.error("Can't save instances to {}: {}".format(self.registry.path, e))
+
+
+class InstanceDialog(Gtk.Dialog):
+    """Asks for the fields of a new instance, prefilled from the settings"""
+
+    def __init__(self, parent):
+        Gtk.Dialog.__init__(self, title="Add instance", transient_for=parent, modal=True)
+        self.add_button("Cancel", Gtk.ResponseType.CANCEL)
+        self.add_button("Add", Gtk.ResponseType.OK)
+        self.set_default_response(Gtk.ResponseType.OK)
+
+        grid = Gtk.Grid(row_spacing=6, column_spacing=12)
+        grid.set_border_width(10)
+        self.get_content_area().add(grid)
+        self.entries = {}
+        defaults = {
+            'name': '',
+            'user': getpass.getuser(),
+            'home': '',
+            'port': '',
+            'command': cli.settings['command'],
+        }
+        for row, field in enumerate(('name', 'user', 'home', 'port', 'command')):
+            label = Gtk.Label(label=field.capitalize())
+            label.set_alignment(0.0, 0.5)
+            grid.attach(label, 0, row, 1, 1)
+            entry = Gtk.Entry(text=defaults[field], activates_default=True)
+            entry.set_hexpand(True)
+            grid.attach(entry, 1, row, 1, 1)
+            self.entries[field] = entry
+        self.error_label = Gtk.Label()
+        self.error_label.set_alignment(0.0, 0.5)
+        grid.attach(self.error_label, 0, row + 1, 2, 1)
+        self.show_all()
+
+    def get_instance(self):
+        return dict((field, entry.get_text()) for field, entry in self.entries.items())
+
+    def set_error(self, message):
+        self.error_label.set_markup('<span color="red">{}</span>'.format(GLib.markup_escape_text(message)))
@@ -0,0 +1,183 @@
+"""
+Line index over a memory-mapped log file
+
+Lets a viewer fetch any range of lines, or find the line for a point in
+time, without reading the whole file into memory.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import datetime
+import logging
+import mmap
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 64 bit offsets where available, Python 2 has no 'Q' typecode
+try:
+    OFFSET_TYPECODE = 'Q'
+    array.array(OFFSET_TYPECODE)
+except ValueError:
+    OFFSET_TYPECODE = 'L'
+
+# Lines between progress callbacks while building the index
+PROGRESS_LINES = 100000
+
+# Lines looked at after a binary search probe to find one with a timestamp
+TIMESTAMP_SCAN_LINES = 200
+
+# Timestamps of Python logging ("2016-10-18 10:00:00,123") and of
+# CherryPy's access log ("[18/Oct/2016:10:00:00]")
+ISO_TIMESTAMP = re.compile(r'^(\d{4}-\d{2}-\d{2})[ T](\d{2}:\d{2}:\d{2})')
+ACCESS_TIMESTAMP = re.compile(r'\[(\d{2}/\w{3}/\d{4}):(\d{2}:\d{2}:\d{2})')
+
+
+def parse_timestamp(line):
+    """Returns the datetime a log line starts with, otherwise None"""
+    match = ISO_TIMESTAMP.search(line[:40])
+    if match:
+        return datetime.datetime.strptime(' '.join(match.groups()), '%Y-%m-%d %H:%M:%S')
+    match = ACCESS_TIMESTAMP.search(line[:80])
+    if match:
+        try:
+            return datetime.datetime.strptime(' '.join(match.groups()), '%d/%b/%Y %H:%M:%S')
+        except ValueError:
+            return None
+    return None
+
+
+class LineIndex(object):
+    """
+    Offsets of the start of every complete line of a file. build() indexes
+    whatever was appended since the last call, so it's cheap to repeat
+    while the file grows. It may run in a worker thread while other
+    threads read lines that are already indexed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = array.array(OFFSET_TYPECODE)
+        # End of the last complete line indexed
+        self.end = 0
+        self._inode = None
+        self._mmap = None
+        self._lock = threading.Lock()
+        self.cancelled = False
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def inode(self):
+        """Inode of the file indexed, None until build() ran"""
+        return self._inode
+
+    def _map(self):
+        """(Re)maps the file, starting over if it was replaced or truncated"""
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self._inode or st.st_size < self.end:
+                self.offsets = array.array(OFFSET_TYPECODE)
+                self.end = 0
+                self._inode = st.st_ino
+            if st.st_size == 0:
+                return None
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._mmap = mapped
+        return mapped
+
+    def build(self, progress=None):
+        """
+        Blocking:
+        Indexes new lines, calling progress(line_count) now and then.
+        Returns the number of lines.
+        """
+        self.cancelled = False
+        try:
+            mapped = self._map()
+        except (IOError, OSError) as e:
+            logger.error("Can't index {}: {}".format(self.path, e))
+            return len(self)
+        if mapped is None:
+            return 0
+        pos = self.end
+        offsets = self.offsets
+        find = mapped.find
+        append = offsets.append
+        try:
+            while not self.cancelled:
+                newline = find(b'\n', pos)
+                if newline == -1:
+                    break
+                append(pos)
+                pos = newline + 1
+                self.end = pos
+                if progress and len(offsets) % PROGRESS_LINES == 0:
+                    progress(len(offsets))
+        except ValueError:
+            # close() unmapped the file after the check of cancelled
+            logger.debug("Stopped indexing {}, it was closed".format(self.path))
+            return len(offsets)
+        if progress:
+            progress(len(offsets))
+        return len(offsets)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def get_lines(self, start, count):
+        """Returns up to count lines from line number start"""
+        stop = min(start + count, len(self.offsets))
+        if start >= stop:
+            return []
+        with self._lock:
+            begin = self.offsets[start]
+            end = self.offsets[stop] if stop < len(self.offsets) else self.end
+            data = self._mmap[begin:end]
+        # Not splitlines(), which also splits on characters that aren't in
+        # the index
+        return [line + '\n' for line in data.decode('utf-8', 'replace').split('\n')[:-1]]
+
+    def get_line(self, number):
+        lines = self.get_lines(number, 1)
+        return lines[0] if lines else None
+
+    def timestamp_at(self, number):
+        """
+        The first timestamp at or after line number, looking at a limited
+        number of lines, with its line number
+        """
+        for i, line in enumerate(self.get_lines(number, TIMESTAMP_SCAN_LINES)):
+            timestamp = parse_timestamp(line)
+            if timestamp:
+                return timestamp, number + i
+        return None, None
+
+    def find_timestamp(self, when):
+        """
+        Binary search for the first line logged at or after datetime when
+        """
+        lo, hi = 0, len(self.offsets)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            timestamp, number = self.timestamp_at(mid)
+            if timestamp is None or timestamp >= when:
+                hi = mid
+            else:
+                lo = number + 1
+        return lo
+
+    def close(self):
+        self.cancel()
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._mmap = None
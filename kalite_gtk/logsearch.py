@@ -0,0 +1,179 @@
+"""
+Searching and filtering log lines by text, level and time
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import collections
+import logging
+import re
+import time
+
+from .logindex import parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+LEVELS = (
+    ('DEBUG', logging.DEBUG),
+    ('INFO', logging.INFO),
+    ('WARNING', logging.WARNING),
+    ('ERROR', logging.ERROR),
+    ('CRITICAL', logging.CRITICAL),
+)
+
+LEVEL_PATTERN = re.compile(r'\b(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL)\b')
+
+LEVEL_VALUES = dict(LEVELS)
+LEVEL_VALUES['WARN'] = logging.WARNING
+
+# Lines given per call to get_lines while scanning
+CHUNK_LINES = 5000
+
+NO_TIME = float('nan')
+
+
+def parse_level(line):
+    match = LEVEL_PATTERN.search(line[:120])
+    if match:
+        return LEVEL_VALUES[match.group(1)]
+    return None
+
+
+class LineList(object):
+    """Lines of a text with the interface of logindex.LineIndex"""
+
+    def __init__(self, text):
+        self.lines = [line + '\n' for line in text.split('\n')]
+        if self.lines and self.lines[-1] == '\n':
+            self.lines.pop()
+
+    def __len__(self):
+        return len(self.lines)
+
+    def get_lines(self, start, count):
+        return self.lines[start:start + count]
+
+
+class Query(object):
+
+    def __init__(self, text='', regex=False, ignore_case=True, min_level=None, since=None, until=None):
+        """
+        :param: text: substring or, with regex, regular expression to find
+        :param: min_level: a logging level, lines below it are left out
+        :param: since, until: datetimes bounding the time of lines
+        """
+        self.text = text
+        self.regex = regex
+        self.ignore_case = ignore_case
+        self.min_level = min_level
+        self.since = since
+        self.until = until
+        flags = re.UNICODE | (re.IGNORECASE if ignore_case else 0)
+        self.pattern = re.compile(text if regex else re.escape(text), flags) if text else None
+        self.since_ts = time.mktime(since.timetuple()) if since else None
+        self.until_ts = time.mktime(until.timetuple()) if until else None
+
+    def key(self):
+        return (self.text, self.regex, self.ignore_case, self.min_level, self.since, self.until)
+
+    def accepts(self, level, timestamp):
+        """Whether the level and time of a line pass the filters"""
+        if self.min_level is not None and level < self.min_level:
+            return False
+        if self.since_ts is not None and not timestamp >= self.since_ts:
+            return False
+        if self.until_ts is not None and not timestamp <= self.until_ts:
+            return False
+        return True
+
+
+class SearchIndex(object):
+    """
+    Level and time of every line of a line source, so filtering needs no
+    parsing and only lines passing the filters are matched against the
+    text. Lines without a level or time, like tracebacks, get those of the
+    line before them.
+
+    Both the metadata and the matches of recent queries are extended as the
+    source grows, so repeating a query only scans new lines.
+    """
+
+    # Queries whose matches are remembered
+    MAX_CACHED_QUERIES = 10
+
+    def __init__(self, source):
+        self.source = source
+        self.levels = array.array('i')
+        self.times = array.array('d')
+        self._results = collections.OrderedDict()
+        self.cancelled = False
+        # Inode and first line of the source indexed
+        self.identity = None
+
+    def get_identity(self):
+        first_lines = self.source.get_lines(0, 1) if len(self.source) else []
+        return getattr(self.source, 'inode', None), first_lines[0] if first_lines else None
+
+    def update(self):
+        """Computes level and time of lines added to the source"""
+        identity = self.get_identity()
+        if len(self.source) < len(self.levels) or identity != self.identity:
+            # The source started over, e.g. a truncated, rotated or another
+            # file
+            self.identity = identity
+            self.levels = array.array('i')
+            self.times = array.array('d')
+            self._results.clear()
+        level = self.levels[-1] if self.levels else 0
+        timestamp = self.times[-1] if self.times else NO_TIME
+        while len(self.levels) < len(self.source) and not self.cancelled:
+            lines = self.source.get_lines(len(self.levels), CHUNK_LINES)
+            if not lines:
+                break
+            for line in lines:
+                parsed_level = parse_level(line)
+                if parsed_level is not None:
+                    level = parsed_level
+                parsed_time = parse_timestamp(line)
+                if parsed_time is not None:
+                    timestamp = time.mktime(parsed_time.timetuple())
+                self.levels.append(level)
+                self.times.append(timestamp)
+
+    def search(self, query):
+        """
+        Generator of (line_number, line) for lines matching query
+        """
+        self.cancelled = False
+        self.update()
+        key = query.key()
+        scanned, matches = self._results.pop(key, (0, []))
+        # Most recently used last
+        self._results[key] = (scanned, matches)
+        while len(self._results) > self.MAX_CACHED_QUERIES:
+            del self._results[next(iter(self._results))]
+
+        for number in list(matches):
+            yield number, self.source.get_lines(number, 1)[0]
+
+        for start in range(scanned, len(self.levels), CHUNK_LINES):
+            if self.cancelled:
+                return
+            lines = self.source.get_lines(start, CHUNK_LINES)
+            chunk_matches = []
+            for offset, line in enumerate(lines):
+                number = start + offset
+                if not query.accepts(self.levels[number], self.times[number]):
+                    continue
+                if query.pattern and not query.pattern.search(line):
+                    continue
+                chunk_matches.append(number)
+                yield number, line
+            # Only whole chunks are remembered, the consumer may stop early
+            matches.extend(chunk_matches)
+            self._results[key] = (start + len(lines), matches)
+
+    def cancel(self):
+        self.cancelled = True
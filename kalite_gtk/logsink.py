@@ -0,0 +1,143 @@
+"""
+Batched writing of log output into a Gtk.TextBuffer
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import logging
+import logging.handlers
+import threading
+
+try:
+    from gi.repository import GLib
+except ImportError:
+    # Only write() needs GLib, trimming is tested without it
+    GLib = None
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds between flushes, i.e. about once per frame
+FLUSH_INTERVAL = 50
+
+# Maximum number of messages inserted by one flush
+MAX_FLUSH = 500
+
+# Messages kept waiting for a flush before the oldest are dropped
+MAX_PENDING = 10000
+
+# Lines dropped at once when the scrollback overflows, so trimming only
+# happens every TRIM_CHUNK lines rather than on every insert
+TRIM_CHUNK = 500
+
+# Size and number of rotated spill files
+SPILL_MAX_BYTES = 5 * 1024 * 1024
+SPILL_BACKUP_COUNT = 3
+
+
+def get_spill_logger(name, path, max_bytes=SPILL_MAX_BYTES, backup_count=SPILL_BACKUP_COUNT):
+    """
+    A logger writing trimmed scrollback verbatim to a rotating file at path
+    """
+    spill = logging.getLogger('kalite_gtk.scrollback.{}'.format(name))
+    if not spill.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count
+        )
+        handler.terminator = ''
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        spill.addHandler(handler)
+        spill.setLevel(logging.INFO)
+        # Don't repeat the scrollback in kalite_gtk.log
+        spill.propagate = False
+    return spill
+
+
+class LogSink(object):
+    """
+    Collects messages from any thread in a ring buffer and inserts them into
+    a Gtk.TextBuffer with one bulk insert per flush, instead of one idle
+    callback per line.
+
+    If max_lines or max_chars are set, the oldest text is dropped in chunks
+    once the buffer exceeds them, and passed to the spill logger if given.
+    """
+
+    def __init__(self, buffer, interval=FLUSH_INTERVAL, max_flush=MAX_FLUSH, max_pending=MAX_PENDING,
+                 max_lines=None, max_chars=None, spill=None):
+        self.buffer = buffer
+        self.interval = interval
+        self.max_flush = max_flush
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.spill = spill
+        self._pending = collections.deque(maxlen=max_pending)
+        self._dropped = 0
+        self._lock = threading.Lock()
+        self._source_id = None
+
+    def configure(self, max_lines=None, max_chars=None, spill=None):
+        """Sets the limits of the scrollback, applied from the next flush"""
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self.spill = spill
+
+    def write(self, msg):
+        """Thread safe: queues msg for the next flush"""
+        with self._lock:
+            if len(self._pending) == self._pending.maxlen:
+                self._dropped += 1
+            self._pending.append(msg)
+            # The timer only runs while there is something to flush
+            if self._source_id is None:
+                self._source_id = GLib.timeout_add(self.interval, self._flush)
+
+    def _take(self):
+        with self._lock:
+            count = min(len(self._pending), self.max_flush)
+            msgs = [self._pending.popleft() for __ in range(count)]
+            dropped, self._dropped = self._dropped, 0
+            more = bool(self._pending)
+            if not more:
+                self._source_id = None
+            return msgs, dropped, more
+
+    def _flush(self):
+        msgs, dropped, more = self._take()
+        if dropped:
+            msgs.insert(0, "[... {} lines dropped ...]\n".format(dropped))
+        if msgs:
+            self.buffer.insert(self.buffer.get_end_iter(), ''.join(msgs))
+            self.trim()
+        # Keep the timer while a backlog remains
+        return more
+
+    def trim(self):
+        """Drops the oldest text once the buffer exceeds its limits"""
+        end = None
+        if self.max_lines:
+            line_count = self.buffer.get_line_count()
+            if line_count > self.max_lines + TRIM_CHUNK:
+                end = self.buffer.get_iter_at_line(line_count - self.max_lines)
+        if self.max_chars:
+            char_count = self.buffer.get_char_count()
+            if char_count > self.max_chars + TRIM_CHUNK * 80:
+                char_end = self.buffer.get_iter_at_offset(char_count - self.max_chars)
+                # Cut at a line boundary
+                if not char_end.starts_line():
+                    char_end.forward_line()
+                if end is None or char_end.compare(end) > 0:
+                    end = char_end
+        if end is None:
+            return
+        start = self.buffer.get_start_iter()
+        if self.spill:
+            self.spill.info(self.buffer.get_text(start, end, True))
+        self.buffer.delete(start, end)
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._dropped = 0
+        self.buffer.set_text('')
@@ -0,0 +1,103 @@
+"""
+Incremental reading of a growing log file
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import codecs
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Bytes shown from the end of the file when we start following it
+INITIAL_BYTES = 64 * 1024
+
+# If more than this was appended since the last read, skip to the last
+# INITIAL_BYTES instead of reading it all
+MAX_BACKLOG = 4 * 1024 * 1024
+
+
+class LogTailer(object):
+    """
+    Follows a log file like 'tail -F': every read() returns the text
+    appended since the previous one. A file that is truncated is read
+    again from the start, and when the path is rotated to a new file the
+    rest of the old file is read before switching over.
+    """
+
+    def __init__(self, path, initial_bytes=INITIAL_BYTES, max_backlog=MAX_BACKLOG):
+        self.path = path
+        self.initial_bytes = initial_bytes
+        self.max_backlog = max_backlog
+        self.offset = 0
+        self._file = None
+        self._inode = None
+        self._decoder = None
+
+    def _open(self, from_end):
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return False
+        self._file = f
+        self._inode = os.fstat(f.fileno()).st_ino
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.offset = 0
+        if from_end:
+            self._skip_to_end()
+        return True
+
+    def _skip_to_end(self):
+        """Positions at the start of a line in the last initial_bytes"""
+        size = os.fstat(self._file.fileno()).st_size
+        if size > self.initial_bytes:
+            self._file.seek(size - self.initial_bytes)
+            self._file.readline()
+        else:
+            self._file.seek(0)
+        self.offset = self._file.tell()
+        self._decoder.reset()
+
+    def _read_available(self):
+        size = os.fstat(self._file.fileno()).st_size
+        skipped = ''
+        if size - self.offset > self.max_backlog:
+            skipped = "[... skipped {} bytes ...]\n".format(size - self.offset - self.initial_bytes)
+            self._skip_to_end()
+        data = self._file.read(size - self.offset)
+        self.offset += len(data)
+        return skipped + self._decoder.decode(data)
+
+    def read(self):
+        """Returns the text appended since the last call"""
+        if self._file is None:
+            # Only the very first file is followed from its end, anything
+            # after a rotation is new
+            if not self._open(from_end=self._inode is None):
+                return ''
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            # Rotated away and not recreated yet, the old file may still
+            # be written to
+            inode = self._inode
+        if inode != self._inode:
+            rest = self._read_available()
+            self.close()
+            self._inode = inode
+            if not self._open(from_end=False):
+                return rest
+            return rest + self._read_available()
+        if os.fstat(self._file.fileno()).st_size < self.offset:
+            logger.debug("{} was truncated".format(self.path))
+            self._file.seek(0)
+            self.offset = 0
+            self._decoder.reset()
+        return self._read_available()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
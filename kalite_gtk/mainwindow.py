@@ -1,20 +1,65 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
 import logging
 import os
 import subprocess
 import shlex
+import time
+from multiprocessing.pool import ThreadPool
 
-from gi.repository import Gtk, Gdk, GLib, Pango
+from gi.repository import Gio, Gtk, Gdk, GLib, Pango
 from pkg_resources import resource_filename  # @UnresolvedImport
 
+from . import checks
 from . import cli
-from kalite_gtk.exceptions import ValidationError
+from . import content
+from . import diagnose
+from . import trace
+from .logsink import LogSink, get_spill_logger
+from .contentpage import ContentPage
+from .instances import InstanceRegistry
+from .instancespage import InstancesPage
+from .metrics import sparkline
+from .metricspage import MetricsPage
+from .procmon import ProcessMonitor, format_bytes
+from .scheduler import Backoff
+from .searchpage import SOURCE_LOG, SOURCE_SERVER_LOG, SearchPage
+from .serverlog import ServerLogPage
+from .settingswatch import SettingsWatcher
+from .urllist import UrlList
+from .broker import KALITE_COMMANDS as BROKER_COMMANDS, BrokerClient, kalite_operation
+from .daemon import DaemonClient
+from .validators import ValidationCache
+from .spawn import spawn_broker_command, spawn_daemon_command, spawn_kalite_command
 
 
 logger = logging.getLogger(__name__)
 
+# Seconds from process start to the first frame of the window that we
+# aim for on a Raspberry Pi class machine
+FIRST_FRAME_TARGET = 1.5
+
+# Seconds between samples of the server's resource usage, and samples
+# shown in its sparklines
+RESOURCE_INTERVAL = 2
+RESOURCE_SPARK_SAMPLES = 20
+
+# Icons of the results of quick checks
+CHECK_ICONS = {
+    checks.OK: '',
+    checks.WARNING: 'dialog-warning',
+    checks.ERROR: 'dialog-error',
+    None: 'dialog-question',
+}
+
+# Milliseconds of quiet after typing before a field is validated
+VALIDATE_DELAY = 300
+
+# Commands during which the status is checked every second
+BUSY_COMMANDS = ('start', 'stop', 'restart')
+
 
 def run_async(func):
     """
@@ -56,81 +101,130 @@ class Handler:
         # This only includes valid settings
         self.unsaved_settings = {}
         self.mainwindow = mainwindow
+        # Fields waiting to be validated, by setting: the value typed and
+        # the debounce timeout
+        self.pending_values = {}
+        self.pending_timeouts = {}
+        # Error messages of invalid fields, by setting
+        self.invalid_settings = {}
+        self.validation_cache = ValidationCache(cli.validate)
 
     def on_delete_window(self, *args):
+        daemon = self.mainwindow.get_daemon()
+        if daemon and daemon.is_running():
+            daemon.shutdown()
+        self.mainwindow.instances_page.stop()
+        self.mainwindow.broker.close()
         Gtk.main_quit(*args)
 
-    @run_async
+    def run_kalite(self, kalite_command, cmd, callback):
+        """
+        Runs a kalite subcommand through the control helper if it's running,
+        as another user through the privileged helper, otherwise spawns cmd
+        """
+        if kalite_command in BUSY_COMMANDS:
+            self.mainwindow.begin_busy()
+            on_output = callback
+
+            def callback(stdout, stderr, returncode):
+                if stdout is None:
+                    self.mainwindow.end_busy()
+                on_output(stdout, stderr, returncode)
+
+        daemon = self.mainwindow.get_daemon()
+        if daemon and spawn_daemon_command(
+            daemon, kalite_command, callback, args=cli.get_kalite_args(kalite_command)
+        ):
+            return
+        if kalite_command in BROKER_COMMANDS and cli.needs_su():
+            # One privilege prompt for the session instead of one per command
+            spawn_broker_command(self.mainwindow.broker, [kalite_operation(kalite_command)], callback)
+            return
+        spawn_kalite_command(cmd, callback, env=cli.get_env())
+
     def on_start_button_clicked(self, button):
         self.log_message("Starting KA Lite...\n")
-        GLib.idle_add(button.set_sensitive, False)
-        GLib.idle_add(self.mainwindow.goto_log_page)
-        for stdout, stderr, returncode in cli.start():
+        button.set_sensitive(False)
+        self.mainwindow.goto_log_page()
+
+        def on_output(stdout, stderr, returncode):
             if stdout:
                 self.log_message(stdout)
-        if returncode == 0:
-            self.log_message("KA Lite started!\n")
-        elif stderr:
-            self.log_message(stderr)
-        GLib.idle_add(button.set_sensitive, True)
-        GLib.idle_add(self.mainwindow.update_status)
+                return
+            if returncode == 0:
+                self.log_message("KA Lite started!\n")
+            elif stderr:
+                self.log_message(stderr)
+            button.set_sensitive(True)
+            self.mainwindow.update_status()
+
+        self.run_kalite('start', cli.start_command(), on_output)
 
-    @run_async
     def on_stop_button_clicked(self, button):
-        GLib.idle_add(button.set_sensitive, False)
-        GLib.idle_add(self.mainwindow.goto_log_page)
+        button.set_sensitive(False)
+        self.mainwindow.goto_log_page()
         self.log_message("Stopping KA Lite...\n")
-        for stdout, stderr, returncode in cli.stop():
+
+        def on_output(stdout, stderr, returncode):
             if stdout:
                 self.log_message(stdout)
-        if returncode:
-            self.log_message("Failed to stop\n")
-        if stderr:
-            self.log_message(stderr)
-        GLib.idle_add(button.set_sensitive, True)
-        GLib.idle_add(self.mainwindow.update_status)
+                return
+            if returncode:
+                self.log_message("Failed to stop\n")
+            if stderr:
+                self.log_message(stderr)
+            button.set_sensitive(True)
+            self.mainwindow.update_status()
+
+        self.run_kalite('stop', cli.stop_command(), on_output)
 
-    @run_async
     def on_diagnose_button_clicked(self, button):
-        GLib.idle_add(button.set_sensitive, False)
-        start_iter = self.mainwindow.diagnostics.get_start_iter()
-        end_iter = self.mainwindow.diagnostics.get_end_iter()
-        GLib.idle_add(lambda: self.mainwindow.diagnostics.delete(start_iter, end_iter))
-        stdout, stderr, returncode = cli.diagnose()
-        if stdout:
-            GLib.idle_add(self.mainwindow.diagnostics_message, stdout)
-        if stderr:
-            GLib.idle_add(self.mainwindow.diagnostics_message, stderr)
-        if returncode:
-            GLib.idle_add(self.mainwindow.set_status, "Failed to diagnose!")
-        GLib.idle_add(button.set_sensitive, True)
+        button.set_sensitive(False)
+        self.mainwindow.begin_diagnose_report()
 
-    @run_async
-    def on_startup_service_button_clicked(self, button):
-        GLib.idle_add(button.set_sensitive, False)
-        GLib.idle_add(self.mainwindow.goto_log_page)
-        if cli.is_installed():
-            self.log_message("Removing startup service\n")
-            stdout, stderr, returncode = cli.remove()
+        def on_output(stdout, stderr, returncode):
             if stdout:
-                self.log_message(stdout)
+                self.mainwindow.diagnose_report_line(stdout)
+                return
             if stderr:
-                self.log_message(stderr)
+                self.mainwindow.diagnostics_message(stderr)
             if returncode:
-                self.log_message("Failed to remove startup service\n")
-            self.log_message("Removed!\n")
+                self.mainwindow.set_status("Failed to diagnose!")
+            self.mainwindow.end_diagnose_report(returncode)
+            button.set_sensitive(True)
+
+        self.run_kalite('diagnose', cli.diagnose_command(), on_output)
+
+    def on_quick_check_button_clicked(self, button):
+        self.mainwindow.run_quick_checks()
+
+    def on_startup_service_button_clicked(self, button):
+        button.set_sensitive(False)
+        self.mainwindow.goto_log_page()
+        if cli.is_installed():
+            self.log_message("Removing startup service\n")
+            operation = {'op': 'remove_service'}
+            failed_msg = "Failed to remove startup service\n"
+            done_msg = "Removed!\n"
         else:
             self.log_message("Installing startup service\n")
-            stdout, stderr, returncode = cli.install()
+            operation = {'op': 'install_service'}
+            failed_msg = "Failed to install startup service\n"
+            done_msg = "Installed!\n"
+
+        def on_output(stdout, stderr, returncode):
             if stdout:
                 self.log_message(stdout)
+                return
             if stderr:
                 self.log_message(stderr)
             if returncode:
-                self.log_message("Failed to install startup service\n")
-            self.log_message("Installed!\n")
-        GLib.idle_add(self.mainwindow.set_from_settings)
-        GLib.idle_add(button.set_sensitive, True)
+                self.log_message(failed_msg)
+            self.log_message(done_msg)
+            self.mainwindow.set_from_settings()
+            button.set_sensitive(True)
+
+        spawn_broker_command(self.mainwindow.broker, [operation], on_output)
 
     def on_username_entry_changed(self, entry):
         value = entry.get_text()
@@ -138,8 +232,7 @@ class Handler:
             self.mainwindow.default_user_radio_button.set_active(True)
             return
         self.mainwindow.username_radiobutton.set_active(True)
-        self.unsaved_settings['user'] = value
-        self.settings_changed()
+        self.setting_changed('user', value)
 
     @run_async
     def on_save_and_restart_button_clicked(self, button):
@@ -148,177 +241,550 @@ class Handler:
         """
         cli.settings.update(self.unsaved_settings)
         logger.info("Saving settings: {}".format(cli.settings))
-        cli.save_settings()
+        # Saving may block on a privilege prompt, so it stays off the main
+        # loop, the restart itself is spawned from it. Both go through the
+        # privileged helper, which only prompts once.
+        cli.save_settings(self.mainwindow.broker)
         self.unsaved_settings = {}
-        GLib.idle_add(button.set_sensitive, False)
-        GLib.idle_add(
-            self.mainwindow.settings_feedback_label.set_label,
+        GLib.idle_add(self.restart, button)
+
+    def restart(self, button):
+        button.set_sensitive(False)
+        self.mainwindow.settings_feedback_label.set_label(
             'Settings saved, restarting server...'
         )
         self.log_message("Restarting KA Lite...\n")
-        GLib.idle_add(self.mainwindow.goto_log_page)
-        GLib.idle_add(self.mainwindow.start_button.set_sensitive, False)
-        for stdout, stderr, returncode in cli.restart():
+        self.mainwindow.goto_log_page()
+        self.mainwindow.start_button.set_sensitive(False)
+
+        def on_output(stdout, stderr, returncode):
             if stdout:
                 self.log_message(stdout)
-        if returncode == 0:
-            self.log_message("KA Lite restarted!\n")
-        elif stderr:
-            self.log_message(stderr)
-        GLib.idle_add(self.mainwindow.start_button.set_sensitive, True)
-        self.mainwindow.update_status()
+                return
+            if returncode == 0:
+                self.log_message("KA Lite restarted!\n")
+            elif stderr:
+                self.log_message(stderr)
+            self.mainwindow.start_button.set_sensitive(True)
+            self.mainwindow.update_status()
+
+        self.run_kalite('restart', cli.restart_command(), on_output)
 
     def on_radiobutton_user_default_clicked(self, radiobutton):
-        if 'user' in self.unsaved_settings and self.unsaved_settings['user'] == cli.DEFAULT_USER:
-            del self.unsaved_settings['user']
-            self.settings_changed()
+        if radiobutton.get_active():
+            self.setting_changed('user', cli.environment.default_user)
 
     def on_radiobutton_username_clicked(self, radiobutton):
         if radiobutton.get_active():
             self.mainwindow.username_entry.grab_focus()
 
     def on_open_log_button_clicked(self, button):
-        subprocess.Popen(shlex.split('xdg-open') + [os.path.join(cli.settings['home'], 'server.log')])
+        subprocess.Popen(shlex.split('xdg-open') + [cli.get_server_log()])
 
     def on_open_content_button_clicked(self, button):
         subprocess.Popen(shlex.split('xdg-open') + [cli.settings['content_root']])
 
     def on_port_spinbutton_value_changed(self, spinbutton):
-        self.unsaved_settings['port'] = spinbutton.get_value_as_int()
-        if 'port' in self.unsaved_settings:
-            if self.unsaved_settings['port'] == int(cli.settings['port']):
-                del self.unsaved_settings['port']
-        self.settings_changed()
+        self.setting_changed('port', spinbutton.get_value_as_int())
 
     def on_kalite_command_entry_changed(self, entry):
-        self.unsaved_settings['command'] = entry.get_text()
-        if 'command' in self.unsaved_settings:
-            if self.unsaved_settings['command'] == cli.settings['command']:
-                del self.unsaved_settings['command']
-        self.settings_changed()
+        self.setting_changed('command', entry.get_text())
 
-    def settings_changed(self):
+    def setting_changed(self, setting, value):
         """
-        Called when settings are changed
+        Called when a field is changed. Only that field is validated, once
+        typing has paused for VALIDATE_DELAY.
         """
+        if setting in self.pending_timeouts:
+            GLib.source_remove(self.pending_timeouts.pop(setting))
+        self.pending_values.pop(setting, None)
+        self.invalid_settings.pop(setting, None)
+        self.unsaved_settings.pop(setting, None)
 
-        if not self.unsaved_settings:
-            GLib.idle_add(
-                self.mainwindow.settings_feedback_label.set_label,
-                "No settings changed. Settings will not take effect until you save and reload"
-            )
-            GLib.idle_add(self.mainwindow.save_and_restart_button.set_sensitive, False)
+        if str(value) == str(cli.settings[setting]):
+            self.settings_changed()
             return
+        if setting not in cli.validate:
+            self.unsaved_settings[setting] = value
+            self.settings_changed()
+            return
+        self.pending_values[setting] = value
+        self.pending_timeouts[setting] = GLib.timeout_add(VALIDATE_DELAY, self.on_validate_timeout, setting)
+        self.settings_changed()
 
-        for setting, value in self.unsaved_settings.items():
-            if setting not in cli.validate:
-                continue
-            try:
-                value = cli.validate[setting](value)
-                self.unsaved_settings[setting] = value
-            except ValidationError as e:
-                self.mainwindow.settings_feedback_label.set_label(
-                    e.err_msg
-                )
-                del self.unsaved_settings[setting]
-
-        if not self.unsaved_settings:
-            GLib.idle_add(self.mainwindow.save_and_restart_button.set_sensitive, False)
+    def on_validate_timeout(self, setting):
+        del self.pending_timeouts[setting]
+        self.validate_setting(setting, self.pending_values[setting])
+        return False
+
+    @run_async
+    def validate_setting(self, setting, value):
+        cleaned, error = self.validation_cache.validate(setting, value)
+        GLib.idle_add(self.on_setting_validated, setting, value, cleaned, error)
+
+    def on_setting_validated(self, setting, value, cleaned, error):
+        if setting not in self.pending_values or self.pending_values[setting] != value:
+            # Changed again since
+            return
+        del self.pending_values[setting]
+        if error:
+            self.invalid_settings[setting] = error
         else:
+            self.unsaved_settings[setting] = cleaned
+        self.settings_changed()
+
+    def settings_changed(self):
+        """
+        Updates the feedback and the save button after a change
+        """
+        if self.invalid_settings:
+            self.mainwindow.settings_feedback_label.set_label(
+                next(iter(self.invalid_settings.values()))
+            )
+        elif self.pending_values:
+            self.mainwindow.settings_feedback_label.set_label("Checking settings...")
+        elif self.unsaved_settings:
             logger.debug('Unsaved settings: {}'.format(self.unsaved_settings))
-            GLib.idle_add(self.mainwindow.save_and_restart_button.set_sensitive, True)
             self.mainwindow.settings_feedback_label.set_label(
                 "Settings are valid - click 'Save and restart'."
             )
+        else:
+            self.mainwindow.settings_feedback_label.set_label(
+                "No settings changed. Settings will not take effect until you save and reload"
+            )
+        self.mainwindow.save_and_restart_button.set_sensitive(
+            bool(self.unsaved_settings) and not self.invalid_settings and not self.pending_values
+        )
 
     def log_message(self, msg):
-        """Logs a message using idle callback"""
-        GLib.idle_add(self.mainwindow.log_message, msg)
+        """Logs a message, safe to call from any thread"""
+        self.mainwindow.log_message(msg)
+
+
+def style_like_terminal(textview):
+    textview.override_font(
+        Pango.font_description_from_string('DejaVu Sans Mono 9')
+    )
+    textview.override_background_color(
+        Gtk.StateFlags.NORMAL, Gdk.RGBA(0, 0, 0, 1))
+    textview.override_color(
+        Gtk.StateFlags.NORMAL, Gdk.RGBA(1, 1, 1, 1))
+    textview.override_background_color(
+        Gtk.StateFlags.SELECTED, Gdk.RGBA(0.7, 1, 0.5, 1))
 
 
 class MainWindow:
 
-    def __init__(self):
+    def __init__(self, started=None):
+
+        # Time the process started, used to measure time to first frame
+        self.started = started or time.time()
 
         self.builder = Gtk.Builder()
         glade_file = resource_filename(__name__, "glade/mainwindow.glade")
-        self.builder.add_from_file(glade_file)
+        with trace.span('load glade', file='mainwindow.glade'):
+            self.builder.add_from_file(glade_file)
 
         # Save glade builder XML tree objects to object properties all in
         # one place so we don't get confused. Don't call get_object other places
         # PLEASE.
         self.window = self.builder.get_object('mainwindow')
         self.log_textview = self.builder.get_object('log_textview')
-        self.diagnose_textview = self.builder.get_object('diagnose_textview')
         self.diagnostics = self.builder.get_object('diagnostics')
         self.statusbar = self.builder.get_object('statusbar')
         self.status_entry = self.builder.get_object('status_label')
         self.statusbar_box = self.builder.get_object('statusbar_box')
         self.statusbar_left_fixed = self.builder.get_object('statusbar_left_fixed')
-        self.default_user_radio_button = self.builder.get_object('radiobutton_user_default')
-        self.kalite_command_entry = self.builder.get_object('kalite_command_entry')
-        self.port_spinbutton = self.builder.get_object('port_spinbutton')
-        self.content_root_filechooserbutton = self.builder.get_object('content_root_filechooserbutton')
-        self.username_entry = self.builder.get_object('username_entry')
-        self.username_radiobutton = self.builder.get_object('radiobutton_username')
+        self.resources_label = self.builder.get_object('resources_label')
         self.log = self.builder.get_object('log')
         self.start_button = self.builder.get_object('start_button')
         self.stop_button = self.builder.get_object('stop_button')
-        self.diagnose_button = self.builder.get_object('diagnose_button')
         self.startup_service_button = self.builder.get_object('startup_service_button')
-        self.settings_feedback_label = self.builder.get_object('settings_feedback_label')
         self.start_stop_instructions_label = self.builder.get_object('start_stop_instructions_label')
-        self.save_and_restart_button = self.builder.get_object('save_and_restart_button')
         self.main_notebook = self.builder.get_object('main_notebook')
-
-        # Will contain a vertical box for URLs with clickable LinkButton
-        # elements
-        self.url_box = None
-        self.urls = []
+        self.settings_page = self.builder.get_object('settings_page')
+        self.diagnose_page = self.builder.get_object('diagnose_page')
+
+        # Widgets of the Settings and Diagnose pages, which are only built
+        # the first time they are shown, see build_settings_page and
+        # build_diagnose_page
+        self.default_user_radio_button = None
+        self.kalite_command_entry = None
+        self.port_spinbutton = None
+        self.content_root_filechooserbutton = None
+        self.username_entry = None
+        self.username_radiobutton = None
+        self.settings_feedback_label = None
+        self.save_and_restart_button = None
+        self.diagnose_textview = None
+        self.diagnose_button = None
+        self.quick_check_button = None
+        self.diagnose_treeview = None
+        self.diagnose_age_label = None
+
+        # Quick checks followed by the sections of the diagnose report,
+        # see run_quick_checks and begin_diagnose_report. Columns are name,
+        # value and icon.
+        self.diagnose_tree = Gtk.TreeStore(str, str, str)
+        self.quick_checks_iter = None
+        self.diagnose_parser = None
+        self.diagnose_output = []
+        self.diagnose_section_iter = None
+        self.diagnose_item_iter = None
+        # Set while switching pages to show a search result
+        self.showing_search_result = False
+
+        # Output is written in batches, never directly to the buffers. Their
+        # scrollback limits come from the settings, which are only loaded
+        # after the first frame, see configure_sinks.
+        self.log_sink = LogSink(self.log)
+        self.diagnostics_sink = LogSink(self.diagnostics)
+
+        # CPU, memory etc. of the server, see update_resources. Sampled on
+        # one worker while the server is running.
+        self.process_monitor = None
+        self.resource_pool = None
+        self.resource_source = None
+        self.sampling_resources = False
+
+        # Status checks are scheduled by update_status, see
+        # on_status_checked
+        self.status_backoff = Backoff()
+        self.status_source = None
+        self.status_checking = False
+        self.status_pending = False
+        self.last_status = None
+        # Reloads settings edited elsewhere, started after the first frame
+        self.settings_watcher = None
+
+        # Tells when the server writes or removes its pid file
+        self.pid_file_monitor = None
+        self.watched_server = None
+
+        # Control helpers by username, kalite and home, see get_daemon
+        self.daemons = {}
+        # Privileged helper of this session, started on first use
+        self.broker = BrokerClient()
+
+        # Links to the server, updated with the status
+        self.url_list = UrlList()
+        self.statusbar_left_fixed.put(self.url_list.widget, 0, 0)
 
         # Save old label so we can continue to replace text
         self.start_stop_instructions_label_original_text = self.start_stop_instructions_label.get_label()
 
         # Auto-connect handlers defined in mainwindow.glade
-        self.builder.connect_signals(Handler(self))
+        self.handler = Handler(self)
+        self.builder.connect_signals(self.handler)
+
+        # Follows server.log once it's first shown
+        self.server_log_page = ServerLogPage(style=style_like_terminal)
+        self.main_notebook.append_page(self.server_log_page.widget, Gtk.Label(label="Server log"))
+
+        # Aggregates the access lines read by the Server log page
+        self.metrics_page = MetricsPage()
+        self.server_log_page.readers.append(self.metrics_page.feed)
+        self.main_notebook.append_page(self.metrics_page.widget, Gtk.Label(label="Metrics"))
+
+        # Inventory of content_root
+        self.content_page = ContentPage(
+            lambda: cli.settings['content_root'],
+            lambda: content.get_index_path(cli.settings['home']),
+        )
+        self.main_notebook.append_page(self.content_page.widget, Gtk.Label(label="Content"))
+
+        # Other KA Lite servers on this machine
+        self.instances_page = InstancesPage(InstanceRegistry(), self.broker, self.log_message)
+        self.main_notebook.append_page(self.instances_page.widget, Gtk.Label(label="Instances"))
+
+        # Searches the buffers above and server.log
+        self.search_page = SearchPage(
+            lambda name: getattr(self, name),
+            cli.get_server_log,
+            on_activate=self.on_search_result_activated,
+        )
+        self.main_notebook.append_page(self.search_page.widget, Gtk.Label(label="Search"))
+
+        self.main_notebook.connect('switch-page', self.on_switch_page)
 
         # Style the log like a terminal
-        self.log_textview.override_font(
-            Pango.font_description_from_string('DejaVu Sans Mono 9')
+        style_like_terminal(self.log_textview)
+
+        # Show widgets, everything that probes the system waits for the
+        # first frame. Connected after the window's own handler, so it runs
+        # once the frame is painted.
+        self.first_frame_handler = self.window.connect_after('draw', self.on_first_frame)
+        self.window.show_all()
+
+    def on_first_frame(self, widget, cr):
+        self.window.disconnect(self.first_frame_handler)
+        time_to_first_frame = time.time() - self.started
+        trace.record('time to first frame', self.started, self.started + time_to_first_frame)
+        if time_to_first_frame > FIRST_FRAME_TARGET:
+            logger.warning("First frame after {:.3f}s, target is {:.3f}s".format(
+                time_to_first_frame, FIRST_FRAME_TARGET))
+        else:
+            logger.info("First frame after {:.3f}s".format(time_to_first_frame))
+        # Idle callbacks only run once the frame is on screen, this also
+        # checks the status for the first time
+        GLib.idle_add(self.set_from_settings)
+        GLib.idle_add(self.configure_sinks)
+        GLib.idle_add(self.start_daemon)
+        GLib.idle_add(self.watch_settings)
+        return False
+
+    def watch_settings(self):
+        self.settings_watcher = SettingsWatcher(cli.settings, self.set_from_settings)
+        return False
+
+    def get_daemon(self):
+        """
+        Client of the control helper for the current user, kalite and home,
+        None unless the helper is enabled
+        """
+        if not cli.settings['use_daemon']:
+            return None
+        key = (cli.settings['user'], cli.settings['command'], cli.settings['home'])
+        if key not in self.daemons:
+            self.daemons[key] = DaemonClient(*key)
+        return self.daemons[key]
+
+    def start_daemon(self):
+        """Starts the control helper in the background if it's enabled"""
+        daemon = self.get_daemon()
+        if daemon is not None:
+            self.ensure_daemon(daemon)
+        return False
+
+    @run_async
+    def ensure_daemon(self, daemon):
+        if daemon.ensure_started():
+            GLib.idle_add(self.update_status)
+
+    def on_switch_page(self, notebook, page, page_num):
+        if page == self.settings_page and self.settings_page.get_children() == []:
+            self.build_settings_page()
+        elif page == self.diagnose_page:
+            if self.diagnose_page.get_children() == []:
+                self.build_diagnose_page()
+            self.refresh_diagnostics(rerun_stale=not self.showing_search_result)
+        elif page == self.server_log_page.widget and not self.server_log_page.is_started():
+            self.server_log_page.start(cli.get_server_log())
+        elif page == self.instances_page.widget and not self.instances_page.is_started():
+            self.instances_page.start()
+        elif page == self.content_page.widget and not self.content_page.is_started():
+            self.content_page.start()
+        elif page == self.metrics_page.widget and not self.metrics_page.is_started():
+            if not self.server_log_page.is_started():
+                self.server_log_page.start(cli.get_server_log())
+            self.metrics_page.start()
+
+    def on_search_result_activated(self, source, line_number):
+        """Shows a line found on the Search page where it came from"""
+        if source == SOURCE_SERVER_LOG:
+            self.main_notebook.set_current_page(self.main_notebook.page_num(self.server_log_page.widget))
+            self.server_log_page.show_line(cli.get_server_log(), line_number)
+            return
+        if source == SOURCE_LOG:
+            self.goto_log_page()
+            textview = self.log_textview
+        else:
+            # Builds the page if it's the first time it's shown, without
+            # replacing a stale report by a new run
+            self.showing_search_result = True
+            try:
+                self.main_notebook.set_current_page(self.main_notebook.page_num(self.diagnose_page))
+            finally:
+                self.showing_search_result = False
+            textview = self.diagnose_textview
+        # The buffer may have been trimmed since the search
+        line_iter = textview.get_buffer().get_iter_at_line(line_number)
+        textview.scroll_to_iter(line_iter, 0, True, 0, 0.3)
+
+    def build_page(self, page, glade_name, root_id):
+        """
+        Loads a page's widgets from their own glade file into the
+        placeholder box of the notebook
+        """
+        with trace.span('build page', file=glade_name):
+            builder = Gtk.Builder()
+            builder.add_from_file(resource_filename(__name__, "glade/{}".format(glade_name)))
+            page.pack_start(builder.get_object(root_id), True, True, 0)
+            builder.connect_signals(self.handler)
+            page.show_all()
+        return builder
+
+    def build_settings_page(self):
+        builder = self.build_page(self.settings_page, 'settings.glade', 'scrolledwindow1')
+        self.default_user_radio_button = builder.get_object('radiobutton_user_default')
+        self.kalite_command_entry = builder.get_object('kalite_command_entry')
+        self.port_spinbutton = builder.get_object('port_spinbutton')
+        self.content_root_filechooserbutton = builder.get_object('content_root_filechooserbutton')
+        self.username_entry = builder.get_object('username_entry')
+        self.username_radiobutton = builder.get_object('radiobutton_username')
+        self.settings_feedback_label = builder.get_object('settings_feedback_label')
+        self.save_and_restart_button = builder.get_object('save_and_restart_button')
+        self.set_settings_page_from_settings()
+
+    def build_diagnose_page(self):
+        builder = self.build_page(self.diagnose_page, 'diagnose.glade', 'box4')
+        self.diagnose_textview = builder.get_object('diagnose_textview')
+        self.diagnose_button = builder.get_object('diagnose_button')
+        self.quick_check_button = builder.get_object('quick_check_button')
+        self.diagnose_treeview = builder.get_object('diagnose_treeview')
+        self.diagnose_age_label = builder.get_object('diagnose_age_label')
+        self.diagnose_textview.set_buffer(self.diagnostics)
+
+        self.diagnose_treeview.set_model(self.diagnose_tree)
+        name_column = Gtk.TreeViewColumn("Name")
+        icon_renderer = Gtk.CellRendererPixbuf()
+        name_column.pack_start(icon_renderer, False)
+        name_column.add_attribute(icon_renderer, 'icon-name', 2)
+        name_renderer = Gtk.CellRendererText()
+        name_column.pack_start(name_renderer, True)
+        name_column.add_attribute(name_renderer, 'text', 0)
+        self.diagnose_treeview.append_column(name_column)
+        self.diagnose_treeview.append_column(
+            Gtk.TreeViewColumn("Value", Gtk.CellRendererText(), text=1)
         )
-        self.log_textview.override_background_color(
-            Gtk.StateFlags.NORMAL, Gdk.RGBA(0, 0, 0, 1))
-        self.log_textview.override_color(
-            Gtk.StateFlags.NORMAL, Gdk.RGBA(1, 1, 1, 1))
-        self.log_textview.override_background_color(
-            Gtk.StateFlags.SELECTED, Gdk.RGBA(0.7, 1, 0.5, 1))
 
         # Style the diagnose view like a terminal
-        self.diagnose_textview.override_font(
-            Pango.font_description_from_string('DejaVu Sans Mono 9')
-        )
-        self.diagnose_textview.override_background_color(
-            Gtk.StateFlags.NORMAL, Gdk.RGBA(0, 0, 0, 1))
-        self.diagnose_textview.override_color(
-            Gtk.StateFlags.NORMAL, Gdk.RGBA(1, 1, 1, 1))
-        self.diagnose_textview.override_background_color(
-            Gtk.StateFlags.SELECTED, Gdk.RGBA(0.7, 1, 0.5, 1))
+        style_like_terminal(self.diagnose_textview)
 
-        # Load settings into widgets
-        self.set_from_settings()
+    def get_diagnose_options(self):
+        """What a cached diagnose report must have been made for"""
+        return {
+            'home': cli.settings['home'],
+            'port': int(cli.settings['port']),
+            'command': cli.settings['command'],
+        }
 
-        # Show widgets
-        self.window.show_all()
+    def refresh_diagnostics(self, rerun_stale=True):
+        """
+        Runs the quick checks and shows the cached diagnose report. A full
+        diagnose is only run by request, or to refresh a stale report
+        unless rerun_stale is False.
+        """
+        if self.quick_check_button.get_sensitive():
+            self.run_quick_checks()
+        if not self.diagnose_button.get_sensitive():
+            # Diagnose is running
+            return
+        path = diagnose.get_cache_path(cli.settings['home'])
+        report = diagnose.load_report(path)
+        if report is None:
+            self.diagnose_age_label.set_label("Run a full diagnose for the details from 'kalite diagnose'")
+            return
+        if rerun_stale and diagnose.is_stale(report, self.get_diagnose_options()):
+            self.handler.on_diagnose_button_clicked(self.diagnose_button)
+            return
+        if self.diagnose_output:
+            # Already showing it
+            return
+        self.begin_diagnose_report()
+        for line in report['output'].splitlines(True):
+            self.diagnose_report_line(line)
+        self.set_diagnose_age(report['time'])
+
+    def run_quick_checks(self):
+        self.quick_check_button.set_sensitive(False)
+        if self.quick_checks_iter is None:
+            self.quick_checks_iter = self.diagnose_tree.insert(None, 0, ["Quick checks", '', ''])
+        child = self.diagnose_tree.iter_children(self.quick_checks_iter)
+        while child is not None and self.diagnose_tree.remove(child):
+            pass
+        self.quick_checks()
 
-        # Update status bar
-        GLib.idle_add(self.update_status)
-        GLib.timeout_add(60 * 1000, lambda: self.update_status or True)
+    @run_async
+    def quick_checks(self):
+        for result in checks.run_checks():
+            GLib.idle_add(self.add_check_result, result)
+        GLib.idle_add(self.quick_check_button.set_sensitive, True)
+
+    def add_check_result(self, result):
+        self.diagnose_tree.append(
+            self.quick_checks_iter, [result.name, result.value, CHECK_ICONS[result.severity]]
+        )
+        self.diagnose_treeview.expand_row(self.diagnose_tree.get_path(self.quick_checks_iter), False)
+
+    def begin_diagnose_report(self):
+        self.diagnostics_sink.clear()
+        # Everything but the quick checks
+        row = self.diagnose_tree.get_iter_first()
+        while row is not None:
+            if self.quick_checks_iter is not None and self.diagnose_tree.get_path(row) == \
+                    self.diagnose_tree.get_path(self.quick_checks_iter):
+                row = self.diagnose_tree.iter_next(row)
+            elif not self.diagnose_tree.remove(row):
+                row = None
+        self.diagnose_parser = diagnose.DiagnoseParser()
+        self.diagnose_output = []
+        self.diagnose_section_iter = None
+        self.diagnose_item_iter = None
+        if self.diagnose_age_label:
+            self.diagnose_age_label.set_label("Running diagnose...")
+
+    def diagnose_report_line(self, line):
+        """Adds a line of diagnose output to the text and the tree"""
+        self.diagnostics_message(line)
+        self.diagnose_output.append(line)
+        parsed = self.diagnose_parser.feed(line)
+        if parsed is None:
+            return
+        kind, key, value = parsed
+        if kind == diagnose.SECTION or self.diagnose_section_iter is None:
+            title = key if kind == diagnose.SECTION else "General"
+            self.diagnose_section_iter = self.diagnose_tree.append(None, [title, '', ''])
+            self.diagnose_item_iter = None
+            if kind == diagnose.SECTION:
+                return
+        if kind == diagnose.DETAIL and self.diagnose_item_iter is not None:
+            self.diagnose_tree.append(self.diagnose_item_iter, [key, value, ''])
+            return
+        self.diagnose_item_iter = self.diagnose_tree.append(self.diagnose_section_iter, [key, value, ''])
+        if self.diagnose_treeview:
+            self.diagnose_treeview.expand_row(self.diagnose_tree.get_path(self.diagnose_section_iter), False)
+
+    def end_diagnose_report(self, returncode):
+        if returncode:
+            if self.diagnose_age_label:
+                self.diagnose_age_label.set_label("Diagnose failed")
+            return
+        diagnose.save_report(
+            diagnose.get_cache_path(cli.settings['home']),
+            ''.join(self.diagnose_output),
+            returncode,
+            self.get_diagnose_options(),
+        )
+        self.set_diagnose_age(time.time())
+
+    def set_diagnose_age(self, finished):
+        if self.diagnose_age_label:
+            self.diagnose_age_label.set_label("Report from {:%Y-%m-%d %H:%M}".format(
+                datetime.datetime.fromtimestamp(finished)))
+
+    def configure_sinks(self):
+        """Applies the scrollback settings to the log sinks"""
+        for sink, name in ((self.log_sink, 'log'), (self.diagnostics_sink, 'diagnostics')):
+            spill = None
+            if cli.settings['scrollback_spill']:
+                path = cli.get_gtk_path('kalite_gtk_{}_scrollback.log'.format(name))
+                try:
+                    spill = get_spill_logger(name, path)
+                except (IOError, OSError) as e:
+                    logger.error("Can't keep the scrollback in {}: {}".format(path, e))
+            sink.configure(
+                max_lines=cli.settings['scrollback_lines'],
+                max_chars=cli.settings['scrollback_chars'],
+                spill=spill,
+            )
+        return False
 
     def diagnostics_message(self, msg):
-        self.diagnostics.insert_at_cursor(msg)
+        self.diagnostics_sink.write(msg)
 
     def log_message(self, msg):
-        self.log.insert_at_cursor(msg)
+        self.log_sink.write(msg)
 
     def goto_log_page(self):
         """Switches to the log tab"""
@@ -333,22 +799,48 @@ class MainWindow:
             int(page_num)
         )
 
-    def set_from_settings(self):
+    def set_from_settings(self, changed=None):
+        """
+        Shows the settings, or only those in changed, a dict of the settings
+        that changed with their new values
+        """
         # Insert username of currently running user
         label = self.start_stop_instructions_label_original_text.replace(
             '{username}', cli.settings['user']
         )
         self.start_stop_instructions_label.set_label(label)
 
+        if self.default_user_radio_button:
+            self.set_settings_page_from_settings(changed)
+
+        self.watch_server()
+
+        self.startup_service_button.set_sensitive(cli.has_init_d())
+        if cli.has_init_d():
+            if cli.is_installed():
+                self.startup_service_button.set_label("Remove system service")
+            else:
+                self.startup_service_button.set_label("Install system service")
+
+    def set_settings_page_from_settings(self, changed=None):
+        """
+        Fills in the Settings page, only the fields of the settings in
+        changed if given so other edits in progress are kept
+        """
         label = self.default_user_radio_button.get_label()
-        label = label.replace('{default}', cli.DEFAULT_USER)
+        label = label.replace('{default}', cli.environment.default_user)
         self.default_user_radio_button.set_label(label)
-        self.kalite_command_entry.set_text(cli.settings['command'])
-        self.port_spinbutton.set_value(int(cli.settings['port']))
+        if changed is None or 'command' in changed:
+            self.kalite_command_entry.set_text(cli.settings['command'])
+        if changed is None or 'port' in changed:
+            self.port_spinbutton.set_value(int(cli.settings['port']))
 
-        self.content_root_filechooserbutton.set_filename(cli.settings['content_root'])
+        if changed is None or 'content_root' in changed:
+            self.content_root_filechooserbutton.set_filename(cli.settings['content_root'])
 
-        if cli.DEFAULT_USER != cli.settings['user']:
+        if changed is not None and 'user' not in changed:
+            return
+        if cli.environment.default_user != cli.settings['user']:
             self.username_entry.set_text(cli.settings['user'])
             self.username_radiobutton.set_active(True)
             self.default_user_radio_button.set_active(False)
@@ -356,38 +848,160 @@ class MainWindow:
             self.username_radiobutton.set_active(False)
             self.default_user_radio_button.set_active(True)
 
-        self.startup_service_button.set_sensitive(cli.has_init_d())
-        if cli.has_init_d():
-            if cli.is_installed():
-                self.startup_service_button.set_label("Remove system service")
-            else:
-                self.startup_service_button.set_label("Install system service")
+    def watch_server(self):
+        """
+        Checks the status as soon as the pid file of the server is written
+        or removed, and when the server to look at changes
+        """
+        server = (cli.settings['home'], int(cli.settings['port']))
+        if server == self.watched_server:
+            return
+        self.watched_server = server
+        if self.pid_file_monitor is not None:
+            self.pid_file_monitor.cancel()
+            self.pid_file_monitor = None
+        pid_file = Gio.File.new_for_path(os.path.join(server[0], cli.PID_FILE_NAME))
+        try:
+            self.pid_file_monitor = pid_file.monitor_file(Gio.FileMonitorFlags.NONE, None)
+            self.pid_file_monitor.connect('changed', self.on_pid_file_changed)
+        except GLib.Error as e:
+            logger.info("Can't monitor the pid file: {}".format(e.message))
+        self.status_backoff.reset()
+        self.update_status()
+
+    def on_pid_file_changed(self, monitor, file, other_file, event_type):
+        self.status_backoff.reset()
+        self.update_status()
+
+    def begin_busy(self):
+        self.status_backoff.begin_busy()
+        if not self.status_checking:
+            self.schedule_status()
+
+    def end_busy(self):
+        self.status_backoff.end_busy()
+
+    def schedule_status(self):
+        """(Re)schedules the next status check"""
+        if self.status_source is not None:
+            GLib.source_remove(self.status_source)
+        self.status_source = GLib.timeout_add(
+            int(self.status_backoff.next_interval() * 1000), self.on_status_timeout
+        )
+
+    def on_status_timeout(self):
+        self.status_source = None
+        self.update_status()
+        return False
 
-    @run_async
     def update_status(self):
-        GLib.idle_add(self.set_status, "Updating status...")
-        status_msg, returncode = cli.status()
-        if returncode == 0:
-            urls = status_msg.split()
-            urls = cli.get_urls_from_status(status_msg, returncode)
-            if urls != self.urls:
-                if self.url_box:
-                    GLib.idle_add(Gtk.Container.remove, self.statusbar_left_fixed, self.url_box)
-                self.url_box = Gtk.VBox()
-                self.urls = urls
-                for url in urls:
-                    link_button = Gtk.LinkButton(url, url)
-                    link_button.set_alignment(0.0, 0.5)
-                    self.url_box.pack_start(
-                        link_button,
-                        False,
-                        False,
-                        0,
-                    )
-                self.statusbar_left_fixed.put(self.url_box, 0, 0)
-                GLib.idle_add(self.statusbar_left_fixed.show_all)
-
-        GLib.idle_add(self.set_status, "Server status: " + (status_msg or "Error fetching status").split("\n")[0])
+        """
+        Checks the status now, or right after the check in progress. Must be
+        called from the main loop.
+        """
+        if self.status_checking:
+            self.status_pending = True
+            return
+        if self.status_source is not None:
+            GLib.source_remove(self.status_source)
+            self.status_source = None
+        self.status_checking = True
+        if self.last_status is None:
+            self.set_status("Updating status...")
+        self.check_status()
+
+    def on_status_checked(self, status_msg, returncode):
+        self.status_checking = False
+        status = (status_msg, returncode)
+        self.status_backoff.update(status != self.last_status)
+        if self.process_monitor is not None and (self.last_status or (None, None))[1] != returncode:
+            # The server may have started without a pid file
+            self.process_monitor.reset()
+        self.last_status = status
+        self.watch_resources(returncode == cli.STATUS_RUNNING)
+        self.set_status("Server status: " + (status_msg or "Error fetching status").split("\n")[0])
+        # No links to a server that's down
+        self.url_list.set_urls(cli.get_urls_from_status(status_msg, returncode))
+        if self.status_pending:
+            self.status_pending = False
+            self.update_status()
+        else:
+            self.schedule_status()
+
+    @run_async
+    @trace.span('check_status')
+    def check_status(self):
+        daemon = self.get_daemon()
+        try:
+            if daemon and daemon.is_running():
+                status_msg, returncode = daemon.status()
+            else:
+                status_msg, returncode = cli.status()
+        except Exception:
+            # The next check must still be scheduled
+            logger.exception("Status check failed")
+            status_msg, returncode = None, None
+        GLib.idle_add(self.on_status_checked, status_msg, returncode)
+
+    def watch_resources(self, running):
+        """Samples the server's resources every RESOURCE_INTERVAL while it's running"""
+        if running and self.resource_source is None:
+            self.resource_source = GLib.timeout_add_seconds(RESOURCE_INTERVAL, self.update_resources)
+            self.update_resources()
+        elif not running and self.resource_source is not None:
+            GLib.source_remove(self.resource_source)
+            self.resource_source = None
+            self.clear_resources()
+
+    def update_resources(self):
+        """Samples the server's process tree on the worker, unless it's busy"""
+        home = cli.settings['home']
+        if self.process_monitor is None or self.process_monitor.home != home:
+            self.process_monitor = ProcessMonitor(home)
+        if not self.sampling_resources:
+            self.sampling_resources = True
+            if self.resource_pool is None:
+                self.resource_pool = ThreadPool(1)
+            self.resource_pool.apply_async(self.sample_resources, (self.process_monitor,))
+        return True
+
+    def sample_resources(self, monitor):
+        """Runs on the worker, always reports back so sampling goes on"""
+        try:
+            sample = monitor.sample()
+        except Exception:
+            logger.exception("Sampling the server's resources failed")
+            sample = None
+        GLib.idle_add(self.show_resources, monitor, sample)
+
+    def show_resources(self, monitor, sample):
+        """Shows the usage of the server's process tree"""
+        self.sampling_resources = False
+        if sample is None or self.resource_source is None:
+            # Nothing found, or the server stopped while sampling
+            self.clear_resources()
+            return False
+        parts = []
+        if sample.cpu_percent is not None:
+            parts.append("CPU {:.0f}% {}".format(
+                sample.cpu_percent, sparkline(monitor.series('cpu_percent', RESOURCE_SPARK_SAMPLES))))
+        parts.append("RAM {} {}".format(
+            format_bytes(sample.rss), sparkline(monitor.series('rss', RESOURCE_SPARK_SAMPLES))))
+        self.resources_label.set_label("   ".join(parts))
+
+        details = ["Server pid {}, {} processes".format(sample.pid, sample.processes),
+                   "{} threads".format(sample.threads)]
+        if sample.fds is not None:
+            details.append("{} open files".format(sample.fds))
+        read_rate, write_rate = monitor.rate('read_bytes'), monitor.rate('write_bytes')
+        if read_rate is not None:
+            details.append("I/O {}/s read, {}/s written".format(format_bytes(read_rate), format_bytes(write_rate)))
+        self.resources_label.set_tooltip_text("\n".join(details))
+        return False
+
+    def clear_resources(self):
+        self.resources_label.set_label("")
+        self.resources_label.set_tooltip_text(None)
 
     def set_status(self, status):
         self.status_entry.set_label(status)
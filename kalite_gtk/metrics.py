@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling request metrics parsed from the access lines of server.log
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import array
+import datetime
+import re
+import time
+
+# Seconds of history kept, one bucket per second
+WINDOW_SECONDS = 60
+
+# Latest latencies kept for the percentiles
+LATENCY_SAMPLES = 1024
+
+# Distinct paths counted, the least requested are dropped beyond this
+MAX_PATHS = 500
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+# Access lines of CherryPy and of Django's runserver:
+# 127.0.0.1 - - [18/Oct/2016:10:00:00] "GET /learn/ HTTP/1.1" 200 1234 "-" "Mozilla/5.0"
+# [18/Oct/2016 10:00:00] "GET /learn/ HTTP/1.1" 200 1234
+ACCESS_LINE = re.compile(
+    r'\[(?P<time>\d{2}/\w{3}/\d{4}[: ]\d{2}:\d{2}:\d{2})[^\]]*\] '
+    r'"(?P<method>[A-Z]+) (?P<path>\S+)[^"]*" (?P<status>\d{3}) (?P<size>\d+|-)(?P<rest>.*)$'
+)
+
+# A response time at the end of an access line, after any quoted fields
+QUOTED = re.compile(r'"[^"]*"')
+DURATION = re.compile(r'(?:^|\s)(\d+(?:\.\d+)?)\s*(ms|us|s)?\s*$')
+DURATION_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, None: 1.0}
+
+
+def parse_access_line(line):
+    """
+    Returns (timestamp, path, status, duration) of an access line, with
+    duration None when the line doesn't have one. Returns None for other
+    lines.
+    """
+    match = ACCESS_LINE.search(line)
+    if not match:
+        return None
+    try:
+        when = datetime.datetime.strptime(match.group('time').replace(' ', ':'), '%d/%b/%Y:%H:%M:%S')
+    except ValueError:
+        return None
+    duration = None
+    found = DURATION.search(QUOTED.sub('', match.group('rest')))
+    if found:
+        duration = float(found.group(1)) * DURATION_UNITS[found.group(2)]
+    path = match.group('path').split('?', 1)[0]
+    return time.mktime(when.timetuple()), path, int(match.group('status')), duration
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def sparkline(values):
+    """Renders values as a line of block characters"""
+    if not values:
+        return ''
+    top = max(values) or 1
+    last = len(SPARK_CHARS) - 1
+    return ''.join(SPARK_CHARS[int(round(value / top * last))] for value in values)
+
+
+class RequestMetrics(object):
+    """
+    Aggregates over the last WINDOW_SECONDS of requests. Counts live in ring
+    buffers with one slot per second and latencies in a ring of the last
+    LATENCY_SAMPLES, so memory doesn't grow with traffic.
+    """
+
+    def __init__(self, window=WINDOW_SECONDS, samples=LATENCY_SAMPLES):
+        self.window = window
+        self.seconds = array.array('d', [0] * window)
+        self.requests = array.array('L', [0] * window)
+        self.errors = array.array('L', [0] * window)
+        self.latencies = array.array('d')
+        self.samples = samples
+        self.next_sample = 0
+        self.paths = {}
+        self.partial = ''
+        self.latest = 0
+
+    def feed(self, text):
+        """Adds the access lines in text, which may end mid-line"""
+        lines = (self.partial + text).split('\n')
+        self.partial = lines.pop()
+        for line in lines:
+            parsed = parse_access_line(line)
+            if parsed:
+                self.add(*parsed)
+
+    def add(self, timestamp, path, status, duration=None):
+        second = int(timestamp)
+        slot = second % self.window
+        if second > self.seconds[slot]:
+            self.seconds[slot] = second
+            self.requests[slot] = 0
+            self.errors[slot] = 0
+        if second == self.seconds[slot]:
+            self.requests[slot] += 1
+            if status >= 500:
+                self.errors[slot] += 1
+        # Otherwise it's older than the window
+        self.latest = max(self.latest, second)
+
+        if duration is not None:
+            if len(self.latencies) < self.samples:
+                self.latencies.append(duration)
+            else:
+                self.latencies[self.next_sample] = duration
+            self.next_sample = (self.next_sample + 1) % self.samples
+
+        self.paths[path] = self.paths.get(path, 0) + 1
+        if len(self.paths) > MAX_PATHS:
+            keep = sorted(self.paths.items(), key=lambda item: -item[1])[:MAX_PATHS // 2]
+            self.paths = dict(keep)
+
+    def series(self, now=None):
+        """Requests in each of the last window seconds, oldest first"""
+        now = int(now if now is not None else max(time.time(), self.latest))
+        values = []
+        for second in range(now - self.window + 1, now + 1):
+            slot = second % self.window
+            values.append(self.requests[slot] if self.seconds[slot] == second else 0)
+        return values
+
+    def snapshot(self, now=None):
+        """Dict of the current aggregates"""
+        now = int(now if now is not None else max(time.time(), self.latest))
+        requests = errors = 0
+        for slot in range(self.window):
+            if now - self.window < self.seconds[slot] <= now:
+                requests += self.requests[slot]
+                errors += self.errors[slot]
+        latencies = sorted(self.latencies)
+        return {
+            'requests_per_second': requests / self.window,
+            'error_rate': errors / requests if requests else 0.0,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'top_paths': sorted(self.paths.items(), key=lambda item: -item[1])[:10],
+            'series': self.series(now),
+        }
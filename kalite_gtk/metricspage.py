@@ -0,0 +1,86 @@
+"""
+Metrics tab: request rate, latency, errors and top paths of the server,
+from the access lines of server.log
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from gi.repository import GLib, Gtk, Pango
+
+from .metrics import RequestMetrics, sparkline
+
+# Seconds between redraws
+REFRESH_INTERVAL = 1
+
+
+def format_seconds(value):
+    if value is None:
+        return "n/a"
+    if value < 1:
+        return "{:.0f} ms".format(value * 1000)
+    return "{:.2f} s".format(value)
+
+
+class MetricsPage(object):
+    """
+    Shows the aggregates of a RequestMetrics, which is fed the text read
+    from server.log by the Server log tab
+    """
+
+    def __init__(self):
+        self.metrics = RequestMetrics()
+        self.refresh_source = None
+
+        self.widget = Gtk.Grid(row_spacing=6, column_spacing=12)
+        self.widget.set_border_width(10)
+        self.labels = {}
+        rows = (
+            ('requests_per_second', "Requests per second"),
+            ('series', "Last minute"),
+            ('error_rate', "Server errors"),
+            ('latency', "Response time p50 / p95 / p99"),
+            ('top_paths', "Top paths"),
+        )
+        for row, (name, title) in enumerate(rows):
+            title_label = Gtk.Label(label=title)
+            title_label.set_alignment(0.0, 0.0)
+            self.widget.attach(title_label, 0, row, 1, 1)
+            label = Gtk.Label()
+            label.set_alignment(0.0, 0.0)
+            label.set_selectable(True)
+            self.widget.attach(label, 1, row, 1, 1)
+            self.labels[name] = label
+        monospace = Pango.font_description_from_string('Monospace')
+        self.labels['series'].override_font(monospace)
+        self.labels['top_paths'].override_font(monospace)
+
+    def feed(self, text):
+        self.metrics.feed(text)
+
+    def is_started(self):
+        return self.refresh_source is not None
+
+    def start(self):
+        self.refresh()
+        self.refresh_source = GLib.timeout_add_seconds(REFRESH_INTERVAL, self.refresh)
+
+    def stop(self):
+        if self.refresh_source is not None:
+            GLib.source_remove(self.refresh_source)
+            self.refresh_source = None
+
+    def refresh(self):
+        if not self.widget.get_mapped():
+            # Nothing to draw while another tab is shown
+            return True
+        snapshot = self.metrics.snapshot()
+        self.labels['requests_per_second'].set_label(
+            "{:.2f}".format(snapshot['requests_per_second']))
+        self.labels['series'].set_label(sparkline(snapshot['series']))
+        self.labels['error_rate'].set_label("{:.1%}".format(snapshot['error_rate']))
+        self.labels['latency'].set_label(" / ".join(
+            format_seconds(snapshot[key]) for key in ('p50', 'p95', 'p99')))
+        self.labels['top_paths'].set_label("\n".join(
+            "{:>6}  {}".format(count, path) for path, count in snapshot['top_paths']))
+        return True
@@ -0,0 +1,95 @@
+"""
+In-process health probe for the KA Lite HTTP server
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import errno
+import logging
+import socket
+import threading
+
+try:
+    from http.client import HTTPConnection, HTTPException
+except ImportError:
+    from httplib import HTTPConnection, HTTPException
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_TIMEOUT = 1.0
+
+
+class HTTPProbe(object):
+    """
+    Asks the server directly whether it answers on a port, reusing one
+    keep-alive connection per port between polls.
+
+    check() returns True if the server answered, False if nothing listens on
+    the port and None if the probe could not decide (timeouts, unexpected
+    socket errors). Different ports can be checked from several threads at
+    once.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.timeout = timeout
+        self._connections = {}
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, port):
+        with self._locks_lock:
+            return self._locks.setdefault(port, threading.Lock())
+
+    def _get_connection(self, port):
+        conn = self._connections.get(port)
+        if conn is None:
+            conn = HTTPConnection(self.host, port, timeout=self.timeout)
+            self._connections[port] = conn
+        return conn
+
+    def close(self, port=None):
+        ports = [port] if port is not None else list(self._connections.keys())
+        for p in ports:
+            conn = self._connections.pop(p, None)
+            if conn is not None:
+                conn.close()
+
+    def _request(self, port):
+        conn = self._get_connection(port)
+        conn.request('HEAD', '/', headers={'Connection': 'keep-alive'})
+        response = conn.getresponse()
+        response.read()
+        if response.will_close:
+            self.close(port)
+        return response.status
+
+    def check(self, port):
+        port = int(port)
+        with self._lock(port):
+            return self._check(port)
+
+    def _check(self, port):
+        # A kept-alive connection may have been dropped by the server since
+        # the last poll, so a failure on a reused connection is retried once
+        # on a fresh one.
+        reused = port in self._connections
+        for attempt in range(2 if reused else 1):
+            try:
+                status = self._request(port)
+                logger.debug("Probe of port {} answered HTTP {}".format(port, status))
+                return True
+            except socket.timeout:
+                self.close(port)
+                return None
+            except (HTTPException, socket.error) as e:
+                self.close(port)
+                if getattr(e, 'errno', None) == errno.ECONNREFUSED:
+                    return False
+                if attempt == 0 and reused:
+                    continue
+                logger.debug("Probe of port {} undecided: {}".format(port, e))
+                return None
+        return None
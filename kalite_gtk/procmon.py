@@ -0,0 +1,265 @@
+"""
+Resource usage of the KA Lite server and its children, sampled from /proc
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import logging
+import os
+import time
+
+from .cli import PID_FILE_NAME
+
+logger = logging.getLogger(__name__)
+
+PROC = '/proc'
+
+# Samples kept in the history
+HISTORY_SIZE = 120
+
+CLOCK_TICKS = os.sysconf(str('SC_CLK_TCK')) if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf(str('SC_PAGE_SIZE')) if hasattr(os, 'sysconf') else 4096
+
+# Totals over the process tree. fds and the io counters are None when we
+# may not read them, i.e. the server runs as another user.
+Sample = collections.namedtuple(
+    'Sample',
+    ['time', 'pid', 'processes', 'cpu_percent', 'rss', 'fds', 'threads', 'read_bytes', 'write_bytes']
+)
+
+
+def read_file(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8', 'replace')
+    except (IOError, OSError):
+        return None
+
+
+def read_pid_file(path):
+    """The pid in the first line of a pid file, None if there's none"""
+    content = read_file(path)
+    if not content:
+        return None
+    try:
+        return int(content.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_stat(content):
+    """
+    Returns (ppid, cpu_ticks, threads, rss_bytes) of /proc/PID/stat content
+    """
+    # The command name may contain spaces and parentheses
+    fields = content[content.rindex(')') + 2:].split()
+    return (
+        int(fields[1]),
+        int(fields[11]) + int(fields[12]),
+        int(fields[17]),
+        int(fields[21]) * PAGE_SIZE,
+    )
+
+
+def list_pids():
+    return [int(name) for name in os.listdir(PROC) if name.isdigit()]
+
+
+def list_children(pid):
+    """
+    Pids of the children of pid from /proc/PID/task/*/children, None if
+    the kernel doesn't provide those files
+    """
+    task_dir = os.path.join(PROC, str(pid), 'task')
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return []
+    children = []
+    for tid in tids:
+        content = read_file(os.path.join(task_dir, tid, 'children'))
+        if content is None:
+            if not os.path.exists(os.path.join(task_dir, tid)):
+                # The thread exited meanwhile
+                continue
+            return None
+        children.extend(int(child) for child in content.split())
+    return children
+
+
+def find_server_pid(home, scan=True):
+    """
+    The pid of the KA Lite server, from the pid file in home or else, with
+    scan, the first process running kalite start
+    """
+    pid = read_pid_file(os.path.join(home, PID_FILE_NAME))
+    if pid and os.path.exists(os.path.join(PROC, str(pid))):
+        return pid
+    if not scan:
+        return None
+    own = os.getpid()
+    for pid in list_pids():
+        if pid == own:
+            continue
+        cmdline = read_file(os.path.join(PROC, str(pid), 'cmdline'))
+        if not cmdline:
+            continue
+        args = cmdline.split('\0')
+        if any(os.path.basename(arg) in ('kalite', 'kalitectl.py') for arg in args) and 'start' in args:
+            return pid
+    return None
+
+
+class ProcessMonitor(object):
+    """
+    Samples the process tree of the server once per call to sample(). The
+    tree is followed through /proc/PID/task/*/children, so only the
+    processes in it are read. Without those files, one pass over
+    /proc/*/stat finds the children instead.
+
+    When no server is found, /proc isn't searched for one again until
+    reset(), e.g. when the server's status changes. Its pid file is still
+    checked on every sample.
+    """
+
+    def __init__(self, home, history_size=HISTORY_SIZE):
+        self.home = home
+        self.history = collections.deque(maxlen=history_size)
+        self._pid = None
+        # Whether /proc was searched for a server without a pid file
+        self._searched = False
+        # CPU ticks of the tree and time of the previous sample
+        self._last_ticks = None
+        self._last_time = None
+
+    def scan(self):
+        """{pid: (ppid, cpu_ticks, threads, rss_bytes)} of all processes"""
+        processes = {}
+        for pid in list_pids():
+            content = read_file(os.path.join(PROC, str(pid), 'stat'))
+            if content:
+                try:
+                    processes[pid] = parse_stat(content)
+                except (ValueError, IndexError):
+                    continue
+        return processes
+
+    def reset(self):
+        """Looks for the server again on the next sample"""
+        self._searched = False
+
+    def read_tree(self, root):
+        """
+        {pid: (ppid, cpu_ticks, threads, rss_bytes)} of root and its
+        descendants, None if the children can't be listed
+        """
+        processes = {}
+        pids = [root]
+        for pid in pids:
+            content = read_file(os.path.join(PROC, str(pid), 'stat'))
+            if not content:
+                continue
+            try:
+                processes[pid] = parse_stat(content)
+            except (ValueError, IndexError):
+                continue
+            children = list_children(pid)
+            if children is None:
+                return None
+            pids.extend(children)
+        return processes
+
+    def tree(self, root, processes):
+        children = collections.defaultdict(list)
+        for pid, stat in processes.items():
+            children[stat[0]].append(pid)
+        pids = [root]
+        for pid in pids:
+            pids.extend(children[pid])
+        return pids
+
+    def sample(self):
+        """
+        Blocking:
+        Adds a Sample of the server's tree to the history and returns it,
+        None if the server isn't running
+        """
+        if self._pid is None or not os.path.exists(os.path.join(PROC, str(self._pid))):
+            self._pid = find_server_pid(self.home, scan=not self._searched)
+            self._searched = True
+            self._last_ticks = None
+        if self._pid is None:
+            return None
+        processes = self.read_tree(self._pid)
+        if processes is None:
+            processes = self.scan()
+            pids = self.tree(self._pid, processes) if self._pid in processes else []
+        else:
+            pids = list(processes)
+        if self._pid not in processes:
+            self._pid = None
+            return None
+
+        now = time.time()
+        ticks = sum(processes[pid][1] for pid in pids)
+        cpu_percent = None
+        if self._last_ticks is not None and now > self._last_time:
+            # Children that exited take their ticks with them
+            cpu_percent = max(0, ticks - self._last_ticks) / CLOCK_TICKS / (now - self._last_time) * 100
+        self._last_ticks = ticks
+        self._last_time = now
+
+        fds = read_bytes = write_bytes = 0
+        for pid in pids:
+            try:
+                fds += len(os.listdir(os.path.join(PROC, str(pid), 'fd')))
+            except OSError:
+                fds = None
+                break
+        for pid in pids:
+            io = read_file(os.path.join(PROC, str(pid), 'io'))
+            if io is None:
+                read_bytes = write_bytes = None
+                break
+            counters = dict(line.split(': ') for line in io.splitlines() if ': ' in line)
+            read_bytes += int(counters.get('rchar', 0))
+            write_bytes += int(counters.get('wchar', 0))
+
+        sample = Sample(
+            time=now,
+            pid=self._pid,
+            processes=len(pids),
+            cpu_percent=cpu_percent,
+            rss=sum(processes[pid][3] for pid in pids),
+            fds=fds,
+            threads=sum(processes[pid][2] for pid in pids),
+            read_bytes=read_bytes,
+            write_bytes=write_bytes,
+        )
+        self.history.append(sample)
+        return sample
+
+    def series(self, field, count=None):
+        """Values of a Sample field over the history, oldest first"""
+        samples = list(self.history)[-count:] if count else self.history
+        return [getattr(sample, field) or 0 for sample in samples]
+
+    def rate(self, field):
+        """Per second change of a counter between the last two samples"""
+        if len(self.history) < 2:
+            return None
+        previous, last = self.history[-2], self.history[-1]
+        if getattr(previous, field) is None or getattr(last, field) is None or previous.pid != last.pid:
+            return None
+        return max(0, getattr(last, field) - getattr(previous, field)) / (last.time - previous.time)
+
+
+def format_bytes(value):
+    for unit in ('B', 'KB', 'MB'):
+        if value < 1024:
+            return "{:.0f} {}".format(value, unit)
+        value /= 1024
+    return "{:.1f} GB".format(value)
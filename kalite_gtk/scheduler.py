@@ -0,0 +1,54 @@
+"""
+When to check the server's status next
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+# Seconds between checks while a start, stop or restart is running
+BUSY_INTERVAL = 1
+
+# Seconds between checks right after the status changed, doubling every
+# time it didn't up to MAX_INTERVAL
+MIN_INTERVAL = 2
+MAX_INTERVAL = 5 * 60
+
+
+class Backoff(object):
+    """
+    Exponential backoff of status checks: fast while something is going
+    on, ever slower while the status stays the same.
+    """
+
+    def __init__(self, minimum=MIN_INTERVAL, maximum=MAX_INTERVAL, busy_interval=BUSY_INTERVAL, factor=2):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.busy_interval = busy_interval
+        self.factor = factor
+        self.interval = minimum
+        # Commands in progress, they may overlap
+        self.busy = 0
+
+    def next_interval(self):
+        """Seconds until the next check"""
+        if self.busy:
+            return self.busy_interval
+        return self.interval
+
+    def update(self, changed):
+        """Called with whether the status changed at the last check"""
+        if changed or self.busy:
+            self.interval = self.minimum
+        else:
+            self.interval = min(self.maximum, self.interval * self.factor)
+
+    def reset(self):
+        self.interval = self.minimum
+
+    def begin_busy(self):
+        self.busy += 1
+
+    def end_busy(self):
+        self.busy = max(0, self.busy - 1)
+        # Whatever was done likely changes the status some more
+        self.reset()
@@ -0,0 +1,236 @@
+"""
+Search tab: finds lines in the log buffers or in server.log by text,
+level and time
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import re
+import threading
+import time
+
+from gi.repository import GLib, GObject, Gtk
+
+from .logindex import LineIndex
+from .logsearch import LEVELS, LineList, Query, SearchIndex
+from .serverlog import TIME_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Matches shown, the search stops there
+MAX_RESULTS = 10000
+
+# Matches are handed to the main loop in batches of this size, or after
+# this many seconds, whichever comes first
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.1
+
+# Sources that can be searched, the buffers are looked up by name on the
+# main window
+SOURCE_LOG = 'log'
+SOURCE_DIAGNOSTICS = 'diagnostics'
+SOURCE_SERVER_LOG = 'server.log'
+SOURCES = (
+    (SOURCE_LOG, "Log"),
+    (SOURCE_DIAGNOSTICS, "Diagnostics"),
+    (SOURCE_SERVER_LOG, "server.log"),
+)
+
+
+def parse_time(text):
+    """Returns a datetime for text in one of TIME_FORMATS, None if empty"""
+    text = text.strip()
+    if not text:
+        return None
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, time_format)
+        except ValueError:
+            continue
+    raise ValueError("Use the format YYYY-MM-DD HH:MM:SS")
+
+
+class SearchPage(object):
+    """
+    Runs searches in a worker thread and streams the matches into a list.
+    server.log keeps its line index and search index between searches, so
+    searching it again only looks at what was appended. The buffers are
+    copied when a search starts.
+    """
+
+    def __init__(self, get_buffer, get_server_log, on_activate=None):
+        """
+        :param: get_buffer: returns the Gtk.TextBuffer of a source name
+        :param: get_server_log: returns the path of server.log
+        :param: on_activate: called with (source, line_number) when a
+            result is activated
+        """
+        self.get_buffer = get_buffer
+        self.get_server_log = get_server_log
+        self.on_activate = on_activate
+        self.line_index = None
+        self.server_log_search = None
+        self.current_search = None
+        # Searches of the server.log index must not overlap
+        self.server_log_lock = threading.Lock()
+        # Results of older searches are dropped
+        self.generation = 0
+        self.result_count = 0
+        self.result_source = None
+
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        self.widget.set_border_width(10)
+
+        controls = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(controls, False, True, 0)
+        self.entry = Gtk.SearchEntry()
+        self.entry.connect('activate', self.on_search)
+        controls.pack_start(self.entry, True, True, 0)
+        self.regex_button = Gtk.CheckButton(label="Regular expression")
+        controls.pack_start(self.regex_button, False, False, 0)
+        self.case_button = Gtk.CheckButton(label="Match case")
+        controls.pack_start(self.case_button, False, False, 0)
+        search_button = Gtk.Button(label="Search")
+        search_button.connect('clicked', self.on_search)
+        controls.pack_start(search_button, False, False, 0)
+
+        filters = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(filters, False, True, 0)
+        self.source_combo = Gtk.ComboBoxText()
+        for source, label in SOURCES:
+            self.source_combo.append(source, label)
+        self.source_combo.set_active_id(SOURCE_SERVER_LOG)
+        filters.pack_start(self.source_combo, False, False, 0)
+        self.level_combo = Gtk.ComboBoxText()
+        self.level_combo.append('', "All levels")
+        for name, level in LEVELS[1:]:
+            self.level_combo.append(str(level), "{} and above".format(name))
+        self.level_combo.set_active_id('')
+        filters.pack_start(self.level_combo, False, False, 0)
+        filters.pack_start(Gtk.Label(label="Since"), False, False, 0)
+        self.since_entry = Gtk.Entry()
+        self.since_entry.set_placeholder_text("YYYY-MM-DD HH:MM:SS")
+        self.since_entry.connect('activate', self.on_search)
+        filters.pack_start(self.since_entry, False, False, 0)
+        filters.pack_start(Gtk.Label(label="Until"), False, False, 0)
+        self.until_entry = Gtk.Entry()
+        self.until_entry.set_placeholder_text("YYYY-MM-DD HH:MM:SS")
+        self.until_entry.connect('activate', self.on_search)
+        filters.pack_start(self.until_entry, False, False, 0)
+        self.status_label = Gtk.Label()
+        filters.pack_end(self.status_label, False, False, 0)
+
+        # Line number and text of the matches
+        self.results = Gtk.ListStore(GObject.TYPE_INT, GObject.TYPE_STRING)
+        treeview = Gtk.TreeView(model=self.results)
+        treeview.append_column(Gtk.TreeViewColumn("Line", Gtk.CellRendererText(), text=0))
+        treeview.append_column(Gtk.TreeViewColumn("Text", Gtk.CellRendererText(), text=1))
+        treeview.connect('row-activated', self.on_row_activated)
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.set_shadow_type(Gtk.ShadowType.IN)
+        scrolled.add(treeview)
+        self.widget.pack_start(scrolled, True, True, 0)
+
+    def get_query(self):
+        level = self.level_combo.get_active_id()
+        return Query(
+            text=self.entry.get_text(),
+            regex=self.regex_button.get_active(),
+            ignore_case=not self.case_button.get_active(),
+            min_level=int(level) if level else None,
+            since=parse_time(self.since_entry.get_text()),
+            until=parse_time(self.until_entry.get_text()),
+        )
+
+    def on_search(self, widget):
+        try:
+            query = self.get_query()
+        except (ValueError, re.error) as e:
+            self.status_label.set_label(str(e))
+            return
+        self.cancel()
+        self.generation += 1
+        self.results.clear()
+        self.result_count = 0
+        self.result_source = self.source_combo.get_active_id()
+        self.status_label.set_label("Searching...")
+
+        if self.result_source == SOURCE_SERVER_LOG:
+            path = self.get_server_log()
+            if self.line_index is None or self.line_index.path != path:
+                if self.line_index is not None:
+                    self.line_index.close()
+                self.line_index = LineIndex(path)
+                self.server_log_search = SearchIndex(self.line_index)
+            target = self.search_server_log
+            search_index = self.server_log_search
+        else:
+            buffer = self.get_buffer(self.result_source)
+            text = buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
+            target = self.search
+            search_index = SearchIndex(LineList(text))
+
+        self.current_search = search_index
+        thread = threading.Thread(target=target, args=(search_index, query, self.generation))
+        thread.daemon = True
+        thread.start()
+
+    def cancel(self):
+        if self.current_search is not None:
+            self.current_search.cancel()
+        if self.line_index is not None:
+            self.line_index.cancel()
+
+    def search_server_log(self, search_index, query, generation):
+        """Runs in a worker thread"""
+        with self.server_log_lock:
+            if generation != self.generation:
+                return
+            search_index.source.build()
+            self.search(search_index, query, generation)
+
+    def search(self, search_index, query, generation):
+        """Runs in a worker thread, reports back through idle callbacks"""
+        batch = []
+        last_batch = time.time()
+        count = 0
+        for number, line in search_index.search(query):
+            if generation != self.generation:
+                return
+            batch.append((number + 1, line.rstrip('\n')))
+            count += 1
+            if len(batch) >= BATCH_SIZE or time.time() - last_batch > BATCH_INTERVAL:
+                GLib.idle_add(self.add_results, generation, batch)
+                batch = []
+                last_batch = time.time()
+            if count >= MAX_RESULTS:
+                break
+        GLib.idle_add(self.add_results, generation, batch, True, len(search_index.levels))
+
+    def add_results(self, generation, batch, done=False, scanned=0):
+        if generation != self.generation:
+            return False
+        for row in batch:
+            self.results.append(row)
+        self.result_count += len(batch)
+        if done:
+            label = "{} matches in {} lines".format(self.result_count, scanned)
+            if self.result_count >= MAX_RESULTS:
+                label = "First {} matches".format(MAX_RESULTS)
+            self.status_label.set_label(label)
+        else:
+            self.status_label.set_label("Searching... {} matches".format(self.result_count))
+        return False
+
+    def on_row_activated(self, treeview, path, column):
+        if self.on_activate:
+            self.on_activate(self.result_source, self.results[path][0] - 1)
+
+    def close(self):
+        self.cancel()
+        if self.line_index is not None:
+            self.line_index.close()
+            self.line_index = None
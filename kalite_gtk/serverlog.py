@@ -0,0 +1,277 @@
+"""
+Server log tab: follows server.log in KALITE_HOME as it's written, or
+browses the whole file page by page
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import logging
+import threading
+
+from gi.repository import Gio, GLib, Gtk
+
+from .logindex import LineIndex
+from .logsink import LogSink
+from .logtail import LogTailer
+
+logger = logging.getLogger(__name__)
+
+# Lines of server.log kept in the view
+WINDOW_LINES = 5000
+
+# Seconds between checks when the file can't be monitored with inotify
+POLL_INTERVAL = 2
+
+# Lines shown at a time when browsing the whole file
+PAGE_LINES = 200
+
+# Accepted formats for jumping to a point in time
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d')
+
+
+def make_textview(style=None):
+    """A read-only text view in a scrolled window"""
+    textview = Gtk.TextView()
+    textview.set_editable(False)
+    textview.set_left_margin(10)
+    textview.set_right_margin(10)
+    if style:
+        style(textview)
+    scrolled = Gtk.ScrolledWindow()
+    scrolled.set_shadow_type(Gtk.ShadowType.IN)
+    scrolled.add(textview)
+    return textview, scrolled
+
+
+class LogBrowser(object):
+    """
+    Shows any page of a log file of any size. The file is memory-mapped and
+    its lines are indexed by a worker thread, only the PAGE_LINES lines on
+    screen are ever decoded.
+    """
+
+    def __init__(self, style=None):
+        self.index = None
+        self.first_line = 0
+        self.building = False
+
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=6)
+        controls = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(controls, False, True, 0)
+
+        previous_button = Gtk.Button(label="Previous")
+        previous_button.connect('clicked', lambda button: self.show_page(self.first_line - PAGE_LINES))
+        controls.pack_start(previous_button, False, False, 0)
+        next_button = Gtk.Button(label="Next")
+        next_button.connect('clicked', lambda button: self.show_page(self.first_line + PAGE_LINES))
+        controls.pack_start(next_button, False, False, 0)
+
+        controls.pack_start(Gtk.Label(label="Line"), False, False, 0)
+        self.line_spinbutton = Gtk.SpinButton.new_with_range(1, 1, PAGE_LINES)
+        self.line_spinbutton.connect('activate', self.on_line_activate)
+        controls.pack_start(self.line_spinbutton, False, False, 0)
+
+        controls.pack_start(Gtk.Label(label="Time"), False, False, 0)
+        self.time_entry = Gtk.Entry()
+        self.time_entry.set_placeholder_text("YYYY-MM-DD HH:MM:SS")
+        self.time_entry.connect('activate', self.on_time_activate)
+        controls.pack_start(self.time_entry, False, False, 0)
+
+        self.status_label = Gtk.Label()
+        controls.pack_end(self.status_label, False, False, 0)
+
+        self.textview, scrolled = make_textview(style)
+        self.widget.pack_start(scrolled, True, True, 0)
+
+    def open(self, path, first_line=None):
+        """Browses path, at first_line once it's indexed if given"""
+        if self.index is not None and self.index.path == path:
+            if first_line is not None:
+                self.first_line = first_line
+            self.update()
+            return
+        if self.index is not None:
+            self.index.close()
+        self.index = LineIndex(path)
+        self.first_line = first_line or 0
+        self.update()
+
+    def update(self):
+        """Indexes whatever was appended to the file, in the background"""
+        if self.building:
+            return
+        self.building = True
+        self.status_label.set_label("Indexing...")
+        thread = threading.Thread(target=self.build, args=(self.index,))
+        thread.daemon = True
+        thread.start()
+
+    def build(self, index):
+        """Runs in a worker thread, reports back through idle callbacks"""
+        try:
+            index.build(lambda count: GLib.idle_add(self.on_progress, index, count))
+        except Exception:
+            logger.exception("Indexing {} failed".format(index.path))
+        finally:
+            # Always, or building would stay set
+            GLib.idle_add(self.on_indexed, index, len(index))
+
+    def on_progress(self, index, count):
+        if index is not self.index:
+            return
+        self.status_label.set_label("Indexing... {} lines".format(count))
+        self.line_spinbutton.set_range(1, max(count, 1))
+        # Something to look at while the rest is indexed, once the page to
+        # show is
+        if self.textview.get_buffer().get_char_count() == 0 and self.first_line + PAGE_LINES <= count:
+            self.show_page(self.first_line)
+
+    def on_indexed(self, index, count):
+        self.building = False
+        if index is not self.index:
+            # Another file was opened while this one was indexed
+            if self.index is not None:
+                self.update()
+            return
+        self.status_label.set_label("{} lines".format(count))
+        self.line_spinbutton.set_range(1, max(count, 1))
+        self.show_page(self.first_line)
+
+    def show_page(self, first_line):
+        count = len(self.index)
+        first_line = max(0, min(first_line, count - PAGE_LINES))
+        self.first_line = first_line
+        self.textview.get_buffer().set_text(''.join(self.index.get_lines(first_line, PAGE_LINES)))
+        self.line_spinbutton.set_value(first_line + 1)
+
+    def on_line_activate(self, spinbutton):
+        spinbutton.update()
+        self.show_page(spinbutton.get_value_as_int() - 1)
+
+    def on_time_activate(self, entry):
+        text = entry.get_text().strip()
+        for time_format in TIME_FORMATS:
+            try:
+                when = datetime.datetime.strptime(text, time_format)
+                break
+            except ValueError:
+                continue
+        else:
+            self.status_label.set_label("Use the format YYYY-MM-DD HH:MM:SS")
+            return
+        self.show_page(self.index.find_timestamp(when))
+
+    def close(self):
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+class ServerLogPage(object):
+    """
+    Notebook page showing the tail of server.log. Only the appended bytes
+    are read when the file changes, and only the last WINDOW_LINES lines are
+    kept.
+    """
+
+    def __init__(self, style=None):
+        self.tailer = None
+        self.monitor = None
+        self.poll_source = None
+        # Functions that are also given the text read, e.g. for metrics
+        self.readers = []
+        # Line to browse at once the browser is open, see show_line
+        self.browse_line = None
+
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        header = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
+        self.widget.pack_start(header, False, True, 10)
+        self.path_label = Gtk.Label(label="server.log")
+        header.pack_start(self.path_label, True, True, 0)
+        self.browse_button = Gtk.ToggleButton(label="Browse whole log")
+        self.browse_button.connect('toggled', self.on_browse_toggled)
+        header.pack_end(self.browse_button, False, False, 10)
+
+        self.textview, self.follow_view = make_textview(style)
+        self.buffer = self.textview.get_buffer()
+        self.widget.pack_start(self.follow_view, True, True, 0)
+
+        self.browser = LogBrowser(style)
+        self.browser.widget.set_no_show_all(True)
+        self.widget.pack_start(self.browser.widget, True, True, 0)
+
+        self.sink = LogSink(self.buffer, max_lines=WINDOW_LINES)
+        # Stays at the end when text is inserted there
+        self.end_mark = self.buffer.create_mark('end', self.buffer.get_end_iter(), False)
+        self.buffer.connect('changed', self.on_buffer_changed)
+
+    def on_buffer_changed(self, buffer):
+        # Keep following the end of the log
+        self.textview.scroll_mark_onscreen(self.end_mark)
+
+    def on_browse_toggled(self, button):
+        if button.get_active():
+            self.follow_view.hide()
+            self.browser.widget.set_no_show_all(False)
+            self.browser.widget.show_all()
+            self.browser.open(self.tailer.path, first_line=self.browse_line)
+            self.browse_line = None
+        else:
+            self.browser.widget.hide()
+            self.follow_view.show()
+
+    def show_line(self, path, number):
+        """Browses the whole log at line number"""
+        if not self.is_started():
+            self.start(path)
+        if self.browse_button.get_active():
+            # Shown once what was appended meanwhile is indexed
+            self.browser.open(path, first_line=number)
+        else:
+            # Opens the browser, which shows the line once indexed
+            self.browse_line = number
+            self.browse_button.set_active(True)
+
+    def is_started(self):
+        return self.tailer is not None
+
+    def start(self, path):
+        """Starts following path, stops following any other file"""
+        self.stop()
+        self.path_label.set_label(path)
+        self.sink.clear()
+        self.tailer = LogTailer(path)
+        self.read()
+        try:
+            self.monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.NONE, None)
+            self.monitor.connect('changed', self.on_file_changed)
+        except GLib.Error as e:
+            logger.info("Can't monitor {}, polling instead: {}".format(path, e.message))
+            self.monitor = None
+            self.poll_source = GLib.timeout_add_seconds(POLL_INTERVAL, self.read)
+
+    def stop(self):
+        if self.monitor is not None:
+            self.monitor.cancel()
+            self.monitor = None
+        if self.poll_source is not None:
+            GLib.source_remove(self.poll_source)
+            self.poll_source = None
+        if self.tailer is not None:
+            self.tailer.close()
+            self.tailer = None
+        self.browser.close()
+
+    def on_file_changed(self, monitor, file, other_file, event_type):
+        self.read()
+
+    def read(self):
+        text = self.tailer.read()
+        if text:
+            self.sink.write(text)
+            for reader in self.readers:
+                reader(text)
+        # Keep polling if used as a timeout
+        return True
@@ -0,0 +1,74 @@
+"""
+Reloads the settings when their files are edited by someone else: another
+instance of the GUI, the init script or an admin
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+
+from gi.repository import Gio, GLib
+
+from . import cli
+
+logger = logging.getLogger(__name__)
+
+# Milliseconds to wait for more events before re-reading a file, an editor
+# saving a file causes several
+SETTLE_DELAY = 200
+
+# Facts of the environment that depend on each file in /etc/ka-lite
+ENVIRONMENT_FILES = (
+    (cli.DEBIAN_USERNAME_FILE, ('debian_username', 'default_user', 'default_port', 'default_home')),
+    (cli.DEBIAN_OPTIONS_FILE, ('debian_port', 'default_port')),
+)
+
+
+class SettingsWatcher(object):
+    """
+    Monitors the settings file and the files in /etc/ka-lite. Only the file
+    that changed is read again, and on_change is called with the settings
+    that changed and their new values.
+    """
+
+    def __init__(self, settings, on_change):
+        self.settings = settings
+        self.on_change = on_change
+        self.monitors = []
+        # Pending reloads by path
+        self.timeouts = {}
+
+        self.watch(settings.path, settings.reload_file)
+        for path, names in ENVIRONMENT_FILES:
+            self.watch(path, lambda names=names: settings.reload_environment(*names))
+
+    def watch(self, path, reload):
+        try:
+            monitor = Gio.File.new_for_path(path).monitor_file(Gio.FileMonitorFlags.NONE, None)
+        except GLib.Error as e:
+            logger.info("Can't monitor {}: {}".format(path, e.message))
+            return
+        monitor.connect('changed', self.on_file_changed, path, reload)
+        self.monitors.append(monitor)
+
+    def on_file_changed(self, monitor, file, other_file, event_type, path, reload):
+        if path in self.timeouts:
+            GLib.source_remove(self.timeouts[path])
+        self.timeouts[path] = GLib.timeout_add(SETTLE_DELAY, self.reload, path, reload)
+
+    def reload(self, path, reload):
+        del self.timeouts[path]
+        changed = reload()
+        if changed:
+            logger.info("{} changed: {}".format(path, changed))
+            self.on_change(changed)
+        return False
+
+    def stop(self):
+        for monitor in self.monitors:
+            monitor.cancel()
+        self.monitors = []
+        for source in self.timeouts.values():
+            GLib.source_remove(source)
+        self.timeouts = {}
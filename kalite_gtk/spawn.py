@@ -0,0 +1,226 @@
+"""
+Subprocesses driven by the GTK main loop
+
+Instead of a thread blocking on a pipe, the child is spawned with
+GLib.spawn_async and its pipes and exit status are watched from the main
+loop, so callbacks run on the main thread and may touch widgets directly.
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import codecs
+import json
+import logging
+import os
+import socket
+import threading
+
+from gi.repository import GLib
+
+from . import trace
+
+logger = logging.getLogger(__name__)
+
+READ_SIZE = 4096
+
+
+def _to_str(arg):
+    if isinstance(arg, bytes):
+        return arg.decode('utf-8')
+    return arg
+
+
+class ChildProcess(object):
+    """
+    Runs cmd and calls callback(stdout, stderr, returncode) with the same
+    values as cli.stream_kalite_command yields: once for every line of
+    stdout, and finally once with stdout=None, all of stderr and the exit
+    code.
+    """
+
+    def __init__(self, cmd, callback, env=None):
+        self.callback = callback
+        self.returncode = None
+        self._stdout_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._stderr_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._stdout_partial = ''
+        self._stderr = []
+        self._open_pipes = 2
+        self._exited = False
+
+        kwargs = {}
+        if env is not None:
+            # Some versions of PyGObject refuse envp=None, leave it out to
+            # inherit our environment
+            kwargs['envp'] = ['{}={}'.format(k, v) for k, v in env.items()]
+        logger.debug("Spawning command: {}".format(cmd))
+        self._timing = trace.span('spawn_kalite_command', cmd=cmd).begin()
+        self.pid, __, stdout_fd, stderr_fd = GLib.spawn_async(
+            [_to_str(arg) for arg in cmd],
+            flags=GLib.SpawnFlags.DO_NOT_REAP_CHILD | GLib.SpawnFlags.SEARCH_PATH,
+            standard_output=True,
+            standard_error=True,
+            **kwargs
+        )
+        self._watch(stdout_fd, self._on_stdout)
+        self._watch(stderr_fd, self._on_stderr)
+        GLib.child_watch_add(GLib.PRIORITY_DEFAULT, self.pid, self._on_exit)
+
+    def _watch(self, fd, func):
+        channel = GLib.IOChannel.unix_new(fd)
+        GLib.io_add_watch(
+            channel,
+            GLib.PRIORITY_DEFAULT,
+            GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+            lambda source, condition: self._on_readable(fd, func),
+        )
+
+    def _on_readable(self, fd, func):
+        try:
+            data = os.read(fd, READ_SIZE)
+        except OSError:
+            data = b''
+        func(data)
+        if data:
+            return True
+        os.close(fd)
+        self._open_pipes -= 1
+        self._maybe_finish()
+        return False
+
+    def _on_stdout(self, data):
+        text = self._stdout_decoder.decode(data, final=not data)
+        lines = (self._stdout_partial + text).split('\n')
+        self._stdout_partial = lines.pop()
+        for line in lines:
+            self.callback(line + '\n', None, None)
+        if not data and self._stdout_partial:
+            self.callback(self._stdout_partial, None, None)
+            self._stdout_partial = ''
+
+    def _on_stderr(self, data):
+        self._stderr.append(self._stderr_decoder.decode(data, final=not data))
+
+    def _on_exit(self, pid, status):
+        GLib.spawn_close_pid(pid)
+        if os.WIFEXITED(status):
+            self.returncode = os.WEXITSTATUS(status)
+        else:
+            self.returncode = -os.WTERMSIG(status)
+        self._exited = True
+        self._maybe_finish()
+
+    def _maybe_finish(self):
+        # Only report once every byte has been read and the child is reaped
+        if self._exited and not self._open_pipes:
+            self._timing.end(returncode=self.returncode)
+            self.callback(None, ''.join(self._stderr), self.returncode)
+
+
+def spawn_kalite_command(cmd, callback, env=None):
+    """
+    Non-blocking:
+    Starts cmd and returns the ChildProcess, output is passed to callback
+    from the main loop.
+
+    Example:
+
+    def on_output(stdout, stderr, returncode):
+        if stdout:
+            print(stdout)
+
+    spawn_kalite_command(cli.start_command(), on_output, env=cli.get_env())
+    """
+    try:
+        return ChildProcess(cmd, callback, env=env)
+    except GLib.Error as e:
+        message = e.message
+    logger.error("Could not run {}: {}".format(cmd, message))
+    # Report through the callback like any other failure, but never before
+    # the caller has returned
+    GLib.idle_add(lambda: callback(None, message + '\n', 127) and False)
+    return None
+
+
+def spawn_daemon_command(client, command, callback, args=None):
+    """
+    Non-blocking:
+    Like spawn_kalite_command, but the command is run by the control helper
+    of daemon.DaemonClient client. Returns False if the helper isn't
+    running.
+    """
+    sock = client.request(command, args=args)
+    if sock is None:
+        return False
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    partial = ['']
+    timing = trace.span('spawn_daemon_command', command=command).begin()
+
+    def fail(message):
+        sock.close()
+        timing.end(returncode=1)
+        callback(None, message, 1)
+        return False
+
+    def on_readable(source, condition):
+        try:
+            data = sock.recv(READ_SIZE)
+        except socket.error as e:
+            logger.error("Lost connection to the control helper: {}".format(e))
+            return fail("Lost connection to the control helper: {}\n".format(e))
+        lines = (partial[0] + decoder.decode(data, final=not data)).split('\n')
+        partial[0] = lines.pop()
+        for line in lines:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                logger.error("Garbled answer from the control helper: {!r}".format(line))
+                return fail("Garbled answer from the control helper\n")
+            if 'returncode' in message:
+                timing.end(returncode=message['returncode'])
+                callback(None, message.get('stderr'), message['returncode'])
+                sock.close()
+                return False
+            callback(message.get('stdout'), None, None)
+        if not data:
+            # The helper went away without an exit code
+            return fail("Lost connection to the control helper\n")
+        return True
+
+    GLib.io_add_watch(
+        GLib.IOChannel.unix_new(sock.fileno()),
+        GLib.PRIORITY_DEFAULT,
+        GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+        on_readable,
+    )
+    return True
+
+
+def spawn_broker_command(client, operations, callback):
+    """
+    Non-blocking:
+    Like spawn_kalite_command, but a batch of operations is performed by
+    the privileged helper of broker.BrokerClient client, in a worker
+    thread. The output of every operation is passed to callback once the
+    batch is done, the exit code is that of the last operation performed.
+    """
+    timing = trace.span('spawn_broker_command', ops=[operation['op'] for operation in operations]).begin()
+
+    def report(results):
+        for result in results:
+            for line in result['stdout'].splitlines(True):
+                callback(line, None, None)
+        returncode = results[-1]['returncode'] if results else 0
+        if returncode == 0 and len(results) < len(operations):
+            returncode = 1
+        timing.end(returncode=returncode)
+        callback(None, ''.join(result['stderr'] for result in results), returncode)
+        return False
+
+    def perform():
+        GLib.idle_add(report, client.run(operations))
+
+    thread = threading.Thread(target=perform)
+    thread.daemon = True
+    thread.start()
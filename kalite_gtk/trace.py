@@ -0,0 +1,114 @@
+"""
+Timing instrumentation exported as Chrome trace events
+
+Spans record wall and CPU time around interesting operations. Nothing is
+recorded until enable() is called, so instrumented code pays almost
+nothing in normal use. Open the written file in chrome://tracing or
+https://ui.perfetto.dev
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import logging
+import os
+import threading
+import time
+
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Per thread CPU time where available (Python 3.7+)
+cpu_time = getattr(time, 'thread_time', None) or getattr(time, 'process_time', None) or time.clock
+
+_enabled = False
+_events = []
+_lock = threading.Lock()
+_epoch = time.time()
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def record(name, wall_start, wall_end, cpu=None, cat='kalite_gtk', **args):
+    """Adds a complete event for something timed elsewhere"""
+    if not _enabled:
+        return
+    if cpu is not None:
+        args['cpu_ms'] = round(cpu * 1000, 3)
+    event = {
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': int((wall_start - _epoch) * 1e6),
+        'dur': int((wall_end - wall_start) * 1e6),
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+        'args': args,
+    }
+    with _lock:
+        _events.append(event)
+
+
+class span(object):
+    """
+    Times a block, a function or, with begin() and end(), anything that
+    finishes in a later callback.
+
+    with span('load glade', file=glade_file):
+        ...
+
+    @span('status')
+    def status():
+        ...
+    """
+
+    def __init__(self, name, cat='kalite_gtk', **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self._wall = None
+        self._cpu = None
+
+    def begin(self):
+        if _enabled:
+            self._wall = time.time()
+            self._cpu = cpu_time()
+        return self
+
+    def end(self, **args):
+        if self._wall is None:
+            return
+        self.args.update(args)
+        record(self.name, self._wall, time.time(), cpu=cpu_time() - self._cpu, cat=self.cat, **self.args)
+        self._wall = None
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, *exc_info):
+        self.end()
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with span(self.name, cat=self.cat, **self.args):
+                return func(*args, **kwargs)
+        return timed
+
+
+def write_chrome_trace(path):
+    with _lock:
+        events = list(_events)
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, default=str)
+    logger.info("Wrote {} trace events to {}".format(len(events), path))
@@ -0,0 +1,40 @@
+"""
+Links to the server's URLs in the status bar
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from gi.repository import Gtk
+
+
+class UrlList(object):
+    """
+    A column of link buttons. set_urls only touches the rows that differ
+    from what's shown, so repeating the same URLs costs nothing.
+    """
+
+    def __init__(self):
+        self.widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.urls = []
+        self.buttons = []
+
+    def set_urls(self, urls):
+        """Must be called from the main loop"""
+        if urls == self.urls:
+            return
+        for row, url in enumerate(urls):
+            if row < len(self.buttons):
+                if self.urls[row] != url:
+                    self.buttons[row].set_uri(url)
+                    self.buttons[row].set_label(url)
+                continue
+            button = Gtk.LinkButton(url, url)
+            button.set_alignment(0.0, 0.5)
+            self.widget.pack_start(button, False, False, 0)
+            button.show()
+            self.buttons.append(button)
+        for button in self.buttons[len(urls):]:
+            self.widget.remove(button)
+        del self.buttons[len(urls):]
+        self.urls = list(urls)
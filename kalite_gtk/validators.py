@@ -3,9 +3,14 @@ from __future__ import unicode_literals
 
 import os
 import pwd
+import threading
+import time
 
 from .exceptions import ValidationError
 
+# Seconds a validation result is reused, user accounts and files may change
+VALIDATION_TTL = 30
+
 
 def validator(func):
     """
@@ -47,3 +52,37 @@ def command(p):
     if not os.path.isfile(p):
         raise ValidationError("No such file: {}".format(p))
     return p
+
+
+class ValidationCache(object):
+    """
+    Remembers the outcome of validators by setting and value for a short
+    while. Validators may block, e.g. getpwnam on LDAP, so this is meant to
+    be used from worker threads.
+    """
+
+    def __init__(self, validators, ttl=VALIDATION_TTL):
+        self.validators = validators
+        self.ttl = ttl
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def validate(self, setting, value):
+        """
+        Returns (cleaned value, None) or (None, error message)
+        """
+        key = (setting, value)
+        now = time.time()
+        with self._lock:
+            if key in self._results and now - self._results[key][0] < self.ttl:
+                return self._results[key][1]
+        try:
+            result = self.validators[setting](value), None
+        except ValidationError as e:
+            result = None, e.err_msg
+        with self._lock:
+            # Drop what's expired so typing doesn't grow the cache forever
+            for expired in [k for k, (checked, __) in self._results.items() if now - checked >= self.ttl]:
+                del self._results[expired]
+            self._results[key] = (now, result)
+        return result
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stand-in for the 'kalite' command used by the benchmarks
+
+The amount and pace of output is set through environment variables:
+
+FAKE_KALITE_STDOUT_LINES  lines written to stdout (default 0)
+FAKE_KALITE_STDERR_LINES  lines written to stderr (default 0)
+FAKE_KALITE_LINE_LENGTH   characters per line (default 80)
+FAKE_KALITE_RATE          lines per second, 0 for as fast as possible
+FAKE_KALITE_RETURNCODE    exit code (default 0)
+
+'status' writes a 'kalite status' style message to stderr.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+
+def main(args):
+    stdout_lines = int(os.environ.get('FAKE_KALITE_STDOUT_LINES', 0))
+    stderr_lines = int(os.environ.get('FAKE_KALITE_STDERR_LINES', 0))
+    line_length = int(os.environ.get('FAKE_KALITE_LINE_LENGTH', 80))
+    rate = float(os.environ.get('FAKE_KALITE_RATE', 0))
+    returncode = int(os.environ.get('FAKE_KALITE_RETURNCODE', 0))
+
+    if args[:1] == ['status']:
+        sys.stderr.write("KA Lite running on:\n\nhttp://127.0.0.1:8008/\nhttp://192.168.0.2:8008/\n")
+
+    line = 'x' * (line_length - 1) + '\n'
+    # Interleave both streams, like a real server writing logs to both
+    for i in range(max(stdout_lines, stderr_lines)):
+        if i < stdout_lines:
+            sys.stdout.write(line)
+        if i < stderr_lines:
+            sys.stderr.write(line)
+        if rate:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            time.sleep(1.0 / rate)
+    return returncode
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
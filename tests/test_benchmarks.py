@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmarks
+----------------------------------
+
+Benchmarks for the `kalite_gtk.cli` layer, run against tests/fake_kalite.py
+instead of a real KA Lite installation.
+
+They only run when KALITE_GTK_BENCHMARK is set. Results are written as
+JSON to KALITE_GTK_BENCHMARK_JSON (default kalite_gtk_benchmarks.json in
+the temporary directory). If KALITE_GTK_BENCHMARK_BASELINE names an
+earlier results file, a benchmark fails when its best time is more than
+KALITE_GTK_BENCHMARK_TOLERANCE (default 1.5) times the baseline.
+
+    $ make benchmark
+"""
+
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import timeit
+import unittest
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from kalite_gtk import cli
+from kalite_gtk import validators
+
+FAKE_KALITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_kalite.py')
+
+ENABLED = bool(os.environ.get('KALITE_GTK_BENCHMARK'))
+RESULTS_FILE = os.environ.get(
+    'KALITE_GTK_BENCHMARK_JSON', os.path.join(tempfile.gettempdir(), 'kalite_gtk_benchmarks.json'))
+BASELINE_FILE = os.environ.get('KALITE_GTK_BENCHMARK_BASELINE')
+TOLERANCE = float(os.environ.get('KALITE_GTK_BENCHMARK_TOLERANCE', 1.5))
+
+# Output volume of the fake kalite command
+LINES = 20000
+LINE_LENGTH = 80
+
+
+def peak_memory(func):
+    """Peak bytes allocated by Python while running func"""
+    if tracemalloc is None:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@unittest.skipUnless(ENABLED, "Set KALITE_GTK_BENCHMARK to run the benchmarks")
+class TestBenchmarks(unittest.TestCase):
+
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp()
+        # settings['command'] is a single executable, so wrap the script
+        cls.command = os.path.join(cls.tmpdir, 'kalite')
+        with open(cls.command, 'w') as f:
+            f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_KALITE))
+        os.chmod(cls.command, os.stat(cls.command).st_mode | stat.S_IEXEC)
+        cls.saved_settings = dict(cli.settings)
+        cli.settings['command'] = cls.command
+        cli.settings['home'] = cls.tmpdir
+        cls.saved_environ = os.environ.copy()
+        cls.baseline = {}
+        if BASELINE_FILE:
+            with open(BASELINE_FILE) as f:
+                cls.baseline = json.load(f)
+
+    @classmethod
+    def tearDownClass(cls):
+        cli.settings.update(cls.saved_settings)
+        os.environ.clear()
+        os.environ.update(cls.saved_environ)
+        shutil.rmtree(cls.tmpdir)
+        with open(RESULTS_FILE, 'w') as f:
+            json.dump(cls.results, f, indent=2, sort_keys=True)
+
+    def setUp(self):
+        os.environ.update({
+            'FAKE_KALITE_STDOUT_LINES': '0',
+            'FAKE_KALITE_STDERR_LINES': '0',
+            'FAKE_KALITE_LINE_LENGTH': str(LINE_LENGTH),
+            'FAKE_KALITE_RATE': '0',
+        })
+
+    def benchmark(self, name, func, repeat=3, number=1, output_bytes=None):
+        times = [t / number for t in timeit.repeat(func, repeat=repeat, number=number)]
+        result = {
+            'best_s': min(times),
+            'mean_s': sum(times) / len(times),
+            'runs': repeat * number,
+            'peak_python_bytes': peak_memory(func),
+        }
+        if output_bytes:
+            result['throughput_bytes_per_s'] = output_bytes / min(times)
+        self.results[name] = result
+        if name in self.baseline:
+            limit = self.baseline[name]['best_s'] * TOLERANCE
+            self.assertLessEqual(
+                result['best_s'], limit,
+                "{} regressed: {:.4f}s, baseline {:.4f}s".format(name, result['best_s'], self.baseline[name]['best_s'])
+            )
+        return result
+
+    def test_run_kalite_command(self):
+        os.environ['FAKE_KALITE_STDOUT_LINES'] = str(LINES)
+        os.environ['FAKE_KALITE_STDERR_LINES'] = str(LINES)
+        self.benchmark(
+            'run_kalite_command',
+            lambda: cli.run_kalite_command(cli.get_command('start')),
+            output_bytes=2 * LINES * LINE_LENGTH,
+        )
+
+    def test_stream_kalite_command(self):
+        os.environ['FAKE_KALITE_STDOUT_LINES'] = str(LINES)
+        os.environ['FAKE_KALITE_STDERR_LINES'] = str(LINES)
+
+        def stream():
+            for stdout, stderr, returncode in cli.stream_kalite_command(cli.get_command('start')):
+                pass
+            self.assertEqual(returncode, 0)
+
+        self.benchmark('stream_kalite_command', stream, output_bytes=2 * LINES * LINE_LENGTH)
+
+    def test_stream_kalite_command_first_line_latency(self):
+        # A slow trickle of output should reach us line by line
+        os.environ['FAKE_KALITE_STDOUT_LINES'] = '5'
+        os.environ['FAKE_KALITE_RATE'] = '10'
+
+        def first_line():
+            started = time.time()
+            stream = cli.stream_kalite_command(cli.get_command('start'))
+            next(stream)
+            latency = time.time() - started
+            for __ in stream:
+                pass
+            return latency
+
+        latencies = [first_line() for __ in range(3)]
+        # Should be well before the whole half second the command takes,
+        # recorded rather than asserted as it depends on the machine's load
+        self.results['stream_kalite_command_first_line'] = {
+            'best_s': min(latencies),
+            'mean_s': sum(latencies) / len(latencies),
+            'runs': len(latencies),
+        }
+
+    def test_status_subprocess(self):
+        self.benchmark('status_subprocess', cli.status_subprocess)
+
+    def test_get_urls_from_status(self):
+        msg = "KA Lite running on:\n\n" + "\n".join(
+            "http://10.0.{}.{}:8008/".format(i // 256, i % 256) for i in range(1000)
+        )
+        self.benchmark(
+            'get_urls_from_status',
+            lambda: cli.get_urls_from_status(msg, 0),
+            repeat=5, number=20,
+        )
+
+    def test_settings_load_save(self):
+        settings = cli.Settings(cli.environment, path=os.path.join(self.tmpdir, 'ka-lite-gtk.json'))
+        settings.save()
+        self.benchmark('settings_load', settings.load, repeat=5, number=20)
+        self.benchmark('settings_save', settings.save, repeat=5, number=20)
+
+    def test_validators(self):
+        user = cli.settings['user']
+
+        def validate():
+            validators.username(user)
+            validators.port(8008)
+            validators.command(self.command)
+
+        self.benchmark('validators', validate, repeat=5, number=100)
+
+if __name__ == '__main__':
+    unittest.main()
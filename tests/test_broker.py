@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_broker
+----------------------------------
+
+Tests for `kalite_gtk.broker` module.
+"""
+
+import io
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from kalite_gtk import broker
+
+
+class TestBroker(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.options_file = os.path.join(self.tmpdir, 'server_options')
+        self.home_file = os.path.join(self.tmpdir, 'home')
+        self.broker = broker.Broker(options_file=self.options_file, home_file=self.home_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_vet(self):
+        self.assertEqual(
+            broker.vet({'op': 'write_server_options', 'content': ' --port=8008  --foo '}),
+            {'op': 'write_server_options', 'content': '--port=8008 --foo'},
+        )
+        refused = [
+            {'op': 'rm'},
+            {'op': 'write_server_options', 'content': '--port=8008; rm -rf /'},
+            {'op': 'write_server_options', 'content': '--port=$(id)'},
+            {'op': 'write_home', 'home': 'relative/home'},
+            {'op': 'write_home', 'home': '/home/x\n/etc'},
+            {'op': 'kalite', 'command': 'manage', 'user': 'nobody', 'home': '/tmp', 'kalite': '/bin/true'},
+            {'op': 'kalite', 'command': 'start', 'user': 'root', 'home': '/tmp', 'kalite': '/bin/true'},
+        ]
+        for operation in refused:
+            self.assertRaises(broker.VettingError, broker.vet, operation)
+
+    def test_batch(self):
+        response = self.broker.respond({'operations': [
+            {'op': 'write_server_options', 'content': '--port=8009'},
+            {'op': 'write_home', 'home': '/var/lib/ka-lite/.kalite'},
+        ]})
+        self.assertEqual([result['returncode'] for result in response['results']], [0, 0])
+        with open(self.options_file) as f:
+            self.assertEqual(f.read(), '--port=8009\n')
+        with open(self.home_file) as f:
+            self.assertEqual(f.read(), '/var/lib/ka-lite/.kalite\n')
+
+    def test_write_keeps_mode(self):
+        with open(self.options_file, 'w') as f:
+            f.write('--port=8008\n')
+        os.chmod(self.options_file, 0o644)
+        self.broker.respond({'operations': [
+            {'op': 'write_server_options', 'content': '--port=8009'},
+            {'op': 'write_home', 'home': '/var/lib/ka-lite/.kalite'},
+        ]})
+        self.assertEqual(stat.S_IMODE(os.stat(self.options_file).st_mode), 0o644)
+        # New files are readable by the kalite user too
+        self.assertEqual(stat.S_IMODE(os.stat(self.home_file).st_mode), 0o644)
+
+    def test_refused_batch_runs_nothing(self):
+        response = self.broker.respond({'operations': [
+            {'op': 'write_server_options', 'content': '--port=8009'},
+            {'op': 'write_home', 'home': 'nowhere'},
+        ]})
+        self.assertIn('error', response)
+        self.assertFalse(os.path.exists(self.options_file))
+
+    def test_batch_stops_at_failure(self):
+        # Its directory is a file
+        blocker = os.path.join(self.tmpdir, 'blocker')
+        open(blocker, 'w').close()
+        self.broker.files['write_server_options'] = os.path.join(blocker, 'server_options')
+        response = self.broker.respond({'operations': [
+            {'op': 'write_server_options', 'content': '--port=8009'},
+            {'op': 'write_home', 'home': '/var/lib/ka-lite/.kalite'},
+        ]})
+        self.assertEqual(len(response['results']), 1)
+        self.assertNotEqual(response['results'][0]['returncode'], 0)
+        self.assertFalse(os.path.exists(self.home_file))
+
+    def test_serve(self):
+        stdin = io.BytesIO(b'not json\n' + json.dumps({'operations': []}).encode('utf-8') + b'\n')
+        stdout = io.BytesIO()
+        self.broker.serve(stdin, stdout)
+        responses = [json.loads(line) for line in stdout.getvalue().decode('utf-8').splitlines()]
+        self.assertEqual(responses, [{'error': 'Invalid request'}, {'results': []}])
+
+    def test_client(self):
+        client = broker.BrokerClient(cmd=[sys.executable, '-m', 'kalite_gtk.broker'])
+        try:
+            self.assertEqual(client.run([]), [])
+            self.assertTrue(client.is_running())
+            results = client.run([{'op': 'write_home', 'home': 'nowhere'}])
+            self.assertEqual(results[0]['returncode'], 1)
+            # Still the same helper
+            self.assertTrue(client.is_running())
+        finally:
+            client.close()
+        self.assertFalse(client.is_running())
+
+    def test_client_not_authorized(self):
+        client = broker.BrokerClient(cmd=[sys.executable, '-c', 'import sys; sys.exit(126)'])
+        results = client.run([])
+        self.assertEqual(results[0]['returncode'], 126)
+        self.assertFalse(client.is_running())
+
+    def test_client_failures_are_results(self):
+        client = broker.BrokerClient(cmd=[os.path.join(self.tmpdir, 'missing')])
+        self.assertEqual(client.run([])[0]['returncode'], 127)
+        client = broker.BrokerClient(cmd=[sys.executable, '-c', 'print("garbled")'])
+        self.assertEqual(client.run([])[0]['returncode'], 1)
+        self.assertFalse(client.is_running())
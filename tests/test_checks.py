@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_checks
+----------------------------------
+
+Tests for `kalite_gtk.checks` module.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from kalite_gtk import checks
+
+
+def slow_check(options):
+    time.sleep(2)
+    return "done", checks.OK
+
+
+def failing_check(options):
+    raise ValueError("broken")
+
+
+class TestChecks(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.home, 'database'))
+        with open(os.path.join(self.home, 'database', 'data.sqlite'), 'wb') as f:
+            f.write(b'\0' * 2048)
+        self.options = {
+            'command': sys.executable,
+            'port': 1,
+            'home': self.home,
+            'content_root': os.path.join(self.home, 'content'),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def test_run_checks(self):
+        started = time.time()
+        results = {result.name: result for result in checks.run_checks(self.options)}
+        self.assertLess(time.time() - started, 2)
+        self.assertEqual(set(results), set(name for name, __, __ in checks.CHECKS))
+        self.assertEqual(results["KA Lite command"].severity, checks.OK)
+        self.assertEqual(results["Database"].value, "data.sqlite 2 KB")
+        self.assertEqual(results["Server port"].severity, checks.WARNING)
+
+    def test_timeout_and_errors(self):
+        started = time.time()
+        results = list(checks.run_checks(self.options, checks=(
+            ("Slow", slow_check, 0.2),
+            ("Failing", failing_check, 1),
+        )))
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(
+            [(result.name, result.value, result.severity) for result in results],
+            [("Failing", "broken", checks.ERROR), ("Slow", "Timed out", None)]
+        )
+
+    def test_running_check_isnt_started_again(self):
+        slow = (("Slower", slow_check, 0.1),)
+        self.assertEqual([result.value for result in checks.run_checks(self.options, checks=slow)],
+                         ["Timed out"])
+        self.assertEqual([result.value for result in checks.run_checks(self.options, checks=slow)],
+                         ["Still running"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_cli
+----------------------------------
+
+Tests for `kalite_gtk.cli` module.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from kalite_gtk import cli
+
+from .test_probe import QuietHandler
+
+try:
+    from http.server import HTTPServer
+except ImportError:
+    from BaseHTTPServer import HTTPServer
+
+
+class TestStreamKaliteCommand(unittest.TestCase):
+
+    def test_noisy_stderr_does_not_block(self):
+        # Far more stderr than fits in a pipe buffer before stdout closes
+        cmd = ['sh', '-c', 'echo a; for i in $(seq 20000); do echo noise >&2; done; echo b; exit 3']
+        events = list(cli.stream_kalite_command(cmd))
+        self.assertEqual(events[:2], [('a\n', None, None), ('b\n', None, None)])
+        stdout, stderr, returncode = events[-1]
+        self.assertIsNone(stdout)
+        self.assertEqual(stderr.count('noise\n'), 20000)
+        self.assertEqual(returncode, 3)
+
+    def test_exit_event(self):
+        events = list(cli.iter_kalite_command(['sh', '-c', 'printf out; printf err >&2']))
+        self.assertIn((cli.STDOUT, 'out'), events)
+        self.assertIn((cli.STDERR, 'err'), events)
+        stream, (returncode, wall_time) = events[-1]
+        self.assertEqual(stream, cli.EXIT)
+        self.assertEqual(returncode, 0)
+        self.assertGreaterEqual(wall_time, 0)
+
+    def test_closed_early(self):
+        events = cli.iter_kalite_command(['sh', '-c', 'echo $$; exec sleep 60'])
+        stream, chunk = next(events)
+        events.close()
+        # Killed and reaped, not left a zombie
+        self.assertRaises(OSError, os.kill, int(chunk), 0)
+
+class TestGetUrlsFromStatus(unittest.TestCase):
+
+    def test_urls(self):
+        msg = "Running\nKA Lite running on:\n\nhttp://127.0.0.1:8008/\nhttp://10.0.0.2:8008/\n"
+        self.assertEqual(
+            cli.get_urls_from_status(msg, cli.STATUS_RUNNING),
+            ['http://127.0.0.1:8008/', 'http://10.0.0.2:8008/']
+        )
+        self.assertEqual(cli.get_urls_from_status("Stopped", cli.STATUS_STOPPED), [])
+
+
+class TestStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = HTTPServer(('127.0.0.1', 0), QuietHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.command = os.path.join(self.tmpdir, 'kalite')
+        with open(self.command, 'w') as f:
+            f.write('#!/bin/sh\necho "Running in $KALITE_HOME" >&2\n')
+        os.chmod(self.command, 0o755)
+
+    def tearDown(self):
+        # The probe keeps its connection to the server open
+        cli._probe.close()
+        cli._running_status_cache.clear()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_cache_by_port_and_home(self):
+        port = self.server.server_address[1]
+        for home in ('/srv/en', '/srv/fr'):
+            options = {'port': port, 'home': home, 'command': self.command}
+            self.assertEqual(cli.status(options), ("Running in {}\n".format(home), cli.STATUS_RUNNING))
+
+
+class TestGetGtkPath(unittest.TestCase):
+
+    def setUp(self):
+        saved = os.environ.get('KALITE_HOME')
+        if saved is not None:
+            self.addCleanup(os.environ.__setitem__, 'KALITE_HOME', saved)
+            del os.environ['KALITE_HOME']
+        else:
+            self.addCleanup(os.environ.pop, 'KALITE_HOME', None)
+
+    def test_kalite_home_unset(self):
+        self.assertEqual(cli.get_gtk_path('kalite_gtk_log_scrollback.log'),
+                         os.path.expanduser('~/.kalite/kalite_gtk_log_scrollback.log'))
+
+    def test_kalite_home(self):
+        os.environ['KALITE_HOME'] = '/tmp/gui'
+        self.assertEqual(cli.get_gtk_path('cache.json'), '/tmp/gui/cache.json')
+
+    def test_by_home(self):
+        os.environ['KALITE_HOME'] = '/tmp/gui'
+        paths = set(cli.get_gtk_path('cache.json', home) for home in ('/srv/a', '/srv/b', '/srv/a'))
+        self.assertEqual(len(paths), 2)
+        for path in paths:
+            self.assertEqual(os.path.dirname(path), '/tmp/gui')
+            self.assertTrue(path.endswith('.json'))
+
+
+class TestSettings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'ka-lite-gtk.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lazy_load_and_reload(self):
+        settings = cli.Settings(cli.Environment(), path=self.path)
+        self.assertIsNone(settings._data)
+        with open(self.path, 'w') as f:
+            json.dump({'port': 9000, 'home': self.tmpdir}, f)
+        self.assertEqual(settings['port'], '9000')
+        self.assertEqual(settings['content_root'], os.path.join(self.tmpdir, 'content'))
+        with open(self.path, 'w') as f:
+            json.dump({'port': 9001}, f)
+        self.assertEqual(settings['port'], '9000')
+        settings.reload()
+        self.assertEqual(settings['port'], '9001')
+
+    def test_reload_file_diff(self):
+        settings = cli.Settings(cli.Environment(), path=self.path)
+        self.assertEqual(settings.reload_file(), {})
+        with open(self.path, 'w') as f:
+            json.dump({'port': 9000, 'home': self.tmpdir}, f)
+        self.assertEqual(settings['port'], '9000')
+        with open(self.path, 'w') as f:
+            json.dump({'port': 9001, 'home': self.tmpdir}, f)
+        self.assertEqual(settings.reload_file(), {'port': '9001'})
+        self.assertEqual(settings.reload_file(), {})
+        settings.environment._cache['default_port'] = 8009
+        self.assertEqual(settings.reload_environment('debian_port', 'default_port'), {})
+        # Probed again
+        self.assertEqual(settings.environment.default_port, 8008)
+
+    def test_save_only_changes(self):
+        settings = cli.Settings(cli.Environment(), path=self.path)
+        with open(self.path, 'w') as f:
+            json.dump({'port': 9000, 'home': self.tmpdir}, f)
+        self.assertTrue(settings.save())
+        mtime = os.stat(self.path).st_mtime
+        self.assertFalse(settings.save())
+        self.assertEqual(os.stat(self.path).st_mtime, mtime)
+        settings['port'] = '9001'
+        self.assertTrue(settings.save())
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)['port'], '9001')
+        # No temporary files are left behind
+        self.assertEqual(os.listdir(self.tmpdir), ['ka-lite-gtk.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_content
+----------------------------------
+
+Tests for `kalite_gtk.content` module.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kalite_gtk import content
+
+
+class TestContentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        saved = os.environ.get('KALITE_HOME')
+        self.addCleanup(os.environ.__setitem__ if saved else os.environ.pop, 'KALITE_HOME', saved)
+        os.environ['KALITE_HOME'] = self.tmpdir
+        self.root = os.path.join(self.tmpdir, 'content')
+        for directory in ('videos/a', 'videos/b', 'images'):
+            os.makedirs(os.path.join(self.root, directory))
+        self.write('videos/a/1.mp4', 1000)
+        self.write('videos/b/2.MP4', 500)
+        self.write('images/1.png', 10)
+        self.write('README', 5)
+        self.index_path = content.get_index_path(self.tmpdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relative, size):
+        with open(os.path.join(self.root, relative), 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_scan(self):
+        index = content.ContentIndex(self.root, self.index_path)
+        self.assertEqual(index.scan(), 5)
+        self.assertEqual(index.summary(), {'video': (2, 1500), 'image': (1, 10), 'other': (1, 5)})
+        index.save()
+
+        index = content.ContentIndex(self.root, self.index_path)
+        self.assertTrue(index.load())
+        # Nothing changed, nothing is listed
+        self.assertEqual(index.scan(), 0)
+        self.assertEqual(index.summary()['video'], (2, 1500))
+
+        # mtimes may have a coarse resolution
+        time.sleep(0.01)
+        os.remove(os.path.join(self.root, 'videos/b/2.MP4'))
+        shutil.rmtree(os.path.join(self.root, 'images'))
+        os.utime(os.path.join(self.root, 'videos/b'), (0, 0))
+        self.assertEqual(index.scan(), 2)
+        self.assertEqual(index.summary(), {'video': (1, 1000), 'other': (1, 5)})
+
+    def test_other_root(self):
+        content.ContentIndex(self.root, self.index_path).save()
+        self.assertFalse(content.ContentIndex(self.tmpdir, self.index_path).load())
+
+    def test_index_path_by_home(self):
+        # In our KALITE_HOME, not in the server's home
+        self.assertEqual(os.path.dirname(self.index_path), self.tmpdir)
+        self.assertNotEqual(self.index_path, content.get_index_path('/var/lib/ka-lite/.kalite'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_daemon
+----------------------------------
+
+Tests for `kalite_gtk.daemon` module.
+"""
+
+import getpass
+import json
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+from kalite_gtk import daemon
+
+FAKE_KALITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_kalite.py')
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.kalite = os.path.join(self.tmpdir, 'kalite')
+        with open(self.kalite, 'w') as f:
+            f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_KALITE))
+        os.chmod(self.kalite, os.stat(self.kalite).st_mode | stat.S_IEXEC)
+        self.options = {'port': 1, 'home': self.tmpdir, 'command': self.kalite}
+
+        self.client = daemon.DaemonClient(getpass.getuser(), self.kalite, self.tmpdir)
+        server = daemon.Daemon(self.client.socket_name, [], self.kalite, self.tmpdir)
+        self.thread = threading.Thread(target=server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        while not self.client.is_running():
+            pass
+
+    def tearDown(self):
+        self.client.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir)
+
+    def test_stream(self):
+        os.environ['FAKE_KALITE_STDOUT_LINES'] = '3'
+        try:
+            events = list(self.client.stream('start', args=['--port=1'], options=self.options))
+        finally:
+            del os.environ['FAKE_KALITE_STDOUT_LINES']
+        self.assertEqual(len(events), 4)
+        self.assertEqual(events[-1], (None, '', 0))
+
+    def test_status(self):
+        # Nothing listens on port 1 and there's no pid file
+        self.assertEqual(self.client.status(options=self.options), ('Stopped', 1))
+
+    def test_unknown_command(self):
+        events = list(self.client.stream('rm', options=self.options))
+        self.assertEqual(events[-1][2], 1)
+
+    def test_refuses_helper_of_other_user(self):
+        # As if another user had bound the socket name first
+        self.client.allowed_uids = set([os.getuid() + 1])
+        self.assertFalse(self.client.is_running())
+        self.assertEqual(list(self.client.stream('status', options=self.options)),
+                         [(None, "Control helper is not running\n", 1)])
+        self.client.allowed_uids = set([os.getuid()])
+
+    def send(self, request):
+        sock = self.client.connect()
+        try:
+            daemon.send_message(sock, request)
+            for line in sock.makefile('rb'):
+                message = json.loads(line.decode('utf-8'))
+                if 'returncode' in message:
+                    return message
+        finally:
+            sock.close()
+
+    def test_request_cant_choose_executable(self):
+        # The kalite of the helper's command line is run, not this one
+        reply = self.send({'command': 'stop', 'port': 1, 'kalite': '/bin/false', 'home': '/'})
+        self.assertEqual(reply['returncode'], 0)
+
+    def test_invalid_requests(self):
+        for request in (
+            {'command': 'stop'},
+            {'command': 'stop', 'port': 'x'},
+            {'command': 'start', 'port': 1, 'args': ['--port=1; rm -rf /']},
+            {'command': 'start', 'port': 1, 'args': '--port=1'},
+            ['start'],
+        ):
+            self.assertEqual(self.send(request)['returncode'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_diagnose
+----------------------------------
+
+Tests for `kalite_gtk.diagnose` module.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from kalite_gtk import diagnose
+
+
+REPORT = """Calculating diagnostics...
+
+-------------------------------------------------------------------
+KA Lite version:    0.16.9
+Python:             2.7.12
+Content:
+  Videos:           120
+  Exercises:        3000
+    missing 2 files
+-------------------------------------------------------------------
+"""
+
+
+class TestDiagnose(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        saved = os.environ.get('KALITE_HOME')
+        self.addCleanup(os.environ.__setitem__ if saved else os.environ.pop, 'KALITE_HOME', saved)
+        os.environ['KALITE_HOME'] = self.tmpdir
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parser(self):
+        parser = diagnose.DiagnoseParser()
+        kinds = [parser.feed(line) for line in REPORT.splitlines(True)]
+        self.assertEqual(kinds[3], (diagnose.ITEM, "KA Lite version", "0.16.9"))
+        self.assertEqual(kinds[5], (diagnose.SECTION, "Content", ""))
+        self.assertEqual([section['title'] for section in parser.sections], ["General", "Content"])
+        self.assertEqual(len(parser.sections[0]['items']), 3)
+        content = parser.sections[1]['items']
+        self.assertEqual([(item['key'], item['value']) for item in content],
+                         [("Videos", "120"), ("Exercises", "3000")])
+        self.assertEqual(content[1]['details'], ["missing 2 files"])
+
+    def test_cache(self):
+        path = diagnose.get_cache_path(self.tmpdir)
+        self.assertIsNone(diagnose.load_report(path))
+        options = {'home': self.tmpdir, 'port': 8008, 'command': 'kalite'}
+        diagnose.save_report(path, REPORT, 0, options)
+        report = diagnose.load_report(path)
+        self.assertEqual(report['output'], REPORT)
+        self.assertFalse(diagnose.is_stale(report, options))
+        self.assertTrue(diagnose.is_stale(report, dict(options, port=8009)))
+        report['time'] = time.time() - diagnose.MAX_AGE - 1
+        self.assertTrue(diagnose.is_stale(report, options))
+        self.assertTrue(os.path.isfile(path))
+
+    def test_cache_path_by_home(self):
+        # In our KALITE_HOME, not in the server's home
+        path = diagnose.get_cache_path('/var/lib/ka-lite/.kalite')
+        self.assertEqual(os.path.dirname(path), self.tmpdir)
+        self.assertNotEqual(path, diagnose.get_cache_path('/home/other/.kalite'))
+
+
+if __name__ == '__main__':
+    unittest.main()
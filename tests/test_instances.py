@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_instances
+----------------------------------
+
+Tests for `kalite_gtk.instances` module.
+"""
+
+import getpass
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+from kalite_gtk import instances
+from kalite_gtk.exceptions import ValidationError
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class TestInstances(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.registry = instances.InstanceRegistry(os.path.join(self.tmpdir, 'instances.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def instance(self, name, port):
+        home = os.path.join(self.tmpdir, name)
+        if not os.path.isdir(home):
+            os.mkdir(home)
+        return {'name': name, 'user': getpass.getuser(), 'home': home, 'port': port,
+                'command': sys.executable}
+
+    def test_add(self):
+        self.registry.add(self.instance('en', 8008))
+        self.assertRaises(ValidationError, self.registry.add, self.instance('en', 8009))
+        self.assertRaises(ValidationError, self.registry.add, self.instance('fr', 8008))
+        self.assertRaises(ValidationError, self.registry.add, dict(self.instance('fr', 8009), port='x'))
+        self.assertRaises(ValidationError, self.registry.add, dict(self.instance('fr', 8009), home='fr'))
+        self.registry.add(self.instance('fr', 8009))
+        self.assertEqual([instance['name'] for instance in self.registry], ['en', 'fr'])
+
+    def test_save_load(self):
+        self.registry.add(self.instance('en', 8008))
+        self.registry.save()
+        registry = instances.InstanceRegistry(self.registry.path)
+        registry.load()
+        self.assertEqual(registry.instances, self.registry.instances)
+        registry.remove('en')
+        self.assertEqual(len(registry), 0)
+
+    def test_check(self):
+        # Nothing listens on these ports, so every check is answered by
+        # the probe
+        for number in range(20):
+            self.registry.add(self.instance('i{}'.format(number), free_port()))
+        done = threading.Event()
+        results = {}
+
+        def callback(instance, result):
+            results[instance['name']] = result
+            if len(results) == len(self.registry):
+                done.set()
+
+        pool = instances.StatusPool(workers=4)
+        try:
+            self.assertEqual(pool.check(list(self.registry), callback), 20)
+            self.assertTrue(done.wait(10))
+        finally:
+            pool.close()
+        self.assertEqual(set(result for result in results.values()), set([('Stopped', 1)]))
+
+    def test_check_skips_pending(self):
+        pool = instances.StatusPool(workers=1)
+        instance = self.registry.add(self.instance('en', free_port()))
+        blocked = threading.Event()
+        pool.run(blocked.wait, (), None)
+        try:
+            self.assertEqual(pool.check([instance], lambda instance, result: None), 1)
+            # Still queued behind the blocked worker
+            self.assertEqual(pool.check([instance], lambda instance, result: None), 0)
+        finally:
+            blocked.set()
+            pool.close()
+
+    def test_control_command(self):
+        instance = self.registry.add(self.instance('en', 8008))
+        self.assertEqual(
+            instances.control_command('start', instance),
+            [sys.executable, 'start', '--port=8008'],
+        )
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_logindex
+----------------------------------
+
+Tests for `kalite_gtk.logindex` module.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from kalite_gtk import logindex
+from kalite_gtk.logindex import LineIndex, parse_timestamp
+
+
+class TestLineIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'server.log')
+        start = datetime.datetime(2016, 10, 18, 10, 0, 0)
+        with open(self.path, 'w') as f:
+            for i in range(1000):
+                f.write("{} INFO request {}\n".format(start + datetime.timedelta(seconds=i), i))
+                if i % 10 == 0:
+                    f.write("  traceback line without a timestamp\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lines(self):
+        index = LineIndex(self.path)
+        self.assertEqual(index.build(), 1100)
+        self.assertTrue(index.get_line(0).endswith("request 0\n"))
+        self.assertEqual(len(index.get_lines(1095, 10)), 5)
+        with open(self.path, 'a') as f:
+            f.write("appended\npartial")
+        self.assertEqual(index.build(), 1101)
+        self.assertEqual(index.get_line(1100), "appended\n")
+        index.close()
+
+    def test_find_timestamp(self):
+        index = LineIndex(self.path)
+        index.build()
+        number = index.find_timestamp(datetime.datetime(2016, 10, 18, 10, 5, 0))
+        self.assertTrue(index.get_line(number).endswith("request 300\n"))
+        self.assertEqual(index.find_timestamp(datetime.datetime(2000, 1, 1)), 0)
+        self.assertEqual(index.find_timestamp(datetime.datetime(2030, 1, 1)), 1100)
+        index.close()
+
+    def test_closed_while_building(self):
+        index = LineIndex(self.path)
+
+        def close(count):
+            index.close()
+            # As if close() came between the check of cancelled and find
+            index.cancelled = False
+
+        saved = logindex.PROGRESS_LINES
+        logindex.PROGRESS_LINES = 100
+        self.addCleanup(setattr, logindex, 'PROGRESS_LINES', saved)
+        self.assertEqual(index.build(close), 100)
+
+    def test_parse_timestamp(self):
+        self.assertEqual(
+            parse_timestamp('127.0.0.1 - - [18/Oct/2016:10:00:01] "GET / HTTP/1.1" 200 12'),
+            datetime.datetime(2016, 10, 18, 10, 0, 1)
+        )
+        self.assertIsNone(parse_timestamp('no time here'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_logsearch
+----------------------------------
+
+Tests for `kalite_gtk.logsearch` module.
+"""
+
+import datetime
+import logging
+import unittest
+
+from kalite_gtk.logsearch import LineList, Query, SearchIndex
+
+
+LOG = """2016-10-18 10:00:00,000 INFO Starting server
+2016-10-18 10:00:01,000 WARNING Disk almost full
+2016-10-18 10:00:02,000 ERROR Request failed
+Traceback (most recent call last):
+  ValueError: bad request
+2016-10-18 10:00:03,000 INFO request done
+"""
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def search(self, index, **kwargs):
+        return [number for number, __ in index.search(Query(**kwargs))]
+
+    def test_text(self):
+        index = SearchIndex(LineList(LOG))
+        self.assertEqual(self.search(index, text='request'), [2, 4, 5])
+        self.assertEqual(self.search(index, text='Request', ignore_case=False), [2])
+        self.assertEqual(self.search(index, text=r'Val\w+Error', regex=True), [4])
+
+    def test_filters(self):
+        index = SearchIndex(LineList(LOG))
+        # The traceback is part of the ERROR message
+        self.assertEqual(self.search(index, min_level=logging.ERROR), [2, 3, 4])
+        self.assertEqual(
+            self.search(index, since=datetime.datetime(2016, 10, 18, 10, 0, 1),
+                        until=datetime.datetime(2016, 10, 18, 10, 0, 2)),
+            [1, 2, 3, 4]
+        )
+
+    def test_incremental(self):
+        source = LineList(LOG)
+        index = SearchIndex(source)
+        self.assertEqual(self.search(index, text='request'), [2, 4, 5])
+        source.lines.append("2016-10-18 10:00:04,000 INFO another request\n")
+        self.assertEqual(self.search(index, text='request'), [2, 4, 5, 6])
+        # Stopping early doesn't lose or repeat matches
+        next(index.search(Query(text='Disk')))
+        self.assertEqual(self.search(index, text='Disk'), [1])
+
+    def test_source_replaced(self):
+        source = LineList(LOG)
+        index = SearchIndex(source)
+        self.assertEqual(self.search(index, text='Disk'), [1])
+        # Rotated, and the new file has grown past the old one
+        source.lines = ["2016-10-19 08:00:00,000 ERROR Disk full\n"] + source.lines[1:] + ["x\n"]
+        self.assertEqual(self.search(index, text='Disk', min_level=logging.ERROR), [0])
+        self.assertEqual(self.search(index, text='Disk'), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
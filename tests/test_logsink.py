@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_logsink
+----------------------------------
+
+Tests for `kalite_gtk.logsink` module, against a plain Python stand-in
+for the few Gtk.TextBuffer methods the sink uses.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from kalite_gtk.logsink import LogSink, TRIM_CHUNK, get_spill_logger
+
+
+class TextIter(object):
+
+    def __init__(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+
+    def starts_line(self):
+        return self.offset == 0 or self.buffer.text[self.offset - 1] == '\n'
+
+    def forward_line(self):
+        newline = self.buffer.text.find('\n', self.offset)
+        self.offset = len(self.buffer.text) if newline == -1 else newline + 1
+        return newline != -1
+
+    def compare(self, other):
+        return (self.offset > other.offset) - (self.offset < other.offset)
+
+
+class TextBuffer(object):
+
+    def __init__(self):
+        self.text = ''
+
+    def get_line_count(self):
+        return self.text.count('\n') + 1
+
+    def get_char_count(self):
+        return len(self.text)
+
+    def get_start_iter(self):
+        return TextIter(self, 0)
+
+    def get_end_iter(self):
+        return TextIter(self, len(self.text))
+
+    def get_iter_at_offset(self, offset):
+        return TextIter(self, offset)
+
+    def get_iter_at_line(self, line):
+        it = TextIter(self, 0)
+        for __ in range(line):
+            it.forward_line()
+        return it
+
+    def get_text(self, start, end, include_hidden_chars):
+        return self.text[start.offset:end.offset]
+
+    def insert(self, it, text):
+        self.text = self.text[:it.offset] + text + self.text[it.offset:]
+
+    def delete(self, start, end):
+        self.text = self.text[:start.offset] + self.text[end.offset:]
+
+    def set_text(self, text):
+        self.text = text
+
+
+class Spill(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def info(self, msg):
+        self.messages.append(msg)
+
+
+def lines(start, stop):
+    return ''.join("line {}\n".format(i) for i in range(start, stop))
+
+
+class TestLogSink(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = TextBuffer()
+
+    def flush(self, sink, text):
+        sink._pending.extend(text.splitlines(True))
+        while sink._flush():
+            pass
+
+    def test_flush_in_batches(self):
+        sink = LogSink(self.buffer, max_flush=10)
+        sink._pending.extend(lines(0, 25).splitlines(True))
+        self.assertTrue(sink._flush())
+        self.assertEqual(self.buffer.text, lines(0, 10))
+        self.assertTrue(sink._flush())
+        self.assertFalse(sink._flush())
+        self.assertEqual(self.buffer.text, lines(0, 25))
+
+    def test_dropped_messages_are_counted(self):
+        sink = LogSink(self.buffer, max_pending=5)
+        # As if a flush was already scheduled, so write() doesn't need GLib
+        sink._source_id = 1
+        for line in lines(0, 8).splitlines(True):
+            sink.write(line)
+        sink._flush()
+        self.assertEqual(self.buffer.text, "[... 3 lines dropped ...]\n" + lines(3, 8))
+
+    def test_no_limits(self):
+        sink = LogSink(self.buffer)
+        self.flush(sink, lines(0, 3 * TRIM_CHUNK))
+        self.assertEqual(self.buffer.text, lines(0, 3 * TRIM_CHUNK))
+
+    def test_trim_lines_in_chunks(self):
+        sink = LogSink(self.buffer, max_lines=100)
+        self.flush(sink, lines(0, 100 + TRIM_CHUNK - 1))
+        # Within a chunk of the limit, nothing is dropped yet
+        self.assertEqual(self.buffer.text, lines(0, 100 + TRIM_CHUNK - 1))
+        self.flush(sink, lines(100 + TRIM_CHUNK - 1, 100 + TRIM_CHUNK + 10))
+        self.assertEqual(self.buffer.text, lines(TRIM_CHUNK + 11, 100 + TRIM_CHUNK + 10))
+
+    def test_trim_chars_at_line_boundary(self):
+        sink = LogSink(self.buffer, max_chars=1000)
+        text = "x" * 99 + "\n"
+        # Exactly at the limit plus the slack of a chunk
+        count = (1000 + TRIM_CHUNK * 80) // len(text)
+        self.flush(sink, text * count)
+        self.assertEqual(self.buffer.text, text * count)
+        self.flush(sink, "a" * 49 + "\n")
+        # Cut after the line the limit falls in, so whole lines are left
+        self.assertEqual(self.buffer.text, text * 9 + "a" * 49 + "\n")
+
+    def test_stricter_limit_wins(self):
+        sink = LogSink(self.buffer, max_lines=1000, max_chars=100)
+        self.buffer.set_text(lines(0, 10 * TRIM_CHUNK))
+        sink.trim()
+        self.assertLessEqual(len(self.buffer.text), 100)
+        self.assertTrue(self.buffer.get_start_iter().starts_line())
+        self.assertTrue(self.buffer.text.endswith(lines(10 * TRIM_CHUNK - 1, 10 * TRIM_CHUNK)))
+
+    def test_spill_gets_trimmed_text(self):
+        spill = Spill()
+        sink = LogSink(self.buffer, max_lines=10, spill=spill)
+        self.flush(sink, lines(0, 20 + TRIM_CHUNK))
+        self.assertEqual(''.join(spill.messages) + self.buffer.text, lines(0, 20 + TRIM_CHUNK))
+        self.assertEqual(self.buffer.get_line_count(), 10)
+
+    def test_configure(self):
+        spill = Spill()
+        sink = LogSink(self.buffer)
+        self.flush(sink, lines(0, 20 + TRIM_CHUNK))
+        self.assertEqual(spill.messages, [])
+        sink.configure(max_lines=10, spill=spill)
+        self.flush(sink, lines(20 + TRIM_CHUNK, 21 + TRIM_CHUNK))
+        self.assertEqual(''.join(spill.messages), lines(0, 12 + TRIM_CHUNK))
+
+    def test_clear(self):
+        sink = LogSink(self.buffer)
+        self.flush(sink, lines(0, 10))
+        sink._pending.append("pending\n")
+        sink.clear()
+        self.assertFalse(sink._flush())
+        self.assertEqual(self.buffer.text, '')
+
+
+class TestSpillLogger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_writes_verbatim(self):
+        path = os.path.join(self.tmpdir, 'spill.log')
+        spill = get_spill_logger('test_writes_verbatim', path)
+        self.addCleanup(logging.getLogger('kalite_gtk.scrollback.test_writes_verbatim').handlers.pop)
+        spill.info(lines(0, 3))
+        spill.info(lines(3, 5))
+        for handler in spill.handlers:
+            handler.close()
+        with open(path) as f:
+            self.assertEqual(f.read(), lines(0, 5))
+        self.assertFalse(spill.propagate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_logtail
+----------------------------------
+
+Tests for `kalite_gtk.logtail` module.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from kalite_gtk.logtail import LogTailer
+
+
+class TestLogTailer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'server.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, text, mode='a'):
+        with open(self.path, mode) as f:
+            f.write(text)
+
+    def test_starts_near_the_end(self):
+        self.write(''.join('line {}\n'.format(i) for i in range(1000)))
+        tailer = LogTailer(self.path, initial_bytes=30)
+        text = tailer.read()
+        self.assertTrue(text.endswith('line 999\n'))
+        self.assertTrue(text.startswith('line '))
+        self.assertLess(len(text), 30)
+        self.assertEqual(tailer.read(), '')
+        self.write('appended\n')
+        self.assertEqual(tailer.read(), 'appended\n')
+        tailer.close()
+
+    def test_missing_file(self):
+        tailer = LogTailer(self.path)
+        self.assertEqual(tailer.read(), '')
+        self.write('created\n')
+        self.assertEqual(tailer.read(), 'created\n')
+        tailer.close()
+
+    def test_truncation(self):
+        self.write('first\nsecond\n')
+        tailer = LogTailer(self.path)
+        self.assertEqual(tailer.read(), 'first\nsecond\n')
+        self.write('new\n', mode='w')
+        self.assertEqual(tailer.read(), 'new\n')
+        tailer.close()
+
+    def test_rotation(self):
+        self.write('old\n')
+        tailer = LogTailer(self.path)
+        self.assertEqual(tailer.read(), 'old\n')
+        self.write('last words\n')
+        os.rename(self.path, self.path + '.1')
+        self.assertEqual(tailer.read(), 'last words\n')
+        self.write('fresh\n')
+        self.assertEqual(tailer.read(), 'fresh\n')
+        tailer.close()
+
+    def test_backlog_is_skipped(self):
+        self.write('start\n')
+        tailer = LogTailer(self.path, initial_bytes=20, max_backlog=100)
+        tailer.read()
+        self.write('x' * 200 + '\nend\n')
+        text = tailer.read()
+        self.assertTrue(text.startswith('[... skipped'))
+        self.assertTrue(text.endswith('end\n'))
+        tailer.close()
+
+if __name__ == '__main__':
+    unittest.main()
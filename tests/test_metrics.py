@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_metrics
+----------------------------------
+
+Tests for `kalite_gtk.metrics` module.
+"""
+
+import datetime
+import time
+import unittest
+
+from kalite_gtk.metrics import RequestMetrics, parse_access_line, sparkline
+
+
+def timestamp(second):
+    return time.mktime(datetime.datetime(2016, 10, 18, 10, 0, second).timetuple())
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_parse_access_line(self):
+        parsed = parse_access_line(
+            '127.0.0.1 - - [18/Oct/2016:10:00:05] "GET /learn/?q=1 HTTP/1.1" 200 1234 "-" "Mozilla/5.0 1.0" 12ms'
+        )
+        self.assertEqual(parsed, (timestamp(5), '/learn/', 200, 0.012))
+        parsed = parse_access_line('[18/Oct/2016 10:00:05] "POST /api/ HTTP/1.1" 500 -')
+        self.assertEqual(parsed, (timestamp(5), '/api/', 500, None))
+        self.assertIsNone(parse_access_line("2016-10-18 10:00:05,000 INFO Starting server"))
+
+    def test_aggregates(self):
+        metrics = RequestMetrics(window=10)
+        lines = []
+        for second in range(20):
+            status = 500 if second % 5 == 0 else 200
+            lines.append('[18/Oct/2016 10:00:{:02d}] "GET /p{} HTTP/1.1" {} 10 0.{:03d}'.format(
+                second, second % 2, status, second + 1))
+        text = '\n'.join(lines) + '\n'
+        # Split mid-line
+        metrics.feed(text[:50])
+        metrics.feed(text[50:])
+        snapshot = metrics.snapshot(now=timestamp(19))
+        self.assertEqual(snapshot['series'], [1] * 10)
+        self.assertEqual(snapshot['requests_per_second'], 1.0)
+        self.assertEqual(snapshot['error_rate'], 0.2)
+        self.assertEqual(snapshot['p50'], 0.011)
+        self.assertEqual(snapshot['p99'], 0.020)
+        self.assertEqual(snapshot['top_paths'][0][1], 10)
+        # Nothing in the window any more
+        self.assertEqual(metrics.snapshot(now=timestamp(40))['requests_per_second'], 0)
+
+    def test_sparkline(self):
+        self.assertEqual(sparkline([0, 4, 8]), '▁▅█')
+        self.assertEqual(sparkline([0, 0]), '▁▁')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_probe
+----------------------------------
+
+Tests for `kalite_gtk.probe` module.
+"""
+
+import socket
+import threading
+import unittest
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+
+from kalite_gtk.probe import HTTPProbe
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class TestHTTPProbe(unittest.TestCase):
+
+    def test_running_server(self):
+        server = HTTPServer(('127.0.0.1', 0), QuietHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        probe = HTTPProbe()
+        try:
+            port = server.server_address[1]
+            self.assertTrue(probe.check(port))
+            # Second check goes over the kept-alive connection
+            self.assertTrue(probe.check(port))
+        finally:
+            probe.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_nothing_listening(self):
+        self.assertIs(HTTPProbe().check(free_port()), False)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_procmon
+----------------------------------
+
+Tests for `kalite_gtk.procmon` module.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from kalite_gtk import procmon
+from kalite_gtk.procmon import ProcessMonitor, parse_stat
+
+
+@unittest.skipUnless(os.path.isdir('/proc/self'), "Needs /proc")
+class TestProcessMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def test_parse_stat(self):
+        content = "42 (a) b (c)) S 1 42 42 0 -1 0 0 0 0 0 7 3 0 0 20 0 5 0 100 1000 10 0 0\n"
+        ppid, ticks, threads, rss = parse_stat(content)
+        self.assertEqual((ppid, ticks, threads), (1, 10, 5))
+        self.assertEqual(rss, 10 * os.sysconf(str('SC_PAGE_SIZE')))
+
+    def test_sample(self):
+        monitor = ProcessMonitor(self.home)
+        self.assertIsNone(monitor.sample())
+
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+        try:
+            with open(os.path.join(self.home, 'kalite.pid'), 'w') as f:
+                f.write("{}\n8008\n".format(os.getpid()))
+            first = monitor.sample()
+            second = monitor.sample()
+        finally:
+            child.kill()
+            child.wait()
+        self.assertEqual(first.pid, os.getpid())
+        self.assertIsNone(first.cpu_percent)
+        self.assertGreaterEqual(second.cpu_percent, 0)
+        # Ourselves and the child
+        self.assertGreaterEqual(second.processes, 2)
+        self.assertGreater(second.rss, 0)
+        self.assertGreater(second.fds, 0)
+        self.assertEqual(len(monitor.series('rss')), 2)
+
+    def count_scans(self):
+        """Counts the calls of procmon.list_pids until the test ends"""
+        calls = []
+        list_pids = procmon.list_pids
+
+        def counting():
+            calls.append(1)
+            return list_pids()
+
+        procmon.list_pids = counting
+        self.addCleanup(setattr, procmon, 'list_pids', list_pids)
+        return calls
+
+    def test_no_server_isnt_searched_again(self):
+        monitor = ProcessMonitor(self.home)
+        self.assertIsNone(monitor.sample())
+        scans = self.count_scans()
+        self.assertIsNone(monitor.sample())
+        self.assertEqual(len(scans), 0)
+        monitor.reset()
+        monitor.sample()
+        self.assertEqual(len(scans), 1)
+
+    def test_tree_without_scan(self):
+        scans = self.count_scans()
+        child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+        try:
+            with open(os.path.join(self.home, 'kalite.pid'), 'w') as f:
+                f.write("{}\n".format(os.getpid()))
+            sample = ProcessMonitor(self.home).sample()
+        finally:
+            child.kill()
+            child.wait()
+        if procmon.list_children(os.getpid()) is not None:
+            self.assertEqual(len(scans), 0)
+        self.assertGreaterEqual(sample.processes, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduler
+----------------------------------
+
+Tests for `kalite_gtk.scheduler` module.
+"""
+
+import unittest
+
+from kalite_gtk.scheduler import Backoff
+
+
+class TestBackoff(unittest.TestCase):
+
+    def test_backoff(self):
+        backoff = Backoff(minimum=2, maximum=10, busy_interval=1)
+        intervals = []
+        for __ in range(5):
+            backoff.update(changed=False)
+            intervals.append(backoff.next_interval())
+        self.assertEqual(intervals, [4, 8, 10, 10, 10])
+        backoff.update(changed=True)
+        self.assertEqual(backoff.next_interval(), 2)
+
+    def test_busy(self):
+        backoff = Backoff(minimum=2, maximum=10, busy_interval=1)
+        backoff.update(changed=False)
+        backoff.begin_busy()
+        backoff.begin_busy()
+        backoff.update(changed=False)
+        self.assertEqual(backoff.next_interval(), 1)
+        backoff.end_busy()
+        self.assertEqual(backoff.next_interval(), 1)
+        backoff.end_busy()
+        self.assertEqual(backoff.next_interval(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
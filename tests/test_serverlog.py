@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_serverlog
+----------------------------------
+
+Tests for `kalite_gtk.serverlog` module, they need GTK and a display.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+try:
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import GLib, Gtk
+    HAS_DISPLAY = Gtk.init_check(None)[0]
+except (ImportError, ValueError):
+    HAS_DISPLAY = False
+
+
+@unittest.skipUnless(HAS_DISPLAY, "Needs GTK and a display")
+class TestServerLogPage(unittest.TestCase):
+
+    def setUp(self):
+        from kalite_gtk.serverlog import ServerLogPage
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'server.log')
+        with open(self.path, 'w') as f:
+            f.writelines("line {}\n".format(number) for number in range(1000))
+        self.page = ServerLogPage()
+
+    def tearDown(self):
+        self.page.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_show_line_opens_browser_at_line(self):
+        self.page.show_line(self.path, 300)
+        self.assertTrue(self.page.browse_button.get_active())
+        self.assertEqual(self.page.browser.first_line, 300)
+
+    def test_show_line_while_browsing(self):
+        self.page.show_line(self.path, 300)
+        self.page.show_line(self.path, 500)
+        self.assertEqual(self.page.browser.first_line, 500)
+
+
+@unittest.skipUnless(HAS_DISPLAY, "Needs GTK and a display")
+class TestLogBrowser(unittest.TestCase):
+
+    def setUp(self):
+        from kalite_gtk.serverlog import LogBrowser
+        self.tmpdir = tempfile.mkdtemp()
+        self.paths = []
+        for name, count in (('old.log', 200000), ('new.log', 10)):
+            path = os.path.join(self.tmpdir, name)
+            with open(path, 'w') as f:
+                f.writelines("line {}\n".format(number) for number in range(count))
+            self.paths.append(path)
+        self.browser = LogBrowser()
+
+    def tearDown(self):
+        self.browser.close()
+        shutil.rmtree(self.tmpdir)
+
+    def wait_indexed(self):
+        context = GLib.MainContext.default()
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            context.iteration(False)
+            if not self.browser.building and not context.pending():
+                return
+            time.sleep(0.01)
+        self.fail("Still indexing")
+
+    def test_open_while_building(self):
+        self.browser.open(self.paths[0])
+        self.assertTrue(self.browser.building)
+        self.browser.open(self.paths[1])
+        self.wait_indexed()
+        self.assertEqual(len(self.browser.index), 10)
+        self.assertEqual(self.browser.status_label.get_label(), "10 lines")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_spawn
+----------------------------------
+
+Tests for `kalite_gtk.spawn` module, they run a GLib main loop.
+"""
+
+import getpass
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from gi.repository import GLib
+except ImportError:
+    GLib = None
+
+FAKE_KALITE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_kalite.py')
+
+# Seconds before a test gives up on its callbacks
+TIMEOUT = 10
+
+
+class FakeDaemonClient(object):
+    """Answers requests over one end of a socket pair, the test has the other"""
+
+    def __init__(self):
+        self.sock, self.helper = socket.socketpair()
+
+    def request(self, command, args=None, options=None):
+        return self.sock
+
+
+class FakeBrokerClient(object):
+
+    def __init__(self, results):
+        self.results = results
+
+    def run(self, operations, keep_going=False):
+        return self.results
+
+
+@unittest.skipIf(GLib is None, "Needs GLib")
+class TestSpawn(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.loop = GLib.MainLoop()
+
+    def callback(self, stdout, stderr, returncode):
+        self.events.append((stdout, stderr, returncode))
+        if stdout is None:
+            self.loop.quit()
+
+    def run_loop(self):
+        timeout = GLib.timeout_add_seconds(TIMEOUT, self.loop.quit)
+        self.loop.run()
+        GLib.source_remove(timeout)
+        self.assertTrue(self.events and self.events[-1][0] is None, "No exit code")
+        return self.events
+
+    def test_output_and_exit_code(self):
+        from kalite_gtk.spawn import spawn_kalite_command
+        spawn_kalite_command(['sh', '-c', 'echo a; echo b; echo err >&2; printf c; exit 3'], self.callback)
+        self.assertEqual(self.run_loop(), [
+            ('a\n', None, None),
+            ('b\n', None, None),
+            ('c', None, None),
+            (None, 'err\n', 3),
+        ])
+
+    def test_env(self):
+        from kalite_gtk.spawn import spawn_kalite_command
+        env = {'PATH': os.environ['PATH'], 'KALITE_GTK_TEST': 'value'}
+        spawn_kalite_command(['sh', '-c', 'echo $KALITE_GTK_TEST'], self.callback, env=env)
+        self.assertEqual(self.run_loop(), [('value\n', None, None), (None, '', 0)])
+
+    def test_killed(self):
+        from kalite_gtk.spawn import spawn_kalite_command
+        spawn_kalite_command(['sh', '-c', 'kill -9 $$'], self.callback)
+        self.assertEqual(self.run_loop(), [(None, '', -9)])
+
+    def test_missing_executable(self):
+        from kalite_gtk.spawn import spawn_kalite_command
+        self.assertIsNone(spawn_kalite_command(['/nonexistent/kalite', 'start'], self.callback))
+        # Not before the caller has returned
+        self.assertEqual(self.events, [])
+        stdout, stderr, returncode = self.run_loop()[-1]
+        self.assertEqual(returncode, 127)
+        self.assertTrue(stderr)
+
+    def test_daemon_command(self):
+        from kalite_gtk import daemon
+        from kalite_gtk.spawn import spawn_daemon_command
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        kalite = os.path.join(tmpdir, 'kalite')
+        with open(kalite, 'w') as f:
+            f.write('#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, FAKE_KALITE))
+        os.chmod(kalite, os.stat(kalite).st_mode | stat.S_IEXEC)
+        client = daemon.DaemonClient(getpass.getuser(), kalite, tmpdir)
+        server = daemon.Daemon(client.socket_name, [], kalite, tmpdir)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        while not client.is_running():
+            pass
+        self.addCleanup(thread.join)
+        self.addCleanup(client.shutdown)
+
+        os.environ['FAKE_KALITE_STDOUT_LINES'] = '2'
+        self.addCleanup(os.environ.pop, 'FAKE_KALITE_STDOUT_LINES')
+        options = {'port': 1, 'home': tmpdir, 'command': kalite}
+        self.assertTrue(spawn_daemon_command(client, 'start', self.callback, args=['--port=1']))
+        events = self.run_loop()
+        self.assertEqual(len(events), 3)
+        self.assertEqual(events[-1], (None, '', 0))
+        self.assertEqual(client.status(options=options), ('Stopped', 1))
+
+    def test_daemon_not_running(self):
+        from kalite_gtk.spawn import spawn_daemon_command
+        client = FakeDaemonClient()
+        client.sock.close()
+        client.helper.close()
+        client.request = lambda command, args=None, options=None: None
+        self.assertFalse(spawn_daemon_command(client, 'start', self.callback))
+
+    def test_daemon_lost(self):
+        from kalite_gtk.spawn import spawn_daemon_command
+        client = FakeDaemonClient()
+        spawn_daemon_command(client, 'start', self.callback)
+        client.helper.sendall(b'{"stdout": "a\\n"}\n')
+        client.helper.close()
+        self.assertEqual(self.run_loop(), [
+            ('a\n', None, None),
+            (None, "Lost connection to the control helper\n", 1),
+        ])
+
+    def test_daemon_reset(self):
+        from kalite_gtk.spawn import spawn_daemon_command
+        client = FakeDaemonClient()
+        # The helper goes away without reading the request, the read fails
+        # with ECONNRESET
+        client.sock.sendall(b'{"command": "start"}\n')
+        spawn_daemon_command(client, 'start', self.callback)
+        client.helper.close()
+        stdout, stderr, returncode = self.run_loop()[-1]
+        self.assertEqual(returncode, 1)
+        self.assertTrue(stderr.startswith("Lost connection to the control helper"))
+
+    def test_daemon_garbled(self):
+        from kalite_gtk.spawn import spawn_daemon_command
+        client = FakeDaemonClient()
+        self.addCleanup(client.helper.close)
+        spawn_daemon_command(client, 'start', self.callback)
+        client.helper.sendall(b'not json\n')
+        self.assertEqual(self.run_loop(), [(None, "Garbled answer from the control helper\n", 1)])
+
+    def test_broker_command(self):
+        from kalite_gtk.spawn import spawn_broker_command
+        client = FakeBrokerClient([
+            {'op': 'write_server_options', 'stdout': '', 'stderr': '', 'returncode': 0},
+            {'op': 'kalite', 'stdout': 'a\nb\n', 'stderr': 'err\n', 'returncode': 0},
+        ])
+        spawn_broker_command(client, [{'op': 'write_server_options'}, {'op': 'kalite'}], self.callback)
+        self.assertEqual(self.run_loop(), [('a\n', None, None), ('b\n', None, None), (None, 'err\n', 0)])
+
+    def test_broker_batch_stopped(self):
+        from kalite_gtk.spawn import spawn_broker_command
+        # The first operation failed, the second wasn't performed
+        client = FakeBrokerClient([{'op': 'write_home', 'stdout': '', 'stderr': "Can't write\n", 'returncode': 1}])
+        spawn_broker_command(client, [{'op': 'write_home'}, {'op': 'kalite'}], self.callback)
+        self.assertEqual(self.run_loop(), [(None, "Can't write\n", 1)])
+
+    def test_broker_not_authorized(self):
+        from kalite_gtk.broker import failed
+        from kalite_gtk.spawn import spawn_broker_command
+        client = FakeBrokerClient(failed("Not authorized\n", 126))
+        spawn_broker_command(client, [{'op': 'write_home'}, {'op': 'kalite'}], self.callback)
+        self.assertEqual(self.run_loop(), [(None, "Not authorized\n", 126)])
+
+
+if __name__ == '__main__':
+    unittest.main()
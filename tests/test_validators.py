@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+"""
+test_validators
+----------------------------------
+
+Tests for `kalite_gtk.validators` module.
+"""
+
+import unittest
+
+from kalite_gtk.exceptions import ValidationError
+from kalite_gtk.validators import ValidationCache
+
+
+class TestValidationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+        def even(value):
+            self.calls.append(value)
+            if value % 2:
+                raise ValidationError("{} is odd".format(value))
+            return value // 2
+
+        self.cache = ValidationCache({'number': even}, ttl=60)
+
+    def test_memoized(self):
+        self.assertEqual(self.cache.validate('number', 4), (2, None))
+        self.assertEqual(self.cache.validate('number', 3), (None, "3 is odd"))
+        self.assertEqual(self.cache.validate('number', 4), (2, None))
+        self.assertEqual(self.cache.validate('number', 3), (None, "3 is odd"))
+        self.assertEqual(self.calls, [4, 3])
+
+    def test_expiry(self):
+        self.cache.ttl = 0
+        self.cache.validate('number', 4)
+        self.cache.validate('number', 4)
+        self.assertEqual(self.calls, [4, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()